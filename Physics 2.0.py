@@ -1,15 +1,20 @@
 from functools import reduce
 from operator import add
 from pygame.math import Vector2 as V2
-import pygame as pg, os
+import pygame as pg, os, time
 
-from src.display.tkinter_windows import create_menu
-from src.core import *
-from numpy.matlib import rand
+from src.display import overlay, render
+from src.core import constants
+from src.core.engine import Simulation
+from src.core.stepper import Stepper
+from src.display.telemetry import TelemetryServer
 import numpy as np
-import random
 
 
+def create_menu(*args):
+    from src.display.tkinter_windows import create_menu  # Tk is only loaded once the viewer opens its first window
+    return create_menu(*args)
+
 
 def init_display():
     pg.init()
@@ -22,52 +27,53 @@ def init_display():
     return screen, V2(dims)
 
 
-def refresh_display(settings_window, screen, bodies, cam):
+def refresh_display(settings_window, screen, bodies, cam, replay=None, profiler=None, selection=None):
     screen.fill(settings_window.bg_color)  # comment out this line for a fun time ;)
     if settings_window.walls.get():
         pg.draw.rect(screen, (0, 0, 0), pg.Rect(0, 0, *cam.dims), 3)
-    for b in bodies:
-        # Calculate coordinates and radius adjusted for camera
-        x, y = (b.position - cam.position - cam.dims / 2) * cam.scale + cam.dims / 2
-        b.update_radius()
-        try:
-            pg.draw.circle(screen, b.color, (np.int64(x), np.int64(y)), np.int64(b.radius * cam.scale), 0)
-        except:
-            pass
-        # The radius should be calculated in such a way that the camera can be zoomed indefinitely.
-        # Currently, the properties of an object can reach a distinct threshold, after which they become invisible.
+    if replay and len(replay.recording):
+        render.render_modes[settings_window.render_mode.get()](screen, replay.recording.store(replay.frame), cam)
+        replay.draw_bar(screen, cam.dims)
+    else:
+        render.render_modes[settings_window.render_mode.get()](screen, bodies, cam)
+        if selection:
+            selection.draw(screen, bodies, cam)
+    if profiler and profiler.enabled:
+        overlay.draw_profile(screen, profiler)
     pg.display.update()
 
 
-def update_windows(settings_window):
-    arr = [0, 0, [0] * 5]
+def update_windows(settings_window, diagnostics):
+    arr = [0, 0, [0] * 5 + ["Direct", .5, "Euler", 1, "NumPy"]]
     if settings_window.alive:
-        settings_window.update()
-        try:
-            arr = [settings_window.gravity_slider.get() / 100, settings_window.COR_slider.get(),
-                   [settings_window.time_slider.get() / 100,
-                    settings_window.collision.get(), settings_window.walls.get(), settings_window.g_field.get(),
-                    settings_window.gravity_on.get()]]
-        except:
-            pass
-    for window in settings_window.properties_windows:
+        settings_window.update(diagnostics)  # Only refreshes `window_refresh_rate` times a second, and keeps the last values
+        arr = settings_window.values
+    for body_id, window in list(settings_window.properties_windows.items()):
         if window.alive:
             window.update()
         else:
-            settings_window.properties_windows.remove(window)
+            del settings_window.properties_windows[body_id]
     return arr
 
 
+def to_world(camera, pos, dims):
+    return camera.position + (V2(pos) - dims / 2) / camera.scale + dims / 2
+
+
 def handle_mouse(*args):
-    settings_window, camera, event, bodies, dims, G, COR, scroll = args
-    if event.button == 1:
-        pos = camera.position + (pg.mouse.get_pos() - dims / 2) / camera.scale + dims / 2
-        for b in bodies:
-            if b.click_collision(pos) and b not in [win.body for win in settings_window.properties_windows]:
-                if not settings_window.alive:  # Respawn the main window if it is dead
-                    settings_window.__init__(bodies, camera, dims, [G, COR])  # This still does not fix all errors
-                settings_window.properties_windows.append(
-                    create_menu("BodyProperties", bodies, camera, dims, len(settings_window.properties_windows), b))
+    settings_window, camera, event, simulation, dims, G, COR, scroll, selection = args
+    bodies = simulation.bodies
+    if event.button == 1 and pg.key.get_mods() & pg.KMOD_SHIFT:
+        selection.start = selection.end = event.pos
+    elif event.button == 1:
+        b = simulation.grid().at(to_world(camera, event.pos, dims))  # The body under the cursor nearest to it
+        if b is None:
+            selection.ids = set()
+        elif bodies[b].id not in settings_window.properties_windows:
+            if not settings_window.alive:  # Respawn the main window if it is dead
+                settings_window.__init__(bodies, camera, dims, [G, COR])  # This still does not fix all errors
+            settings_window.properties_windows[bodies[b].id] = create_menu(
+                "BodyProperties", bodies, camera, dims, len(settings_window.properties_windows), bodies[b])
     elif event.button == 4:
         camera.scale = min(camera.scale * 1.1, 100)
         scroll.scale /= 1.1
@@ -76,78 +82,144 @@ def handle_mouse(*args):
         scroll.scale *= 1.1
 
 
+def needs_bodies(event, selection):  # Picking and selecting bodies, as opposed to moving the camera
+    return (event.type == pg.MOUSEBUTTONDOWN and event.button == 1 or
+            event.type == pg.MOUSEBUTTONUP and event.button == 1 and selection.start or
+            event.type == pg.KEYDOWN and event.key in selection.keys)
+
+
 def handle_events(*args):
-    settings_window, camera, scroll, done, dims, screen, bodies, G, COR = args
-    for event in pg.event.get():
+    settings_window, camera, scroll, replay, profiler, done, dims, screen, simulation, selection, G, COR, free = args
+    events = pg.event.get()
+    for k, event in enumerate(events):
+        if not free and needs_bodies(event, selection):  # Mid-step: this and later events wait for the next frame
+            for later in events[k:]:
+                pg.event.post(later)
+            break
         if event.type == pg.VIDEORESIZE:
             width, height = event.w, event.h
             dims, screen = V2(width, height), pg.display.set_mode((width, height), pg.RESIZABLE)
         elif event.type == pg.KEYDOWN:
             scroll.key(event.key, 1)
             camera.key_down(event.key)
+            replay.key(event.key)
+            profiler_key(profiler, event.key)
+            selection.key(event.key, simulation, settings_window, camera)
         elif event.type == pg.KEYUP:
             scroll.key(event.key, 0)
             camera.key_up(event.key)
+        elif replay.recording and replay.scrub(event, dims):
+            pass
         elif event.type == pg.MOUSEBUTTONDOWN:
-            handle_mouse(settings_window, camera, event, bodies, dims, G, COR, scroll)
+            handle_mouse(settings_window, camera, event, simulation, dims, G, COR, scroll, selection)
+        elif event.type == pg.MOUSEMOTION and selection.start:
+            selection.end = event.pos
+        elif event.type == pg.MOUSEBUTTONUP and event.button == 1 and selection.start:
+            selection.finish(simulation, [to_world(camera, pos, dims) for pos in (selection.start, event.pos)])
         done |= event.type == pg.QUIT
     return done, dims, screen
 
 
+def profiler_key(profiler, key):  # F3 shows or hides the profiler overlay, F4 saves the timings recorded so far
+    if key == pg.K_F3:
+        profiler.enabled = not profiler.enabled
+    elif key == pg.K_F4 and profiler.frames:
+        profiler.export(time.strftime("profile_%Y%m%d_%H%M%S.csv"))
+
+
+def close_window(settings_window, body_id):
+    window = settings_window.properties_windows.pop(body_id, None)
+    if window is not None:
+        window.destroy()
+
+
+def configure_simulation(*args):
+    G, COR, time_factor, collision, walls, g_field, gravity, solver, theta, integrator, substeps, backend, simulation, camera, dims = args
+    if walls:  # Walls are the edges of the screen, in world coordinates
+        walls = (camera.position + dims / 2 - dims / (2 * camera.scale), camera.position + dims / 2 + dims / (2 * camera.scale))
+    simulation.configure(G=G, COR=COR, time_factor=time_factor, collision=collision, walls=walls or None,
+                         g_field=g_field, gravity=gravity, solver=solver, theta=theta, integrator=integrator,
+                         substeps=substeps, backend=backend)
+
+
 def handle_bodies(*args):
-    G, COR, time_factor, collision, walls, g_field, gravity, scroll, bodies, camera, dims, frame_count, settings_window = args
-    
-    if time_factor != 0:
-        for body in bodies:  # Reset previous calculations
-            body.acceleration = V2(0, 0)
-        
-        for b, body in enumerate(bodies):  # Calculate forces and set acceleration, if mutual gravitation is enabled
-            for o in range(len(bodies) - 1, b, -1):
-                if collision and bodies[o].test_collision(body):
-                    if not COR:  # Only remove second body if collision is perfectly inelastic
-                        if bodies[b].mass0 < constants.mergePercent*bodies[o].mass0 or bodies[o].mass0 < constants.mergePercent*bodies[b].mass0:
-                            bodies[o].merge(bodies[b], settings_window.properties_windows)
-                            bodies.pop(b)
-                        else:
-                            subcor = bodies[b].mass0 / bodies[o].mass0 if bodies[o].mass0 > bodies[b].mass0 else bodies[o].mass0 / bodies[b].mass0
-                            bodies[o].collide(bodies[b], subcor, settings_window.properties_windows)
-                        break
-                    bodies[o].collide(bodies[b], COR, settings_window.properties_windows)
-                if gravity:
-                    force = body.force_of(bodies[o], G)  # This is a misnomer; `force` is actually acceleration / mass
-                    body.acceleration += bodies[o].mass0 * force
-                    bodies[o].acceleration -= body.mass0 * force
-            body.acceleration.y += G / 50 * g_field  # Uniform gravitational field
-            body.apply_motion(time_factor)
-            body.position += scroll.val
-            if not frame_count % 100 and body.position.length() > 100000:  # TODO: find a good value from this boundary
-                bodies.remove(body)
-                for window in settings_window.properties_windows:
-                    if window.body is body:
-                        settings_window.properties_windows.remove(window)
-                        window.destroy()
-                        break
-            if walls:  # Wall collision
-                d, r = ((body.position - camera.position) - dims / 2) * camera.scale + dims / 2, body.radius * camera.scale
-                for i in 0, 1:
-                    x = d[i]  # x is the dimension (x,y) currently being tested / edited
-                    if x <= r or x >= dims[i] - r:
-                        if COR == 0:
-                            body.velocity[i] *= -1  # Reflect the perpendicular velocity when merge and walls
-                        else :
-                            body.velocity[i] *= -COR # Reflect the perpendicular velocity when not merge and walls
-                        body.position[i] = (2 * (x < r) - 1) * (r - dims[i] / 2) / camera.scale + dims[i] / 2 + \
-                                           camera.position[i]  # Place body back into frame
-            
-            specmass = bodies[b].get_mass0() - abs(bodies[b].get_charge())**2
-            if specmass < 0  and random.randint(0, constants.decayConstant) <= constants.decayConstantN:
-                #print(str(bodies[b].get_mass0()) + " " + str(abs(bodies[b].get_charge())))
-                splitter = bodies[b].split(specmass, len(bodies) + 1, settings_window.properties_windows)
-                if  splitter.get_mass0()== 0:
-                    continue
-                else:
-                    bodies.append(splitter)
-            
+    *settings, scroll, simulation, camera, dims, settings_window, telemetry = args
+    configure_simulation(*settings, simulation, camera, dims)
+    simulation.step(scroll.val, settings_window.properties_windows)
+    for event in simulation.events:
+        if event[0] == "escape":
+            close_window(settings_window, event[1].id)
+    if settings_window.recorder:
+        settings_window.recorder.record(simulation)
+    if telemetry:
+        telemetry.publish(simulation)
+
+
+class WindowStandIn:  # What the physics thread gives `Simulation.step` in place of a properties window
+    def __init__(self, window):
+        self.window, self.body, self.merged, self.closed = window, window.body, False, False
+
+    def merge(self):
+        self.merged = True
+
+    def destroy(self):
+        self.closed = True
+
+
+class PhysicsThread:
+    """Steps the simulation on a `Stepper`, `constants.physics_rate` times a second, while the main loop handles
+    events and draws the last steps at its own frame rate (Options > Threaded Physics).
+
+    Properties windows are Tk widgets, which only the main thread may touch.  The thread steps with stand-ins for
+    them, and `sync`, called by the main thread with the lock held, passes on what happened to the real windows.
+    """
+    def __init__(self, simulation, settings_window, telemetry=None):
+        self.simulation, self.settings_window, self.offset = simulation, settings_window, V2(0, 0)
+        self.telemetry = telemetry
+        self.calls, self.escaped = [], []  # Window updates and escaped bodies, for the main thread to act on
+        self.stepper = Stepper(simulation, constants.physics_rate, self.step)
+        self.lock = self.stepper.lock
+        self.stepper.start()
+
+    def step(self):
+        windows, simulation = self.settings_window.properties_windows, self.simulation
+        stand_ins = {body_id: WindowStandIn(window) for body_id, window in windows.items()}
+        every = list(stand_ins.values())
+        with simulation.profiler.phase("physics"):
+            simulation.step(self.offset, stand_ins)
+        for stand_in in every:  # Merges move windows to the bodies that absorbed theirs, or close them
+            stand_in.window.body = stand_in.body
+            if stand_in.closed or stand_in.merged:
+                self.calls.append(stand_in.window.destroy if stand_in.closed else stand_in.window.merge)
+        windows.clear()
+        windows.update((body_id, stand_in.window) for body_id, stand_in in stand_ins.items())
+        self.escaped += [event[1].id for event in simulation.events if event[0] == "escape"]
+        if self.settings_window.recorder:
+            self.settings_window.recorder.record(simulation)
+        if self.telemetry:
+            self.telemetry.publish(simulation)
+
+    def sync(self):
+        calls, self.calls, escaped, self.escaped = self.calls, [], self.escaped, []
+        for call in calls:
+            call()
+        for body_id in escaped:
+            close_window(self.settings_window, body_id)
+
+    def stop(self):
+        self.stepper.stop()
+        self.sync()
+
+
+def physics_thread(physics, threaded, simulation, settings_window, telemetry=None):
+    """Start or stop the physics thread to match the Threaded Physics option."""
+    if threaded and physics is None:
+        return PhysicsThread(simulation, settings_window, telemetry)
+    if not threaded and physics is not None:
+        physics.stop()
+        return None
+    return physics
+
 
 class Scroll:
     def __init__(self):
@@ -161,6 +233,84 @@ class Scroll:
         self.val = (self.val + self.scale * (V2(self.down[:2]) - self.down[2:])) * .95
 
 
+class Replay:
+    """Plays back the recording opened in the Settings window instead of the simulation.  Space pauses, comma and
+    period step one frame, Home and End jump to the ends, and the bar along the bottom of the screen scrubs."""
+    bar_height = 8
+
+    def __init__(self):
+        self.recording, self.frame, self.playing = None, 0, True
+        self.map = {pg.K_COMMA: -1, pg.K_PERIOD: 1, pg.K_HOME: -float("inf"), pg.K_END: float("inf")}
+
+    def follow(self, recording):
+        if recording is not self.recording:
+            self.recording, self.frame, self.playing = recording, 0, True
+
+    def seek(self, frame):
+        self.frame = int(max(0, min(frame, len(self.recording) - 1)))
+
+    def key(self, key):
+        if not self.recording:
+            return
+        if key == pg.K_SPACE:
+            self.playing = not self.playing
+        elif key in self.map:
+            self.playing = False
+            self.seek(self.frame + self.map[key])
+
+    def scrub(self, event, dims):
+        """Seek to where the bar was clicked or dragged; returns whether the event was on the bar."""
+        if event.type not in (pg.MOUSEBUTTONDOWN, pg.MOUSEMOTION) or event.pos[1] < dims[1] - 3 * self.bar_height:
+            return False
+        if event.type == pg.MOUSEBUTTONDOWN and event.button == 1 or event.type == pg.MOUSEMOTION and event.buttons[0]:
+            self.playing = False
+            self.seek(event.pos[0] / dims[0] * len(self.recording))
+        return True
+
+    def advance(self):
+        if self.playing and self.frame < len(self.recording) - 1:
+            self.frame += 1
+
+    def draw_bar(self, screen, dims):
+        progress = (self.frame + 1) / len(self.recording) if len(self.recording) else 0
+        pg.draw.rect(screen, (128, 128, 128), pg.Rect(0, dims[1] - self.bar_height, dims[0], self.bar_height))
+        pg.draw.rect(screen, (255, 0, 0), pg.Rect(0, dims[1] - self.bar_height, dims[0] * progress, self.bar_height))
+
+
+class Selection:
+    """Dragging with Shift and the left button held selects every body whose centre is inside the box.  Selected
+    bodies are outlined; Delete removes them, C moves the camera to their centre of mass, and a click on empty space
+    clears the selection."""
+    outline, keys = (255, 255, 0), (pg.K_DELETE, pg.K_c)
+
+    def __init__(self):
+        self.start, self.end, self.ids = None, None, set()
+
+    def finish(self, simulation, corners):
+        found = simulation.grid().within(*corners)
+        self.start, self.ids = None, set(simulation.bodies.live("id")[found].tolist())
+
+    def indices(self, bodies):
+        return np.flatnonzero(np.isin(bodies.live("id"), list(self.ids))) if self.ids else np.empty(0, dtype=int)
+
+    def key(self, key, simulation, settings_window, camera):
+        selected = [simulation.bodies[i] for i in self.indices(simulation.bodies)]
+        if key == pg.K_DELETE and selected:
+            for body in selected:
+                simulation.bodies.discard(body)
+            for body in simulation.bodies.compact():
+                close_window(settings_window, body.id)
+            self.ids = set()
+        elif key == pg.K_c and selected:
+            camera.move_to_com(selected)
+
+    def draw(self, screen, bodies, cam):
+        render.draw_outlines(screen, bodies, cam, self.indices(bodies), self.outline)
+        if self.start:
+            (x0, y0), (x1, y1) = self.start, self.end
+            pg.draw.rect(screen, self.outline, pg.Rect(min(x0, x1), min(y0, y1), abs(x1 - x0), abs(y1 - y0)), 1)
+
+
 class Camera:
     def __init__(self, dims):
         self.position, self.velocity, self.dims, self.scale, self.map = V2(0, 0), V2(0, 0), dims, 1, [pg.K_RIGHT,
@@ -190,22 +340,58 @@ class Camera:
 
 def main():
     screen, dims = init_display()
-    bodies, camera, scroll = [], Camera(dims), Scroll()
+    simulation, camera, scroll, replay, selection = Simulation(), Camera(dims), Scroll(), Replay(), Selection()
+    bodies, profiler = simulation.bodies, simulation.profiler
+    phase = profiler.phase
 
-    settings_window, clock, done, frame_count = create_menu("Settings", bodies, camera, dims,
-                                                            [constants.G, constants.COR]), pg.time.Clock(), False, 0
+    settings_window, clock, done = create_menu("Settings", bodies, camera, dims,
+                                               [constants.G, constants.COR]), pg.time.Clock(), False
+    physics = None  # The physics thread, while there is one
+    telemetry = TelemetryServer(constants.telemetry_address).start() if constants.telemetry_address else None
                         
     while not done:
         clock.tick(constants.clock_speed)
-        frame_count += 1
 
         camera.apply_velocity()
-        G, COR, misc_settings = update_windows(settings_window)
-        done, dims, screen = handle_events(settings_window, camera, scroll, done, dims, screen, bodies, G, COR)
-        handle_bodies(G, COR, *misc_settings, scroll, bodies, camera, dims, frame_count, settings_window)
-        refresh_display(settings_window, screen, bodies, camera)
+        # With a physics thread, the windows and whatever else touches the bodies wait for a frame between steps
+        free = physics is None or physics.stepper.acquire()
+        try:
+            if free:
+                with phase("update_windows"):
+                    G, COR, misc_settings = update_windows(settings_window, simulation.diagnostics)
+                replay.follow(settings_window.replay)
+            with phase("handle_events"):
+                done, dims, screen = handle_events(settings_window, camera, scroll, replay, profiler, done, dims,
+                                                   screen, simulation, selection, G, COR, free)
+            if replay.recording:  # Replaying does not touch the simulation
+                replay.advance()
+            elif physics and free:
+                configure_simulation(G, COR, *misc_settings, simulation, camera, dims)
+                physics.offset = scroll.val
+                physics.sync()
+            elif not physics:
+                with phase("handle_bodies"):
+                    handle_bodies(G, COR, *misc_settings, scroll, simulation, camera, dims, settings_window,
+                                  telemetry)
+            if free and settings_window.alive and not replay.recording:
+                settings_window.checkpoint(simulation)
+        finally:
+            if physics and free:
+                physics.lock.release()
+        threaded = settings_window.threaded.get() if settings_window.alive else physics is not None
+        physics = physics_thread(physics, threaded and not replay.recording, simulation, settings_window, telemetry)
+        with phase("refresh_display"):
+            refresh_display(settings_window, screen, physics.stepper.frame() if physics else bodies, camera,
+                            replay if replay.recording else None, profiler, selection)
         scroll.update_value()
+        profiler.end_frame(bodies=len(bodies), steps=simulation.steps, **simulation.paths,
+                           **simulation.diagnostics.latest)
 
+    physics_thread(physics, False, simulation, settings_window)
+    settings_window.stop_recording()
+    settings_window.writer.close()
+    if telemetry:
+        telemetry.close()
     pg.quit()
     if settings_window.alive: settings_window.destroy(), self.destroy()
 
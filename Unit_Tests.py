@@ -1,3 +1,4 @@
 from src.tests import *
 
-run_all_tests()
+if __name__ == "__main__":  # Spawned pool workers import this module too, and must not run the tests again
+    run_all_tests()
@@ -1,10 +1,37 @@
 from .constants import *
+from . import constants
+from .body_store import BodyStore
 from numpy import random
 import cmath
 
 
+class _Column:
+    """Exposes one row of a `BodyStore` column as an attribute of a `Body`."""
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, body, owner=None):
+        if body is None:
+            return self
+        value = getattr(body._store, self.name)[body._index]
+        if self.name in BodyStore.vectors:
+            return V2(*value)
+        if self.name == "color":
+            return tuple(int(round(c)) for c in value)
+        return int(value) if self.name == "id" else float(value)
+
+    def __set__(self, body, value):
+        getattr(body._store, self.name)[body._index] = value
+
+
 class Body:
+    # State lives in the store the body belongs to; a body outside of a simulation gets a private one-row store
+    position, velocity, acceleration = _Column(), _Column(), _Column()
+    mass0, mass, charge, density, radius, color = _Column(), _Column(), _Column(), _Column(), _Column(), _Column()
+    id = _Column()  # Stable within the simulation the body belongs to
+
     def __init__(self, mass, position, velocity, density=Density, color=None, name=None, charge=None):
+        BodyStore.detached(self)
         self.mass = mass 
         self.mass0 = mass
         self.density = density
@@ -18,12 +45,11 @@ class Body:
         self.currentVelocity = V2(velocity)
         self.acceleration = V2(0, 0)
         
-        self.charge = charge
-        
-        if self.charge == None:
-            self.charge = random.randint(-self.mass0, self.mass0)
+        if charge == None:
+            charge = random.randint(-self.mass0, self.mass0) if self.mass0 >= 1 else 0  # randint needs a non-empty range
         if name == "Star":
-            self.charge = -self.mass0 
+            charge = -self.mass0
+        self.charge = charge
 
         if self.charge < 0 :
             self.color = (0,0,255)
@@ -34,10 +60,18 @@ class Body:
         else:
             self.color = (0,0,0)
         
+    @classmethod
+    def view(cls, store, index, name=None):
+        """A body for a row that is already in `store`, such as one read from a snapshot, without initialising it."""
+        body = cls.__new__(cls)
+        body._store, body._index, body.name = store, index, name
+        return body
+
     def __repr__(self):
         return self.name if self.name else "Unnamed Body"
 
     def draw_on(self, screen):
+        import pygame as pg  # Only the viewer draws, so the core does not need pygame
         pg.draw.circle(screen, self.color, list(map(int, self.position)), int(self.radius), 0)
 
     def click_collision(self, mouse_pos):
@@ -50,6 +84,8 @@ class Body:
         Gravitational = G * other.mass0 / r ** 3 * d  if r else V2(0, 0) #Need if r else V2(0,0) for ALL forces
         Coulombic = - K * self.charge * other.charge / r ** 3 * d / self.mass0  if r else V2(0, 0)
         araw = Gravitational + Coulombic
+        if self.velocity.length() < constants.newtonian_beta * C:  # Slow enough that gamma is 1 to within newtonian_beta ** 2
+            return araw
         
         self.currentVelocity = self.velocity
         gammav = 1 / abs( cmath.sqrt( 1 - ( self.currentVelocity.length() / C ) ** 2 ) ) 
@@ -96,13 +132,15 @@ class Body:
         print(str(self.name) + " " + str(self.mass0) + " " + str(self.charge))
         '''
         
-        # Check to see if the deleted body belongs to a properties window; If so, set win.body to the combined body
-        for win in prop_wins:
-            if win.body is self:
-                win.merge()
-            elif win.body is other:
-                win.body = self
-                win.merge()
+        # Properties windows are indexed by body id.  The absorbed body's window follows it into the combined body,
+        # unless that already has a window of its own
+        win, absorbed = prop_wins.get(self.id), prop_wins.pop(other.id, None)
+        if absorbed is not None and win is None:
+            absorbed.body, prop_wins[self.id], win = self, absorbed, absorbed
+        elif absorbed is not None:
+            absorbed.destroy()
+        if win is not None:
+            win.merge()
 
     def collide(self, other, COR, prop_wins):
         m, m2, v, v2, x, x2 = self.mass, other.mass, self.velocity, other.velocity, self.position, other.position;
@@ -162,11 +200,10 @@ class Body:
         self.density = self.density
         
         
-        # Check to see if the deleted body belongs to a properties window; If so, set win.body to the combined body
-        for win in prop_wins:
-            if win.body is self:
-                win.merge()
-                    
+        # Update the properties window of the body, if it has one
+        if self.id in prop_wins:
+            prop_wins[self.id].merge()
+
         return Body(mass0, position, velocity, self.density, None, "Planet " + str(x), charge = charge)
         
     def update_radius(self):
@@ -179,18 +216,29 @@ class Body:
         return self.charge
     
     def apply_motion(self, time_factor):
+        self.kick(time_factor)
+        self.drift(time_factor)
+
+    def kick(self, time_factor):  # A body slower than newtonian_beta * C before and after is kicked as in Newtonian
+        slow = constants.newtonian_beta * C  # mechanics, to within 2 * newtonian_beta ** 2 of its change in velocity
         self.currentVelocity = self.velocity
         
-        gammav = 1 / abs( cmath.sqrt( 1 - ( self.currentVelocity.length() / C )**2 ) )
-        
-        tempAccell = self.acceleration * time_factor / abs( cmath.sqrt( 1 + ( self.acceleration.length() * time_factor / C ) ** 2 ) ) if self.acceleration else V2(0,0)
-        self.velocity += tempAccell
-        self.velocity = self.velocity #* abs( cmath.sqrt( 1 - ( self.velocity.length() / C )**2 ) ) if self.acceleration else self.velocity
-        if self.velocity.length() >= C:
-            self.velocity = .999999999999*C * self.velocity / self.velocity.length()
-        self.position += self.velocity * time_factor * abs( cmath.sqrt( 1 - ( self.velocity.length() / C )**2 ) )
-        
-        self.mass = self.mass0 / abs( cmath.sqrt( 1 - ( self.velocity.length() / C ) ** 2 ) )
+        newtonian = self.velocity + self.acceleration * time_factor
+        if self.velocity.length() < slow and newtonian.length() < slow:
+            self.velocity = newtonian
+        else:
+            tempAccell = self.acceleration * time_factor / abs( cmath.sqrt( 1 + ( self.acceleration.length() * time_factor / C ) ** 2 ) ) if self.acceleration else V2(0,0)
+            self.velocity += tempAccell
+            if self.velocity.length() >= C:
+                self.velocity = .999999999999*C * self.velocity / self.velocity.length()
+
+    def drift(self, time_factor):
+        if self.velocity.length() < constants.newtonian_beta * C:
+            self.position += self.velocity * time_factor
+            self.mass = self.mass0
+        else:
+            self.position += self.velocity * time_factor * abs( cmath.sqrt( 1 - ( self.velocity.length() / C )**2 ) )
+            self.mass = self.mass0 / abs( cmath.sqrt( 1 - ( self.velocity.length() / C ) ** 2 ) )
         
         self.update_radius()
         
@@ -0,0 +1,7 @@
+from . import kernels, reference, jit
+
+# Interchangeable implementations of the per-body kernels, with the semantics of `Body.force_of` and
+# `Body.apply_motion`.  Each provides `accelerations(store, G, targets)`, `kick(store, dt, targets)`,
+# `drift(store, dt)`, `apply_motion(store, dt)` and a collision `BroadPhase` class with a `pairs(position, radius)`
+# method.  "Numba" needs the numba package, and is the NumPy backend without it.
+backends = {"Python": reference, "NumPy": kernels, "Numba": jit if jit.available else kernels}
@@ -0,0 +1,171 @@
+import numpy as np
+
+
+class BodyStore:
+    """Contiguous, array-backed storage for the state of every body in a simulation.
+
+    Each physical quantity is one NumPy column indexed by body, so the hot loop can operate on all bodies at once.
+    The store also behaves like the list of bodies it replaces: iterating, indexing, `append`, `pop` and `remove`
+    work with `Body` objects, which are thin views onto one row of the columns.
+
+    Every body is given an integer `id` when it joins the store, which it keeps however the rows around it move.
+    Removing a body shifts every row after it, so removals made while stepping are instead queued with `discard`
+    and applied together by `compact`, in a single pass over the columns.
+    """
+    vectors = ("position", "velocity", "acceleration")
+    scalars = ("mass0", "mass", "charge", "density", "radius")
+    columns = vectors + scalars + ("color", "id")
+    loose = False  # Whether the bodies are each on their own, as after `clear`, rather than in one simulation
+
+    def __init__(self, bodies=(), capacity=16):
+        self.n, self.capacity, self.views, self.next_id, self.pending = 0, 0, [], 0, {}
+        self.reserve(capacity)
+        self.extend(bodies)
+
+    @classmethod
+    def shape(cls, name, capacity):
+        return (capacity, 2) if name in cls.vectors else (capacity, 3) if name == "color" else (capacity,)
+
+    def reserve(self, capacity):
+        """Grow every column so that at least `capacity` bodies fit without reallocating."""
+        if capacity <= self.capacity:
+            return
+        capacity = max(capacity, 2 * self.capacity)
+        for name in self.columns:
+            column = np.zeros(self.shape(name, capacity), dtype=np.int64 if name == "id" else float)
+            if self.capacity:
+                column[:self.n] = getattr(self, name)[:self.n]
+            setattr(self, name, column)
+        self.capacity = capacity
+
+    @classmethod
+    def from_columns(cls, columns, view):
+        """A store that uses the given arrays (one per column, all of the same length) without copying them.
+        `view(store, index)` makes the body for each row."""
+        store = cls(capacity=1)
+        store.n = store.capacity = len(columns["position"])
+        for name in cls.columns:
+            setattr(store, name, columns[name] if name in columns else np.arange(store.n))  # Older files have no ids
+        store.views = [view(store, i) for i in range(store.n)]
+        store.next_id = int(store.id.max()) + 1 if store.n else 0
+        return store
+
+    def live(self, name):
+        """Return the in-use part of a column.  This is a view, so writing to it updates the bodies."""
+        return getattr(self, name)[:self.n]
+
+    @classmethod
+    def detached(cls, body):
+        """Give a body that is not part of any simulation a private single-row store."""
+        store = cls(capacity=1)
+        store.n, store.views = 1, [body]
+        body._store, body._index = store, 0
+        return store
+
+    def _detach(self, indices):
+        """Give the bodies at `indices` rows of their own in one loose store, with one copy of each column."""
+        store = BodyStore(capacity=len(indices))
+        for name in self.columns:
+            getattr(store, name)[:len(indices)] = getattr(self, name)[indices]
+        store.n, store.views, store.loose = len(indices), [self.views[i] for i in indices], True
+        for index, body in enumerate(store.views):
+            body._store, body._index = store, index
+
+    def _copy_row(self, i, source, j):
+        for name in self.columns:
+            getattr(self, name)[i] = getattr(source, name)[j]
+
+    def append(self, body):
+        if body._store is self:
+            raise ValueError("{} is already part of this simulation".format(body))
+        if len(body._store) > 1 and not body._store.loose:  # Moving a body out of another simulation
+            body._store.remove(body)
+        self.reserve(self.n + 1)
+        self._copy_row(self.n, body._store, body._index)
+        self.id[self.n], self.next_id = self.next_id, self.next_id + 1
+        body._store, body._index = self, self.n
+        self.views.append(body)
+        self.n += 1
+
+    def extend(self, bodies):
+        for body in bodies:
+            self.append(body)
+
+    def pop(self, index=-1):
+        index = range(self.n)[index]
+        body = self.views.pop(index)
+        self.detached(body)._copy_row(0, self, index)
+        for name in self.columns:  # Shift the following rows down to keep the columns contiguous
+            column = getattr(self, name)
+            column[index:self.n - 1] = column[index + 1:self.n]
+        self.n -= 1
+        for view in self.views[index:]:
+            view._index -= 1
+        return body
+
+    def discard(self, body):
+        """Queue a body for removal by the next `compact`.  Until then it stays where it is, and so do the others."""
+        if body._store is not self:
+            raise ValueError("{} is not part of this simulation".format(body))
+        self.pending[id(body)] = body
+
+    def compact(self):
+        """Remove every body queued by `discard` in one pass, and return them, detached, in the order they were."""
+        removed = sorted(self.pending.values(), key=lambda body: body._index)
+        self.pending = {}
+        if not removed:
+            return []
+        indices = [body._index for body in removed]
+        keep = np.ones(self.n, dtype=bool)
+        keep[indices] = False
+        for body, index in zip(removed, indices):
+            self.detached(body)._copy_row(0, self, index)
+        n = int(keep.sum())
+        for name in self.columns:
+            column = getattr(self, name)
+            column[:n] = column[:self.n][keep]
+        self.views = [view for view, kept in zip(self.views, keep) if kept]
+        for index, view in enumerate(self.views[indices[0]:], indices[0]):
+            view._index = index
+        self.n = n
+        return removed
+
+    def index(self, body):
+        if body._store is not self:
+            raise ValueError("{} is not part of this simulation".format(body))
+        return body._index
+
+    def remove(self, body):
+        self.pop(self.index(body))
+
+    def clear(self):
+        if self.n:
+            self._detach(np.arange(self.n))
+        self.n, self.views, self.pending = 0, [], {}
+
+    def __len__(self):
+        return self.n
+
+    def __iter__(self):
+        return iter(list(self.views))  # Iterate over a copy so that bodies may be removed while iterating
+
+    def __contains__(self, body):
+        return getattr(body, "_store", None) is self
+
+    def __getitem__(self, index):
+        return self.views[index]
+
+    def __setitem__(self, index, bodies):
+        if index != slice(None):
+            raise TypeError("only whole-simulation assignment (bodies[:] = ...) is supported")
+        if isinstance(bodies, BodyStore) and bodies is not self:  # Take over the columns and bodies wholesale
+            self.clear()
+            for name in self.columns + ("n", "capacity", "views", "next_id"):
+                setattr(self, name, getattr(bodies, name))
+            for body in self.views:
+                body._store = self
+            bodies.__init__()
+            return
+        bodies = list(bodies)
+        self.clear()
+        self.extend(bodies)
@@ -1,5 +1,5 @@
 from random import randint, uniform
-from pygame.math import Vector2 as V2
+from .vector import Vector2 as V2
 from math import hypot, pi, sin, cos, sqrt
 
 G = .00001
@@ -8,6 +8,15 @@ K = 1 #this is anoyingly correct - 9*10**9
 
 C = 500
 
+# Bodies farther than escape_distance from the origin have escaped and are removed, checked every escape_every steps
+escape_distance = 100000
+escape_every = 100
+
+# Bodies slower than this fraction of C (before and after each kick) move as in Newtonian mechanics, skipping the
+# relativistic terms, which are smaller than 2 * newtonian_beta ** 2 of their motion.  0 keeps every body on the
+# relativistic path.
+newtonian_beta = .01
+
 mergePercent = .9
 
 alphaDistancePercent = 3/2
@@ -20,4 +29,16 @@ Density = 0.1
 COR = 1.0  # Coefficient of Restitution
 
 # Set simulation hard clock speed (fps)
-clock_speed = 120
\ No newline at end of file
+clock_speed = 120
+# Steps a second when the simulation runs on a thread of its own (Options > Threaded Physics), apart from drawing
+physics_rate = 60
+# Checkpoints of the viewer's simulation (Options > Autosave): the directory, steps between them and how many are kept
+autosave_directory, autosave_every, autosave_keep = "autosaves", 1000, 3
+# Stream every step of the viewer's simulation to local clients (see src/display/telemetry.py) at "PORT",
+# "HOST:PORT" or "unix:PATH"; None serves nothing
+telemetry_address = None
+
+# How many times a second the Tk windows are refreshed; lower values leave more of each frame to the simulation
+window_refresh_rate = 30
+# How far (in pixels) an arrow on a body's properties window must move before the window redraws it
+arrow_tolerance = 1
@@ -0,0 +1,102 @@
+"""Whole-system quantities for checking a run: energy, momentum and angular momentum.
+
+Without collisions, the uniform field or walls, momentum and angular momentum are conserved up to rounding and the
+relativistic terms, and energy up to the error of the integrator, so their drift measures the accuracy of a run.
+"""
+from collections import deque
+import csv, json
+import numpy as np
+
+from . import barnes_hut
+from .constants import K
+from .kernels import _rows_per_block
+
+
+def kinetic_energy(store):
+    """Sum of 1/2 m v^2, with the relativistic mass of each body."""
+    return .5 * float((store.live("mass") * (store.live("velocity") ** 2).sum(axis=1)).sum())
+
+
+def momentum(store):
+    """Total momentum (m v, with relativistic masses) as an (x, y) pair."""
+    return (store.live("mass")[:, None] * store.live("velocity")).sum(axis=0)
+
+
+def angular_momentum(store):
+    """Total angular momentum about the centre of mass (positive for counterclockwise motion on screen)."""
+    mass, position, velocity = store.live("mass"), store.live("position"), store.live("velocity")
+    if not len(mass) or not mass.sum():
+        return 0.
+    r = position - (mass[:, None] * position).sum(axis=0) / mass.sum()
+    return -float((mass * (r[:, 0] * velocity[:, 1] - r[:, 1] * velocity[:, 0])).sum())  # y points down the screen
+
+
+def potential_energy(store, G, theta=None):
+    """Sum over pairs of the gravitational (-G m m / r) and Coulomb (K q q / r) potential energies, with rest masses.
+    Pairs at zero distance, which exert no force on each other, are left out.  With an opening angle `theta`, the
+    sum is approximated with Barnes-Hut trees in O(N log N) instead of taken over every pair."""
+    if theta is not None:
+        return barnes_hut.potential_energy(store, G, theta)
+    position, mass0, charge = store.live("position"), store.live("mass0"), store.live("charge")
+    n, total, per_block = len(mass0), 0., _rows_per_block(len(mass0))
+    for start in range(0, n, per_block):
+        end = min(start + per_block, n)
+        r = np.sqrt(((position[None, :, :] - position[start:end, None, :]) ** 2).sum(axis=2))
+        later = (np.arange(n)[None, :] > np.arange(start, end)[:, None]) & (r > 0)  # Each pair once
+        strength = -G * mass0[start:end, None] * mass0[None, :] + K * charge[start:end, None] * charge[None, :]
+        total += float((strength[later] / r[later]).sum())
+    return total
+
+
+def simulation_potential(simulation):
+    """The potential energy of a simulation's bodies under its own settings: none without mutual forces, and from
+    the tree when the force solver is Barnes-Hut."""
+    if not simulation.gravity:
+        return 0.
+    theta = simulation.theta if simulation.solver == "Barnes-Hut" else None
+    return potential_energy(simulation.bodies, simulation.G, theta)
+
+
+def summary(simulation):
+    """Body count, energies and momentum of a simulation as it is now."""
+    kinetic, potential = kinetic_energy(simulation.bodies), simulation_potential(simulation)
+    return {"bodies": len(simulation.bodies), "kinetic_energy": kinetic, "potential_energy": potential,
+            "energy": kinetic + potential, "momentum": float(np.hypot(*momentum(simulation.bodies)))}
+
+
+class Diagnostics:
+    """Conservation telemetry of a simulation, taken by `record` after every step.
+
+    Kinetic energy, momentum and angular momentum cost O(N) and are taken every step.  The potential energy is
+    taken every `potential_every` steps (never for 0), with the Barnes-Hut tree when that is the force solver, and
+    is carried over in between, as is `energy`, their sum.  `latest` holds the last values, and the last `history`
+    steps are kept for `export`.
+    """
+    quantities = ("kinetic_energy", "potential_energy", "energy", "momentum_x", "momentum_y", "angular_momentum")
+
+    def __init__(self, enabled=True, potential_every=0, history=100000):
+        self.enabled, self.potential_every = enabled, potential_every
+        self.latest, self.frames, self.potential = {}, deque(maxlen=history), float("nan")
+
+    def record(self, simulation):
+        if not self.enabled:
+            return
+        store = simulation.bodies
+        if self.potential_every and not simulation.steps % self.potential_every:
+            self.potential = simulation_potential(simulation)
+        kinetic, (px, py), potential = kinetic_energy(store), momentum(store), self.potential
+        self.latest = {"kinetic_energy": kinetic, "potential_energy": potential, "energy": kinetic + potential,
+                       "momentum_x": float(px), "momentum_y": float(py), "angular_momentum": angular_momentum(store)}
+        self.frames.append(dict(self.latest, step=simulation.steps))
+
+    def export(self, filename):
+        """Write every recorded step to a .json file, or to CSV for any other extension."""
+        columns = ("step",) + self.quantities
+        if filename.endswith(".json"):
+            with open(filename, "w") as outfile:
+                json.dump({"columns": columns, "frames": list(self.frames)}, outfile)
+            return
+        with open(filename, "w", newline="") as outfile:
+            writer = csv.DictWriter(outfile, columns)
+            writer.writeheader()
+            writer.writerows(self.frames)
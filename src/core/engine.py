@@ -0,0 +1,140 @@
+from .body_store import BodyStore
+from .backends import backends
+from . import constants, kernels, solvers
+from .integrators import integrators
+from .profiler import Profiler
+from .diagnostics import Diagnostics
+from .spatial_hash import Grid
+import numpy as np
+import random
+
+
+class Simulation:
+    """Steps a set of bodies with no display, windows or frame clock attached.
+
+    The physics settings are plain attributes, named after the controls in the Settings window:
+    `walls` is either None or the box ((left, top), (right, bottom)) that bodies bounce inside, in world coordinates.
+    Each step advances time by `time_factor` in `substeps` equal parts, using one of `integrators.integrators` and
+    the kernels of one of `backends.backends`.
+    After each step, `events` lists what happened to individual bodies during it, as ("merge", survivor, absorbed),
+    ("split", parent, fragment) or ("escape", body) tuples.  `paths` counts the bodies that started the last step slow
+    enough for Newtonian motion (see `constants.newtonian_beta`) and those that needed the relativistic terms.
+    Enabling `profiler` times each phase of a step, and `diagnostics` keeps the energy and momenta of every step.
+    `grid` finds bodies by position, for picking them with the mouse.
+    """
+    settings = ("G", "COR", "time_factor", "collision", "walls", "g_field", "gravity", "solver", "theta", "integrator",
+                "substeps", "backend")
+
+    def __init__(self, bodies=(), seed=None, **settings):
+        self.bodies = bodies if isinstance(bodies, BodyStore) else BodyStore(bodies)
+        self.G, self.COR, self.time_factor, self.collision, self.walls = constants.G, constants.COR, 1, True, None
+        self.g_field, self.gravity, self.solver, self.theta = False, True, "Direct", .5
+        self.integrator, self.substeps, self.backend = "Euler", 1, "NumPy"
+        self.configure(**settings)
+        self.broad_phase, self.random = None, random.Random(seed)
+        self.steps, self.events, self.profiler = 0, [], Profiler()
+        self.paths, self.diagnostics = {"newtonian": 0, "relativistic": 0}, Diagnostics()
+        self.lookup = None, None
+
+    def configure(self, **settings):
+        for name, value in settings.items():
+            if name not in self.settings:
+                raise TypeError("unknown simulation setting {!r}".format(name))
+            setattr(self, name, value)
+
+    def grid(self):
+        """A `spatial_hash.Grid` of the bodies where they are now, built at most once per step."""
+        key, grid = self.lookup
+        if key != (self.steps, len(self.bodies), self.bodies.next_id):  # Stepped, or bodies added, removed or loaded
+            grid = Grid(self.bodies.live("position"), self.bodies.live("radius"))
+            self.lookup = (self.steps, len(self.bodies), self.bodies.next_id), grid
+        return grid
+
+    def run(self, steps):
+        for _ in range(steps):
+            self.step()
+
+    def step(self, offset=(0, 0), windows=None):
+        """Advance every body by one time step.  `offset` shifts all bodies (the cinematic camera scroll), and
+        `windows` are the open properties windows by body id, which are kept pointing at the right bodies."""
+        self.events, windows = [], {} if windows is None else windows
+        if self.time_factor == 0:
+            return
+        self.steps += 1
+        bodies, integrate, phase = self.bodies, integrators[self.integrator], self.profiler.phase
+        backend = backends[self.backend]
+        if not isinstance(self.broad_phase, backend.BroadPhase):
+            self.broad_phase = backend.BroadPhase()
+        bodies.live("position")[:] += offset
+        newtonian = int(kernels.newtonian(bodies.live("velocity")).sum())
+        self.paths = {"newtonian": newtonian, "relativistic": len(bodies) - newtonian}
+        for _ in range(self.substeps):
+            if self.collision:
+                with phase("collisions"):
+                    self.handle_collisions(windows)
+            with phase("integration"):
+                integrate(bodies, self.compute_forces, self.time_factor / self.substeps, backend)
+            if self.walls is not None:
+                with phase("walls"):
+                    self.handle_walls()
+
+        if not self.steps % constants.escape_every:
+            position = bodies.live("position")
+            for b in np.flatnonzero((position ** 2).sum(axis=1) > constants.escape_distance ** 2):
+                bodies.discard(bodies[b])
+            self.events += [("escape", body) for body in bodies.compact()]
+
+        with phase("decay"):
+            self.handle_decay(windows)
+        with phase("diagnostics"):
+            self.diagnostics.record(self)
+
+    def compute_forces(self, targets=None):
+        """Set the acceleration of every body (or only of the bodies at the indices `targets`), from mutual gravitation
+        (if enabled) and the uniform field."""
+        acceleration, rows = self.bodies.live("acceleration"), kernels.rows(targets)
+        with self.profiler.phase("forces"):
+            acceleration[rows] = solvers.accelerations(self.bodies, self.G, self.solver, self.theta, targets,
+                                                       backends[self.backend]) if self.gravity else 0
+        acceleration[rows, 1] += self.G / 50 * self.g_field  # Uniform gravitational field
+
+    def handle_collisions(self, windows):
+        bodies, COR = self.bodies, self.COR
+        removed, settled = {}, set()
+        for b, o in self.broad_phase.pairs(bodies.live("position"), bodies.live("radius")):
+            if b in removed or o in removed or b in settled or not bodies[o].test_collision(bodies[b]):
+                continue
+            if not COR:  # Only remove second body if collision is perfectly inelastic
+                if bodies[b].mass0 < constants.mergePercent * bodies[o].mass0 or bodies[o].mass0 < constants.mergePercent * bodies[b].mass0:
+                    bodies[o].merge(bodies[b], windows)
+                    removed[b] = bodies[o]
+                else:
+                    subcor = bodies[b].mass0 / bodies[o].mass0 if bodies[o].mass0 > bodies[b].mass0 else bodies[o].mass0 / bodies[b].mass0
+                    bodies[o].collide(bodies[b], subcor, windows)
+                settled.add(b)
+                continue
+            bodies[o].collide(bodies[b], COR, windows)
+        for b in sorted(removed):  # Removed together once every pair is done, so that indices stay valid until then
+            self.events.append(("merge", removed[b], bodies[b]))
+            bodies.discard(bodies[b])
+        bodies.compact()
+
+    def handle_walls(self):
+        (low, high), bodies = np.array(self.walls, dtype=float), self.bodies
+        position, velocity, radius = bodies.live("position"), bodies.live("velocity"), bodies.live("radius")
+        for i in 0, 1:  # i is the dimension (x,y) currently being tested / edited
+            under, over = position[:, i] <= low[i] + radius, position[:, i] >= high[i] - radius
+            hit = under | over
+            velocity[hit, i] *= -1 if self.COR == 0 else -self.COR  # Reflect the perpendicular velocity
+            position[hit, i] = np.where(under[hit], low[i] + radius[hit], high[i] - radius[hit])  # Place body back into frame
+
+    def handle_decay(self, windows):
+        bodies = self.bodies
+        specmass, fragments = bodies.live("mass0") - np.abs(bodies.live("charge")) ** 2, []
+        for b in np.flatnonzero(specmass < 0):
+            if self.random.randint(0, constants.decayConstant) <= constants.decayConstantN:
+                splitter = bodies[b].split(specmass[b], len(bodies) + len(fragments) + 1, windows)
+                if splitter.get_mass0() != 0:
+                    fragments.append(splitter)
+                    self.events.append(("split", bodies[b], splitter))
+        bodies.extend(fragments)  # Added after the loop, so that new fragments do not decay in the step they appear
@@ -0,0 +1,74 @@
+from . import kernels
+from .spatial_hash import nearest_distances
+import numpy as np
+
+# Coefficients of the fourth-order composition of three leapfrog steps (Yoshida, 1990)
+_w1 = 1 / (2 - 2 ** (1 / 3))
+yoshida_weights = (_w1, 1 - 2 * _w1, _w1)
+
+
+def euler(store, forces, dt, backend=kernels):
+    """First-order update of `Body.apply_motion`: one force evaluation, then velocity and position."""
+    forces()
+    backend.apply_motion(store, dt)
+
+
+def leapfrog(store, forces, dt, backend=kernels):
+    """Second-order, symplectic velocity Verlet (kick-drift-kick)."""
+    composition(store, forces, dt, (1,), backend)
+
+
+def yoshida(store, forces, dt, backend=kernels):
+    """Fourth-order composition of three leapfrog steps; the middle one goes backwards in time."""
+    composition(store, forces, dt, yoshida_weights, backend)
+
+
+def composition(store, forces, dt, weights, backend=kernels):
+    forces()
+    for w in weights:
+        backend.kick(store, w * dt / 2)
+        backend.drift(store, w * dt)
+        forces()
+        backend.kick(store, w * dt / 2)
+
+
+eta = .05  # Accuracy parameter of the "Block" integrator: the fraction of its free-fall time a body may step through
+max_level = 10  # Deepest halving of the time step in the "Block" integrator
+
+
+def block_levels(store, dt):
+    """How many times each body's step must be halved from dt, from its acceleration and nearest neighbour.
+
+    A body wants a step of at most `eta * sqrt(d / a)`, about the time it takes to fall the distance d to its nearest
+    neighbour; the levels round that down to dt / 2 ** level.
+    """
+    a = np.sqrt((store.live("acceleration") ** 2).sum(axis=1))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        wanted = eta * np.sqrt(nearest_distances(store.live("position")) / a)
+        levels = np.ceil(np.log2(abs(dt) / wanted))
+    return np.clip(np.nan_to_num(levels, nan=0, posinf=max_level, neginf=0), 0, max_level).astype(int)
+
+
+def block(store, forces, dt, backend=kernels):
+    """Leapfrog with individual, power-of-two time steps (Makino, 1991).
+
+    Each body is assigned a step of dt / 2 ** level by `block_levels`.  Every body drifts on the finest step, but
+    only the bodies at the end of their own step are kicked, and forces are recomputed for those bodies alone, so a
+    tight binary or close encounter no longer sets the cost of every other body.  Levels are chosen again at the
+    start of each call, when all the bodies are synchronised.
+    """
+    forces()
+    levels = block_levels(store, dt)
+    ticks = 2 ** levels.max()
+    length = ticks // 2 ** levels  # Each body's step, in ticks
+    backend.kick(store, dt * length / ticks / 2)
+    for tick in range(1, ticks + 1):
+        backend.drift(store, dt / ticks)
+        active = np.flatnonzero(tick % length == 0)
+        forces(active)
+        backend.kick(store, dt * length[active] / ticks / (2 if tick == ticks else 1), active)
+
+
+# Each integrator advances every body by dt with the kick and drift kernels of `backend`, calling `forces()` whenever
+# the accelerations must be recomputed, or `forces(indices)` when only the accelerations of some bodies are needed
+integrators = {"Euler": euler, "Leapfrog": leapfrog, "Yoshida": yoshida, "Block": block}
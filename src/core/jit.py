@@ -0,0 +1,143 @@
+"""The "Numba" backend: the kernels of `kernels` as compiled loops, with no temporary arrays.
+
+Numba is optional.  Without it `available` is False and `backends` hands out the NumPy backend in its place; the
+loops below still run, uncompiled, which is only useful for checking them on a handful of bodies.  Numba itself is
+only imported, and each loop compiled, the first time the loop runs, so that processes which never use this backend
+(headless workers, most of all) do not pay for importing it.
+"""
+import importlib.util, math
+import numpy as np
+
+from . import constants
+from .constants import C, K
+
+available = importlib.util.find_spec("numba") is not None
+_compiled = {}
+
+
+def _jit(loop):
+    """`loop`, compiled the first time it is called."""
+    def run(*args):
+        if loop not in _compiled:
+            if available:
+                from numba import njit
+                _compiled[loop] = njit(cache=True)(loop)
+            else:
+                _compiled[loop] = loop
+        return _compiled[loop](*args)
+    return run
+
+
+@_jit
+def _accelerations(position, velocity, mass0, charge, G, targets, newtonian_beta):
+    n, araw = len(mass0), np.zeros((len(targets), 2))
+    for t in range(len(targets)):
+        i = targets[t]
+        specific_charge = K * charge[i] / mass0[i] if mass0[i] != 0 else 0.
+        ax = ay = 0.
+        for j in range(n):
+            dx, dy = position[j, 0] - position[i, 0], position[j, 1] - position[i, 1]
+            r2 = dx * dx + dy * dy
+            if r2 == 0:
+                continue
+            f = (G * mass0[j] - specific_charge * charge[j]) / (r2 * math.sqrt(r2))
+            ax += f * dx
+            ay += f * dy
+        vx, vy = velocity[i, 0], velocity[i, 1]
+        v2 = vx * vx + vy * vy
+        if v2 >= (newtonian_beta * C) ** 2:  # The relativistic correction of `Body.force_of`
+            gamma = 1 / math.sqrt(abs(1 - v2 / C ** 2))
+            along = gamma ** 3 / C ** 2 * (vx * ax + vy * ay)
+            ax, ay = along * vx + gamma * ax, along * vy + gamma * ay
+        araw[t, 0], araw[t, 1] = ax, ay
+    return araw
+
+
+@_jit
+def _kick(velocity, acceleration, dt, targets, newtonian_beta):
+    slow = newtonian_beta * C
+    for t in range(len(targets)):
+        i, step = targets[t], dt[t % len(dt)]
+        dvx, dvy = acceleration[i, 0] * step, acceleration[i, 1] * step
+        dv2, v2 = dvx * dvx + dvy * dvy, velocity[i, 0] ** 2 + velocity[i, 1] ** 2
+        if v2 < slow * slow and (velocity[i, 0] + dvx) ** 2 + (velocity[i, 1] + dvy) ** 2 < slow * slow:
+            velocity[i, 0] += dvx
+            velocity[i, 1] += dvy
+            continue
+        scale = 1 / math.sqrt(1 + dv2 / C ** 2)
+        velocity[i, 0] += dvx * scale
+        velocity[i, 1] += dvy * scale
+        speed = math.sqrt(velocity[i, 0] ** 2 + velocity[i, 1] ** 2)
+        if speed >= C:
+            velocity[i, 0] *= .999999999999 * C / speed
+            velocity[i, 1] *= .999999999999 * C / speed
+
+
+@_jit
+def _drift(position, velocity, mass, mass0, radius, density, dt, newtonian_beta):
+    for i in range(len(mass)):
+        v2 = velocity[i, 0] ** 2 + velocity[i, 1] ** 2
+        contraction = 1. if v2 < (newtonian_beta * C) ** 2 else math.sqrt(abs(1 - v2 / C ** 2))
+        position[i, 0] += velocity[i, 0] * dt * contraction
+        position[i, 1] += velocity[i, 1] * dt * contraction
+        mass[i] = mass0[i] / contraction
+        radius[i] = (mass[i] / density[i]) ** (1 / 3)
+
+
+@_jit
+def _overlaps(position, radius, order, low, high, out):
+    """Sweep along x over the bodies sorted by the left edge of their box: count the overlapping pairs, or write them
+    to `out` when it has room for all of them."""
+    count = 0
+    for a in range(len(order)):
+        i = order[a]
+        for b in range(a + 1, len(order)):
+            j = order[b]
+            if low[j] >= high[i]:
+                break
+            dx, dy, reach = position[i, 0] - position[j, 0], position[i, 1] - position[j, 1], radius[i] + radius[j]
+            if dx * dx + dy * dy < reach * reach:
+                if len(out):
+                    out[count, 0], out[count, 1] = min(i, j), max(i, j)
+                count += 1
+    return count
+
+
+def _targets(store, targets):
+    return np.arange(len(store)) if targets is None else np.asarray(targets, dtype=np.int64)
+
+
+def accelerations(store, G, targets=None):
+    """Acceleration of every body (or those at `targets`) from gravity and Coulomb's law, with the relativistic
+    correction, as in `kernels.accelerations`."""
+    return _accelerations(store.live("position"), store.live("velocity"), store.live("mass0"), store.live("charge"),
+                          float(G), _targets(store, targets), constants.newtonian_beta)
+
+
+def kick(store, dt, targets=None):
+    """Velocity half of `Body.apply_motion`.  `dt` may be one time step per target."""
+    _kick(store.live("velocity"), store.live("acceleration"), np.atleast_1d(np.asarray(dt, dtype=float)),
+          _targets(store, targets), constants.newtonian_beta)
+
+
+def drift(store, dt):
+    """Position half of `Body.apply_motion`, with the relativistic mass and the radius it gives."""
+    _drift(store.live("position"), store.live("velocity"), store.live("mass"), store.live("mass0"),
+           store.live("radius"), store.live("density"), float(dt), constants.newtonian_beta)
+
+
+def apply_motion(store, time_factor):
+    kick(store, time_factor)
+    drift(store, time_factor)
+
+
+class BroadPhase:
+    """Sweep and prune along x."""
+    def pairs(self, position, radius):
+        """All index pairs (i, j) with i < j whose bodies overlap, ordered by i."""
+        low, high = position[:, 0] - radius, position[:, 0] + radius
+        order = np.argsort(low, kind="stable")
+        count = _overlaps(position, radius, order, low, high, np.empty((0, 2), dtype=np.int64))
+        pairs = np.empty((count, 2), dtype=np.int64)
+        _overlaps(position, radius, order, low, high, pairs)
+        return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
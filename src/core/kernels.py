@@ -0,0 +1,124 @@
+from .constants import *
+from . import constants
+from .spatial_hash import SpatialHash as BroadPhase  # The collision broad phase of the NumPy backend
+import numpy as np
+
+# Upper bound on the number of pair interactions evaluated at once; keeps temporary arrays to a few tens of MB.
+block_size = 2 ** 21
+
+
+def _rows_per_block(n):
+    return max(1, block_size // max(n, 1))
+
+
+def lorentz_factor(velocity):
+    # Matches `1 / abs(cmath.sqrt(1 - (v / C) ** 2))` in `Body`, which stays finite (if meaningless) for v > C
+    with np.errstate(divide="ignore"):
+        return 1 / np.sqrt(np.abs(1 - (velocity ** 2).sum(axis=1) / C ** 2))
+
+
+def newtonian(velocity):
+    """Which bodies are slow enough (below `constants.newtonian_beta` of C) to skip the relativistic terms."""
+    return (velocity ** 2).sum(axis=1) < (constants.newtonian_beta * C) ** 2
+
+
+def relativistic(velocity, araw):
+    """Vectorized form of the correction applied at the end of `Body.force_of`, one row per body.  Rows of slow bodies
+    are returned as they are, and the others are corrected in place."""
+    fast = ~newtonian(velocity)
+    if fast.all():
+        gammav = lorentz_factor(velocity)[:, None]
+        return gammav ** 3 / C ** 2 * (velocity * araw).sum(axis=1)[:, None] * velocity + gammav * araw
+    if fast.any():
+        v, a = velocity[fast], araw[fast]
+        gammav = lorentz_factor(v)[:, None]
+        araw[fast] = gammav ** 3 / C ** 2 * (v * a).sum(axis=1)[:, None] * v + gammav * a
+    return araw
+
+
+def rows(targets):  # Index selecting the rows of `targets`, or every row for None
+    return slice(None) if targets is None else targets
+
+
+def accelerations(store, G, targets=None):
+    """Acceleration of every body (or those at `targets`) from gravity and Coulomb's law, with the relativistic correction.
+
+    Body i receives `sum(body.force_of(other, G))` over every other body: G m_j / r^2 towards each body j, and
+    K q_i q_j / (m_i r^2) away from it, so that the forces between any two bodies are equal and opposite and momentum
+    is conserved.  The correction is linear in the raw acceleration, so it is applied once per body to the summed raw
+    acceleration instead of once per pair.
+    """
+    araw = raw_accelerations(store.live("position"), store.live("mass0"), store.live("charge"), G, targets)
+    return relativistic(store.live("velocity")[rows(targets)], araw)
+
+
+def raw_accelerations(position, mass0, charge, G, targets=None):
+    """Acceleration of the bodies at `targets` (an index array or slice; all by default) from all bodies, before the
+    relativistic correction."""
+    targets = np.arange(len(position))[rows(targets)]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        specific_charge = np.where(mass0[targets] != 0, K * charge[targets] / mass0[targets], 0)
+    araw, per_block = np.zeros((len(targets), 2)), _rows_per_block(len(position))
+    for start in range(0, len(targets), per_block):
+        block = targets[start:start + per_block]
+        d = position[None, :, :] - position[block, None, :]
+        r2 = (d ** 2).sum(axis=2)
+        with np.errstate(divide="ignore"):
+            inv_r3 = np.where(r2 > 0, r2, np.inf) ** -1.5
+        w = (G * mass0[None, :] - specific_charge[start:start + per_block, None] * charge[None, :]) * inv_r3
+        araw[start:start + per_block] = np.einsum("ij,ijk->ik", w, d)
+    return araw
+
+
+def apply_motion(store, time_factor):
+    """Vectorized `Body.apply_motion` for every body in the store."""
+    kick(store, time_factor)
+    drift(store, time_factor)
+
+
+def kick(store, dt, targets=None):
+    """Velocity half of `Body.apply_motion`: accelerate, with the velocity kept below C.  `dt` may be one time step
+    per target."""
+    targets = rows(targets)
+    velocity, acceleration = store.live("velocity")[targets], store.live("acceleration")[targets]
+    dt = np.reshape(dt, (-1, 1))
+    dv = acceleration * dt
+    fast = ~(newtonian(velocity) & newtonian(velocity + dv))  # Bodies slow before and after keep dv as it is
+    if fast.any():
+        a = np.sqrt((dv[fast] ** 2).sum(axis=1))[:, None]
+        dv[fast] /= np.sqrt(1 + (a / C) ** 2)
+    velocity += dv
+    if fast.any():
+        speed = np.sqrt((velocity ** 2).sum(axis=1))
+        too_fast = speed >= C
+        velocity[too_fast] *= .999999999999 * C / speed[too_fast, None]
+    store.live("velocity")[targets] = velocity
+
+
+def drift(store, dt):
+    """Position half of `Body.apply_motion`: move with the current velocity, and update the relativistic mass."""
+    velocity = store.live("velocity")
+    contraction = np.ones(len(velocity))
+    fast = ~newtonian(velocity)
+    contraction[fast] = np.sqrt(np.abs(1 - (velocity[fast] ** 2).sum(axis=1) / C ** 2))
+    store.live("position")[:] += velocity * dt * contraction[:, None]
+    store.live("mass")[:] = store.live("mass0") / contraction
+    update_radii(store)
+
+
+def update_radii(store):
+    store.live("radius")[:] = np.cbrt(store.live("mass") / store.live("density"))
+
+
+def colliding_pairs(store):
+    """All index pairs (i, j) with i < j whose bodies overlap, ordered by i."""
+    n = len(store)
+    position, radius = store.live("position"), store.live("radius")
+    pairs, rows = [], _rows_per_block(n)
+    for start in range(0, n, rows):
+        end = min(start + rows, n)
+        d2 = ((position[None, :, :] - position[start:end, None, :]) ** 2).sum(axis=2)
+        reach = (radius[None, :] + radius[start:end, None]) ** 2
+        i, j = np.nonzero((d2 < reach) & (np.arange(n)[None, :] > np.arange(start, end)[:, None]))
+        pairs.append(np.stack((i + start, j), axis=1))
+    return np.concatenate(pairs) if pairs else np.empty((0, 2), dtype=int)
@@ -0,0 +1,98 @@
+from multiprocessing import get_context, shared_memory
+from . import kernels
+import numpy as np
+import atexit, os
+
+workers = os.cpu_count() or 1  # Size of the pool used by the "Parallel" force solver
+tile_rows = 256  # Rows of the interaction matrix per task; fixed so that results do not depend on the worker count
+
+_shared_columns = ("position", "mass0", "charge", "araw")
+_attached = {}  # The shared arrays a worker is attached to, by the names of their blocks
+
+
+def _shape(column, capacity):
+    return (capacity, 2) if column in ("position", "araw") else (capacity,)
+
+
+def _attach(names, capacity):
+    if names not in _attached:
+        for blocks, arrays in _attached.values():  # The parent has replaced these with larger ones
+            arrays.clear()
+            for block in blocks:
+                block.close()
+        _attached.clear()
+        blocks = [shared_memory.SharedMemory(name=name) for name in names]  # Owned and unlinked by the parent
+        _attached[names] = blocks, [np.ndarray(_shape(c, capacity), buffer=b.buf) for c, b in zip(_shared_columns, blocks)]
+    return _attached[names][1]
+
+
+def _tile(names, capacity, n, G, start, end, targets=None):
+    position, mass0, charge, araw = _attach(names, capacity)
+    rows = slice(start, end) if targets is None else targets
+    araw[start:end] = kernels.raw_accelerations(position[:n], mass0[:n], charge[:n], G, rows)
+
+
+class ParallelSolver:
+    """Direct-sum forces split into tiles of rows across a pool of processes.
+
+    Positions, masses and charges are copied once per step into shared memory, which the workers read in place, and
+    each task writes its rows of raw acceleration straight back into a shared array; only the tile bounds (and, when
+    only some bodies need forces, their indices) are sent to the workers.  Every row is summed by a single task in a
+    fixed order, so results are bitwise identical for any number of workers.
+    """
+    def __init__(self, workers=workers):
+        self.workers, self.pool, self.capacity, self.blocks, self.arrays = workers, None, 0, [], {}
+        atexit.register(self.close)
+
+    def _reserve(self, n):
+        if n <= self.capacity and self.blocks:
+            return
+        self._release()
+        self.capacity = max(n, 2 * self.capacity, tile_rows)
+        for c in _shared_columns:
+            shape = _shape(c, self.capacity)
+            self.blocks.append(shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 8))
+            self.arrays[c] = np.ndarray(shape, buffer=self.blocks[-1].buf)
+
+    def _release(self):
+        self.arrays = {}
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def accelerations(self, store, G, targets=None):
+        n = len(store)
+        targets = None if targets is None else np.arange(n)[targets]
+        m = n if targets is None else len(targets)
+        if n < 2:
+            return np.zeros((m, 2))
+        if self.pool is None:
+            self.pool = get_context("spawn").Pool(self.workers)
+        self._reserve(n)
+        for c in _shared_columns[:3]:
+            self.arrays[c][:n] = store.live(c)
+        names = tuple(block.name for block in self.blocks)
+        tiles = [(names, self.capacity, n, G, start, min(start + tile_rows, m),
+                  None if targets is None else targets[start:start + tile_rows]) for start in range(0, m, tile_rows)]
+        self.pool.starmap(_tile, tiles)
+        return kernels.relativistic(store.live("velocity")[kernels.rows(targets)], self.arrays["araw"][:m].copy())
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+        self._release()
+
+
+_solver = None
+
+
+def accelerations(store, G, theta=None, targets=None):
+    """The "Parallel" force solver: `kernels.accelerations` computed on `workers` processes."""
+    global _solver
+    if _solver is None or _solver.workers != workers:
+        if _solver is not None:
+            _solver.close()
+        _solver = ParallelSolver(workers)
+    return _solver.accelerations(store, G, targets)
@@ -1,67 +1,181 @@
 from .Body import *
 from .constants import *
-import cmath
+import numpy as np
+
+
+def charges(mass, rng):
+    """Random integer charges between -mass and mass, as drawn by `Body`, and none for bodies under unit mass."""
+    low = np.trunc(-mass)
+    return np.where(mass >= 1, rng.integers(low, np.maximum(np.trunc(mass), low + 1)), 0)
+
+
+def bodies(mass, position, velocity, density, rng, charge=None, names=None):
+    """A `BodyStore` of the given bodies, built a column at a time rather than one `Body` at a time.
+
+    Each argument is an array with one row per body (or a single value for all of them).  As in `Body`, charges not
+    given are random integers between -mass and mass, and each body is colored by the sign of its charge.  `names`
+    maps indices to the names of the few bodies that have one.
+    """
+    mass = np.asarray(mass, dtype=float)
+    n, names = len(mass), names or {}
+    if charge is None:
+        charge = charges(mass, rng)
+    charge = np.broadcast_to(np.asarray(charge, dtype=float), (n,))
+    columns = {"position": np.broadcast_to(position, (n, 2)).astype(float),
+               "velocity": np.broadcast_to(velocity, (n, 2)).astype(float), "acceleration": np.zeros((n, 2)),
+               "mass0": mass, "mass": mass.copy(), "charge": charge.copy(),
+               "density": np.broadcast_to(np.asarray(density, dtype=float), (n,)).copy()}
+    columns["radius"] = np.floor(np.cbrt(mass / columns["density"]))
+    sign = charge[:, None]
+    columns["color"] = np.select([sign < 0, sign == 0], [(0, 0, 255), (0, 255, 0)], (255, 0, 0)).astype(float)
+    return BodyStore.from_columns(columns, lambda store, i: Body.view(store, i, names.get(i)))
+
+
+def around(centre, distance, angle):
+    """Positions at `distance` and `angle` (counterclockwise on screen) from `centre`, and the unit vectors of
+    counterclockwise motion there."""
+    cos_a, sin_a = np.cos(angle), np.sin(angle)
+    position = np.stack([centre[0] + distance * cos_a, centre[1] - distance * sin_a], axis=1)
+    return position, np.stack([sin_a, cos_a], axis=1)
+
+
+def rings(r, mass, n=256, angles=64):
+    """The smooth field of bodies spread evenly around a centre, at radii `r` from it: the pull towards the centre
+    and the potential, without G, at each body's radius, from the bodies grouped into `n` rings of equal numbers."""
+    order = np.argsort(r)
+    groups = np.array_split(order, min(n, len(r)))
+    radius = np.array([r[g].mean() for g in groups])
+    ring_mass = np.array([mass[g].sum() for g in groups])
+    soft = np.diff(radius).mean() / 2 if len(radius) > 1 else 1.  # Keeps a ring from acting on itself at r = 0
+    phi = (np.arange(angles) + .5) * 2 * pi / angles
+    dx = radius[None, :, None] * np.cos(phi) - radius[:, None, None]  # From each ring's radius on the x axis
+    dy = radius[None, :, None] * np.sin(phi)
+    inv_d = 1 / np.sqrt(dx ** 2 + dy ** 2 + soft ** 2)
+    weight = ring_mass[None, :, None] / angles
+    pull, potential = -(weight * dx * inv_d ** 3).sum(axis=(1, 2)), -(weight * inv_d).sum(axis=(1, 2))
+    return np.interp(r, radius, pull), np.interp(r, radius, potential)
 
 
 class Preset:
-    def __init__(self, dims, num, mass_range, *args):
+    def __init__(self, dims, num, mass_range, *args, seed=None):
         self.num, (self.width, self.height), self.m_range = num, dims, mass_range
+        self.rng = np.random.default_rng(seed)
         self.extra_args(*args)
 
     def preset(self, preset_type, *args):
-        return generate_bodies(getattr(self, preset_type)(*args))
+        return getattr(self, preset_type)(*args)
+
+    def masses(self, n):
+        return self.rng.uniform(*self.m_range, n)
+
+    def centre(self):
+        return self.width / 2, self.height / 2
 
 
 class Gradient(Preset):
     def extra_args(self, colors):
-        self.colors = colors
+        self.colors = colors  # Bodies are colored by charge, so these only tell the two halves apart in the settings
+
+    def halves(self, x_range):
+        """Bodies alternating between the left (even) and right (odd) halves, as the presets always placed them."""
+        n, rng = self.num // 2 * 2, self.rng
+        side = np.arange(n) % 2
+        low, high = x_range(side)
+        position = np.stack([rng.uniform(low, high, n), rng.uniform(0, self.height, n)], axis=1)
+        return self.masses(n), position, rng.uniform(-1, 1, (n, 2)), side
 
     def Diffusion(self):
-        return [(uniform(*self.m_range),
-                 (uniform(self.width * y / 2, self.width * (y + 1) / 2 - 1), uniform(0, self.height)),
-                 (uniform(-1, 1), uniform(-1, 1)), Density, self.colors[y]) for _ in range(self.num // 2) for y in
-                (0, 1)]
+        mass, position, velocity, _ = self.halves(lambda side: (self.width * side / 2, self.width * (side + 1) / 2 - 1))
+        return bodies(mass, position, velocity, Density, self.rng)
 
     def Density(self, densities):
-        return [(uniform(*self.m_range), (uniform(0, self.width), uniform(0, self.height)),
-                 (uniform(-1, 1), uniform(-1, 1)), densities[y], self.colors[y]) for _ in range(self.num // 2) for y in
-                (0, 1)]
+        mass, position, velocity, side = self.halves(lambda side: (0, self.width))
+        return bodies(mass, position, velocity, np.take(densities, side), self.rng)
 
 
 class System(Preset):
     def extra_args(self, dist_range, planet_density=Density):
         self.d_range, self.density = dist_range, planet_density
 
+    def planets(self):
+        """Positions of `num` planets spread uniformly in distance and angle around the centre, and the unit vectors of
+        circular motion there."""
+        return around(self.centre(), self.rng.uniform(*self.d_range, self.num), self.rng.uniform(-pi, pi, self.num))
+
     def Cluster(self):
-        bodies = []
-        for x in range(self.num):
-            mass, distance, angle = uniform(*self.m_range), uniform(*self.d_range), uniform(-pi, pi)
-            position = (self.width / 2 + distance * cos(angle), self.height / 2 - distance * sin(angle))
-            velocity = (uniform(-2, 2), uniform(-2, 2))
-            bodies.append((mass, position, velocity, self.density, None, "Planet " + str(x)))
-        return bodies
+        position, _ = self.planets()
+        return bodies(self.masses(self.num), position, self.rng.uniform(-2, 2, (self.num, 2)), self.density, self.rng,
+                      names={i: "Planet " + str(i) for i in range(self.num)})
 
     def Unary(self, star_mass, star_density, circular=True):
-        bodies = [(star_mass, (self.width / 2, self.height / 2), (0,0), star_density, (255, 255, 0), "Star")]
-        for x in range(self.num):
-            mass = uniform(*self.m_range)
-            distance = uniform(*self.d_range)
-            angle = uniform(-pi, pi)
-            position = (self.width / 2 + distance * cos(angle), self.height / 2 - distance * sin(angle))
-            if circular:
-                speed = .0000000001*C
-                velocity = (speed * sin(angle), speed * cos(angle))
-            else:
-                velocity = (uniform(-2, 2), uniform(-2, 2))
-            bodies.append((mass, position, velocity, self.density, None, "Planet " + str(x)))
-        return bodies
+        position, tangent = self.planets()
+        velocity = .0000000001 * C * tangent if circular else self.rng.uniform(-2, 2, (self.num, 2))
+        mass = np.concatenate([[star_mass], self.masses(self.num)])
+        charge = charges(mass, self.rng)
+        charge[0] = -star_mass
+        return bodies(mass, np.concatenate([[self.centre()], position]), np.concatenate([[(0, 0)], velocity]),
+                      np.concatenate([[star_density], np.full(self.num, self.density)]), self.rng,
+                      charge, {i: "Planet " + str(i - 1) if i else "Star" for i in range(self.num + 1)})
 
     def Binary(self, star_masses, star_density):
-        stars, distance = [[m, [0, 0], [0, 0], star_density] for m in star_masses], uniform(*self.d_range)
-        for s in 0, 1:
-            stars[s][1] = V2(self.width / 2 + (-4 if s else 4) * (star_masses[s] / star_density) ** (1 / 3),
-                             self.height / 2)
-            stars[s][2] = V2(0, (1 - 2 * s) * sqrt(G * star_masses[1 - s] / distance))
-        return stars + [((uniform(*self.m_range), (
-            self.width / 2 + uniform(-distance, distance), self.height / 2 + uniform(-distance, distance)),
-                          (uniform(-1, 1), uniform(-1, 1)), self.density)) for _ in range(self.num)]
+        star_masses, distance, (x, y) = np.asarray(star_masses, float), self.rng.uniform(*self.d_range), self.centre()
+        offset, speed = 4 * np.cbrt(star_masses / star_density), np.sqrt(G * star_masses[::-1] / distance)
+        stars = np.array([[x + offset[0], y], [x - offset[1], y]])
+        star_velocity = np.array([[0, speed[0]], [0, -speed[1]]])
+        position = np.stack([x + self.rng.uniform(-distance, distance, self.num),
+                             y + self.rng.uniform(-distance, distance, self.num)], axis=1)
+        return bodies(np.concatenate([star_masses, self.masses(self.num)]), np.concatenate([stars, position]),
+                      np.concatenate([star_velocity, self.rng.uniform(-1, 1, (self.num, 2))]),
+                      np.concatenate([[star_density] * 2, np.full(self.num, self.density)]), self.rng)
+
+
+class Galaxy(Preset):
+    """Large systems in equilibrium under their own gravity (with the constant G), for many thousands of bodies.
+
+    Their bodies are neutral, as random charges would pull far harder than gravity and pull them apart.
+    """
+    def extra_args(self, scale, density=Density):
+        self.scale, self.density = scale, density
+
+    def Disk(self, core_mass, core_density):
+        """An exponential disk, with surface density falling off as exp(-r / scale), around a central mass.  Every body
+        starts on the circular orbit for the pull of the core and of the whole disk (see `rings`), which in a flat disk
+        is not the pull of the mass inside it alone."""
+        mass, h = self.masses(self.num), self.scale
+        r = self.rng.gamma(2, h, self.num)  # The radius of a uniformly chosen point of the disk's mass
+        position, tangent = around(self.centre(), r, self.rng.uniform(-pi, pi, self.num))
+        pull = core_mass / r ** 2 + rings(r, mass)[0]
+        velocity = np.sqrt(G * np.maximum(pull, 0) * r)[:, None] * tangent
+        return bodies(np.concatenate([[core_mass], mass]), np.concatenate([[self.centre()], position]),
+                      np.concatenate([[(0, 0)], velocity]),
+                      np.concatenate([[core_density], np.full(self.num, self.density)]), self.rng, 0, {0: "Core"})
+
+    def Plummer(self):
+        """A Plummer sphere of the given scale radius, seen flattened onto the plane of the simulation, with speeds
+        drawn from the sphere's and directions in the plane, all scaled so that the system is virialised in the plane:
+        twice its kinetic energy equals the magnitude of its potential energy (that of its smooth field, see `rings`)."""
+        mass, rng, n = self.masses(self.num), self.rng, self.num
+        r = self.scale / np.sqrt(rng.uniform(1e-6, .999, n) ** (-2 / 3) - 1)  # Inverts the mass within r
+        # Speeds as a fraction q of the escape speed, drawn from q^2 (1 - q^2)^3.5 by rejection
+        q = np.empty(n)
+        missing = np.arange(n)
+        while len(missing):
+            x, y = rng.uniform(0, 1, len(missing)), rng.uniform(0, .1, len(missing))
+            accepted = y < x ** 2 * (1 - x ** 2) ** 3.5
+            q[missing[accepted]] = x[accepted]
+            missing = missing[~accepted]
+        direction = self.directions(n)
+        flat = r * np.hypot(direction[:, 0], direction[:, 1])  # Distances from the centre once flattened
+        angle = rng.uniform(-pi, pi, n)
+        velocity = (q * np.sqrt(mass.sum() / np.sqrt(r ** 2 + self.scale ** 2)))[:, None] * np.stack(
+            [np.cos(angle), np.sin(angle)], axis=1)
+        kinetic = .5 * (mass * (velocity ** 2).sum(axis=1)).sum()
+        if kinetic:
+            velocity *= np.sqrt(-.5 * G * (mass * rings(flat, mass)[1]).sum() / (2 * kinetic))
+        return bodies(mass, r[:, None] * direction[:, :2] + self.centre(), velocity, self.density, rng, 0)
+
+    def directions(self, n):
+        """Uniformly random unit vectors in three dimensions."""
+        z, phi = self.rng.uniform(-1, 1, n), self.rng.uniform(-pi, pi, n)
+        s = np.sqrt(1 - z ** 2)
+        return np.stack([s * np.cos(phi), s * np.sin(phi), z], axis=1)
@@ -0,0 +1,96 @@
+from collections import deque
+from itertools import islice
+import csv, json, threading, time
+
+
+class _Phase:
+    __slots__ = ("profiler", "name", "path", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler, self.name = profiler, name
+
+    def __enter__(self):
+        profiler = self.profiler
+        profiler.stack.append(self.name)
+        self.path = "/".join(profiler.stack)
+        if self.path not in profiler.seen:
+            with profiler.lock:
+                if self.path not in profiler.seen:
+                    profiler.seen.add(self.path)
+                    profiler.phases.append(self.path)
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        elapsed, profiler = time.perf_counter() - self.start, self.profiler
+        profiler.stack.pop()
+        with profiler.lock:
+            profiler.times[self.path] = profiler.times.get(self.path, 0) + elapsed
+
+
+class _Disabled:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+_disabled = _Disabled()
+
+
+class Profiler:
+    """Wall-clock time spent in each phase of a frame.
+
+    Code to be timed runs inside `with profiler.phase(name):`; phases nest, and each is recorded under its path from
+    the outermost phase, e.g. "handle_bodies/integration/forces".  Each thread nests its own phases, and `lock` guards
+    the times they add to, so a simulation stepping on a thread of its own can share the profiler of the display.  `end_frame` closes a frame,
+    and the last `window` frames are averaged for display.  Disabled profilers hand out a shared no-op context, so instrumented code costs
+    almost nothing when nobody is looking.
+    """
+    def __init__(self, enabled=False, window=60, history=100000):
+        self.enabled, self.window = enabled, window
+        self.threads, self.times, self.frames = threading.local(), {}, deque(maxlen=history)
+        self.lock = threading.Lock()
+        self.phases, self.seen = [], set()  # Every phase path seen, in the order first entered
+        self.start = time.perf_counter()
+
+    @property
+    def stack(self):  # The phases entered and not yet left on the calling thread
+        return self.threads.__dict__.setdefault("stack", [])
+
+    def phase(self, name):
+        return _Phase(self, name) if self.enabled else _disabled
+
+    def end_frame(self, **counters):
+        """Record the phase times since the last call, with any counters (body count, steps) to keep alongside."""
+        now = time.perf_counter()
+        with self.lock:
+            times, self.times = self.times, {}
+        if self.enabled:
+            self.frames.append(dict(times, frame=now - self.start, **counters))
+        self.start = now
+
+    def recent(self):
+        return list(islice(self.frames, max(len(self.frames) - self.window, 0), None))
+
+    def averages(self):
+        """Mean time of each phase per frame over the last `window` frames, and the frame rate over them."""
+        frames = self.recent()
+        if not frames:
+            return {}, 0
+        averages = {path: sum(f.get(path, 0) for f in frames) / len(frames) for path in self.phases}
+        return averages, len(frames) / max(sum(f["frame"] for f in frames), 1e-9)
+
+    def export(self, filename):
+        """Write every recorded frame to a .json file, or to CSV for any other extension."""
+        columns = ["frame"] + sorted({k for f in self.frames for k in f} - {"frame"} - set(self.phases)) + self.phases
+        if filename.endswith(".json"):
+            with open(filename, "w") as outfile:
+                json.dump({"columns": columns, "frames": list(self.frames)}, outfile)
+            return
+        with open(filename, "w", newline="") as outfile:
+            writer = csv.DictWriter(outfile, columns, restval=0)
+            writer.writeheader()
+            writer.writerows(self.frames)
@@ -0,0 +1,44 @@
+"""The "Python" backend: the kernels of `kernels`, computed one `Body` at a time with its own methods.
+
+It is far too slow for large simulations, but it is the definition the other backends are checked against.
+"""
+import numpy as np
+
+from .constants import V2
+
+
+def _bodies(store, targets):
+    return list(store) if targets is None else [store[i] for i in targets]
+
+
+def accelerations(store, G, targets=None):
+    """Acceleration of every body (or those at `targets`), summed pair by pair with `Body.force_of`."""
+    bodies = list(store)
+    return np.array([tuple(sum((b.force_of(o, G) for o in bodies if o is not b), V2(0, 0)))
+                     for b in _bodies(store, targets)]).reshape(-1, 2)
+
+
+def kick(store, dt, targets=None):
+    bodies = _bodies(store, targets)
+    for body, step in zip(bodies, np.broadcast_to(dt, (len(bodies),)).tolist()):
+        body.kick(step)
+
+
+def drift(store, dt):
+    for body in store:
+        body.drift(dt)
+
+
+def apply_motion(store, time_factor):
+    for body in store:
+        body.apply_motion(time_factor)
+
+
+class BroadPhase:
+    """Every pair of bodies, put through the test of `Body.test_collision`."""
+    def pairs(self, position, radius):
+        """All index pairs (i, j) with i < j whose bodies overlap, ordered by i."""
+        p, r, n = position.tolist(), radius.tolist(), len(radius)
+        pairs = [(i, j) for i in range(n) for j in range(i + 1, n)
+                 if (p[i][0] - p[j][0]) ** 2 + (p[i][1] - p[j][1]) ** 2 < (r[i] + r[j]) ** 2]
+        return np.array(pairs, dtype=int).reshape(-1, 2)
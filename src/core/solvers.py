@@ -0,0 +1,17 @@
+from . import kernels, barnes_hut, parallel
+
+
+def direct(store, G, theta=None, targets=None, backend=kernels):  # Exact O(N^2) sum; `theta` is for tree solvers
+    return backend.accelerations(store, G, targets)
+
+
+# Interchangeable ways of computing the accelerations of every body (or of the bodies at `targets`) from gravity and
+# Coulomb's law
+force_solvers = {"Direct": direct, "Barnes-Hut": barnes_hut.accelerations, "Parallel": parallel.accelerations}
+
+
+def accelerations(store, G, solver="Direct", theta=.5, targets=None, backend=kernels):
+    """The "Direct" sum is computed by `backend`; the other solvers have kernels of their own."""
+    if solver == "Direct":
+        return direct(store, G, theta, targets, backend)
+    return force_solvers[solver](store, G, theta, targets)
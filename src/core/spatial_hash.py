@@ -0,0 +1,165 @@
+import numpy as np
+
+# Neighbouring cells that are searched from each cell; the other half of the 3x3 block is covered from the other side
+half_neighbourhood = ((1, -1), (1, 0), (1, 1), (0, 1))
+
+
+def _expand(first, counts):
+    """Concatenation of `range(first[k], first[k] + counts[k])` for every k."""
+    offsets = np.r_[0, np.cumsum(counts)[:-1]]
+    return np.repeat(first - offsets, counts) + np.arange(counts.sum())
+
+
+def nearest_distances(position):
+    """Distance from every body to its nearest neighbour (infinite for a lone body).
+
+    Bodies are binned into a grid with about one body per cell and compared with the bodies in the 3x3 block of cells
+    around them.  A neighbour found that way is the nearest if it is closer than one cell width; the few bodies left
+    without one (isolated bodies far from the rest) are compared with everything.
+    """
+    n = len(position)
+    nearest = np.full(n, np.inf)
+    if n < 2:
+        return nearest
+    low, high = position.min(axis=0), position.max(axis=0)
+    area, side = np.prod(high - low), (high - low).max()
+    cell = (area / n) ** .5 if area > 0 else side / n if side > 0 else 1
+    ix, iy = ((position - low) // cell).astype(np.int64).T + 1  # Padded, so that neighbouring keys never wrap
+    rows = iy.max() + 2
+    keys = ix * rows + iy
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    for dx in -1, 0, 1:
+        for dy in -1, 0, 1:
+            neighbour = keys + dx * rows + dy
+            first = np.searchsorted(sorted_keys, neighbour)
+            counts = np.searchsorted(sorted_keys, neighbour, side="right") - first
+            i, j = np.repeat(np.arange(n), counts), order[_expand(first, counts)]
+            d2 = ((position[i] - position[j]) ** 2).sum(axis=1)
+            np.minimum.at(nearest, i, np.where(i != j, d2, np.inf))
+    nearest = np.sqrt(nearest)
+    for i in np.flatnonzero(~(nearest <= cell)):
+        d2 = ((position - position[i]) ** 2).sum(axis=1)
+        d2[i] = np.inf
+        nearest[i] = np.sqrt(d2.min())
+    return nearest
+
+
+class SpatialHash:
+    """Uniform grid broad phase for collision detection.
+
+    Cells are as wide as the largest body of ordinary size, so overlapping bodies are always in the same or
+    adjacent cells.  Bodies more than `outlier_ratio` times the median radius (stars, heavily merged bodies) are
+    tested against everything directly instead.  The grid is kept as a list of bodies sorted by cell, and each
+    rebuild starts from the previous order, which is already almost sorted.
+    """
+    def __init__(self, outlier_ratio=4):
+        self.outlier_ratio, self.order = outlier_ratio, None
+
+    def _sort(self, keys):
+        if self.order is None or len(self.order) != len(keys):
+            self.order = np.argsort(keys, kind="stable")
+        else:
+            self.order = self.order[np.argsort(keys[self.order], kind="stable")]
+        return self.order
+
+    def pairs(self, position, radius):
+        """All index pairs (i, j) with i < j whose bodies overlap, ordered by i."""
+        n = len(position)
+        if n < 2 or not radius.max() > 0:
+            return np.empty((0, 2), dtype=int)
+        outlier = radius > self.outlier_ratio * np.median(radius)
+        large, small = np.flatnonzero(outlier), np.flatnonzero(~outlier)
+        cell = 2 * radius[small].max()
+        if not cell > 0:  # Everything but the outliers is a point
+            small = small[:0]
+
+        cells = np.floor(position[small] / cell).astype(np.int64) if len(small) else np.zeros((0, 2), dtype=np.int64)
+        cells -= cells.min(axis=0, initial=0) - 1  # Leave an empty border so that neighbour keys never wrap around
+        height = cells[:, 1].max(initial=0) + 2
+        keys = cells[:, 0] * height + cells[:, 1]
+        order = self._sort(keys)
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        cell_keys, counts = sorted_keys[starts], np.diff(np.r_[starts, len(small)])
+
+        # Pairs within a cell, then pairs with each neighbouring cell
+        cell_of = np.repeat(np.arange(len(starts)), counts)
+        after = starts[cell_of] + counts[cell_of] - np.arange(len(small)) - 1
+        first, second = [np.repeat(np.arange(len(small)), after)], [_expand(np.arange(len(small)) + 1, after)]
+        for dx, dy in half_neighbourhood:
+            target = sorted_keys + dx * height + dy
+            found = np.searchsorted(cell_keys, target)
+            found[found == len(cell_keys)] = 0
+            hit = cell_keys[found] == target
+            number = np.where(hit, counts[found], 0)
+            first.append(np.repeat(np.arange(len(small)), number))
+            second.append(_expand(starts[found], number))
+        i, j = small[order[np.concatenate(first)]], small[order[np.concatenate(second)]]
+
+        # Large bodies against every other body
+        for b in large:
+            other = np.flatnonzero(~outlier | (np.arange(n) > b))
+            i, j = np.r_[i, np.full(len(other), b)], np.r_[j, other]
+
+        overlap = ((position[i] - position[j]) ** 2).sum(axis=1) < (radius[i] + radius[j]) ** 2
+        pairs = np.sort(np.stack((i[overlap], j[overlap]), axis=1), axis=1)
+        return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+
+class Grid:
+    """Bodies binned by centre into square cells, for finding the bodies at a point or inside a box.
+
+    Cells are at least as wide as the largest body of ordinary size, so any of those that covers a point has its
+    centre in the 3x3 block of cells around it; bodies more than `outlier_ratio` times the median radius are checked
+    directly.  Building the grid sorts the bodies once, in O(N log N), and each query then costs a few binary searches
+    plus the bodies it looks at.
+    """
+    def __init__(self, position, radius, outlier_ratio=4):
+        self.position, self.radius, n = position.copy(), radius.copy(), len(position)
+        outlier = radius > outlier_ratio * np.median(radius) if n else np.zeros(0, dtype=bool)
+        self.large = np.flatnonzero(outlier)
+        self.low = position.min(axis=0) if n else np.zeros(2)
+        span = position.max(axis=0) - self.low if n else np.zeros(2)
+        spacing = (np.prod(span) / n) ** .5 if n else 0  # About one body per cell
+        self.cell = max(2 * radius[~outlier].max(initial=0), spacing, span.max(initial=0) / 2 ** 20) or 1.
+        self.cells = ((position - self.low) // self.cell).astype(np.int64).T + 1 if n else np.zeros((2, 0), np.int64)
+        self.width, self.height = self.cells.max(axis=1, initial=0) + 2  # An empty border, so keys never wrap around
+        keys = self.cells[0] * self.height + self.cells[1]
+        self.order = np.argsort(keys, kind="stable")
+        self.keys = keys[self.order]
+
+    def __len__(self):
+        return len(self.position)
+
+    def _cell(self, point):
+        """The cell of a point, clamped to the border of the grid."""
+        cell = ((np.asarray(point, dtype=float) - self.low) // self.cell).astype(np.int64) + 1
+        return np.clip(cell, 0, (self.width - 1, self.height - 1))
+
+    def _columns(self, x, y_low, y_high):
+        """Indices of the bodies in cells (x[k], y_low[k]) to (x[k], y_high[k]) for every k."""
+        first = np.searchsorted(self.keys, x * self.height + y_low)
+        counts = np.searchsorted(self.keys, x * self.height + y_high, side="right") - first
+        return self.order[_expand(first, counts)]
+
+    def at(self, point):
+        """Index of the body covering `point` whose centre is nearest to it, or None."""
+        if not len(self):
+            return None
+        x, y = self._cell(point)
+        near = np.r_[self._columns(np.arange(x - 1, x + 2), np.full(3, y - 1), np.full(3, y + 1)), self.large]
+        d2 = ((self.position[near] - point) ** 2).sum(axis=1)
+        near, d2 = near[d2 < self.radius[near] ** 2], d2[d2 < self.radius[near] ** 2]
+        return int(near[np.argmin(d2)]) if len(near) else None
+
+    def within(self, corner, opposite):
+        """Indices, in order, of the bodies whose centres are inside the box between two opposite corners."""
+        low, high = np.minimum(corner, opposite), np.maximum(corner, opposite)
+        if not len(self):
+            return np.empty(0, dtype=int)
+        (x_low, y_low), (x_high, y_high) = self._cell(low), self._cell(high)
+        x = np.arange(x_low, x_high + 1)
+        found = self._columns(x, np.full(len(x), y_low), np.full(len(x), y_high))
+        inside = ((self.position[found] >= low) & (self.position[found] <= high)).all(axis=1)
+        return np.sort(found[inside])
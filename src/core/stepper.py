@@ -0,0 +1,95 @@
+"""Stepping a simulation on a thread of its own, at a fixed rate, for displays that draw at a rate of their own.
+
+The thread holds `Stepper.lock` during each step, and anything else that reads or changes the simulation must hold
+it too, taken with `Stepper.acquire` so that it gets a turn between steps.  Drawing needs no lock: after each step
+the thread publishes a `Snapshot` of what the render modes read, and `Stepper.frame` interpolates between the last
+two.  NumPy releases the interpreter lock in its larger operations, so
+steps of many bodies overlap with drawing even on one interpreter.
+"""
+import threading, time
+import numpy as np
+
+
+class Snapshot:
+    """Copies of the columns that the render modes read, taken after step `steps` at `time` (`time.perf_counter`).
+    It can be drawn in place of a `BodyStore`."""
+    names = ("position", "radius", "color", "mass", "charge", "id")
+
+    def __init__(self, store, steps, time):
+        self.columns, self.steps, self.time = {name: store.live(name).copy() for name in self.names}, steps, time
+
+    def live(self, name):
+        return self.columns[name]
+
+    def __len__(self):
+        return len(self.columns["id"])
+
+    def moved(self, position):
+        """This snapshot, with the bodies at `position` instead."""
+        snapshot = Snapshot.__new__(Snapshot)
+        snapshot.columns, snapshot.steps, snapshot.time = dict(self.columns, position=position), self.steps, self.time
+        return snapshot
+
+
+def interpolate(previous, latest, alpha):
+    """The bodies `alpha` (0 to 1) of the way from one snapshot to the next.  When bodies were added or removed in
+    between, there is nothing to match them with, and the later snapshot is used as it is."""
+    if previous is None or alpha >= 1 or not np.array_equal(previous.live("id"), latest.live("id")):
+        return latest
+    start = previous.live("position")
+    return latest.moved(start + alpha * (latest.live("position") - start))
+
+
+class Stepper:
+    """Calls `step` (by default `simulation.step`) on a daemon thread `rate` times a second, under `lock`.
+
+    Steps that take longer than 1 / `rate` run back to back, and the thread falls at most one step behind its
+    schedule rather than racing to catch up.  Once `acquire` has asked for the lock, the thread starts no new step
+    until it has been given it.  `snapshots` holds the last two snapshots as one tuple, so that a reader always gets
+    a matching pair, and a step never writes into a snapshot that is being drawn.
+    """
+    def __init__(self, simulation, rate, step=None):
+        self.simulation, self.rate, self.step = simulation, rate, step or simulation.step
+        self.lock, self.waiting, self.running, self.thread = threading.Lock(), threading.Event(), False, None
+        self.snapshots = None, Snapshot(simulation.bodies, simulation.steps, time.perf_counter())
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="physics", daemon=True)
+        self.thread.start()
+
+    def acquire(self):
+        """Take the lock if no step is running, without waiting, and return whether it was taken.  If it was not, the
+        thread pauses after the step that holds it until the next call, so that callers get a turn at least every
+        other call however long steps take."""
+        self.waiting.set()
+        if not self.lock.acquire(blocking=False):
+            return False
+        self.waiting.clear()
+        return True
+
+    def stop(self):
+        self.running = False
+        self.waiting.clear()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def run(self):
+        deadline = time.perf_counter()
+        while self.running:
+            while self.waiting.is_set() and self.running:
+                time.sleep(.0005)
+            with self.lock:
+                self.step()
+                snapshot = Snapshot(self.simulation.bodies, self.simulation.steps, time.perf_counter())
+            self.snapshots = self.snapshots[1], snapshot
+            deadline = max(deadline + 1 / self.rate, snapshot.time - 1 / self.rate)
+            time.sleep(max(deadline - time.perf_counter(), 0))
+
+    def frame(self, now=None):
+        """The bodies as they should be drawn at `now`: one step behind the simulation, moving smoothly between the
+        positions of the last two steps."""
+        previous, latest = self.snapshots
+        now = time.perf_counter() if now is None else now
+        return interpolate(previous, latest, min(max((now - latest.time) * self.rate, 0), 1))
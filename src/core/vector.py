@@ -0,0 +1,98 @@
+"""A two-dimensional vector for `Body` and the rest of the core, so that they do not need pygame.
+
+`Vector2` behaves like the part of `pygame.math.Vector2` that the simulation uses, down to a product of two vectors
+being their dot product, and mixes freely with pygame's vectors, tuples and NumPy rows.
+"""
+from math import hypot
+from numbers import Real
+
+
+class Vector2:
+    __slots__ = ("x", "y")
+
+    def __init__(self, x=0., y=None):
+        if y is None:
+            x, y = (x, x) if isinstance(x, Real) else x  # One number fills both components, as in pygame
+        self.x, self.y = float(x), float(y)
+
+    def __repr__(self):
+        return "Vector2({:g}, {:g})".format(self.x, self.y)
+
+    def __len__(self):
+        return 2
+
+    def __getitem__(self, index):
+        return (self.x, self.y)[index]
+
+    def __setitem__(self, index, value):
+        setattr(self, "xy"[index], float(value))
+
+    def __iter__(self):
+        yield self.x
+        yield self.y
+
+    def __eq__(self, other):
+        try:
+            return len(other) == 2 and self.x == other[0] and self.y == other[1]
+        except TypeError:
+            return NotImplemented
+
+    __hash__ = None
+
+    def __bool__(self):
+        return bool(self.x or self.y)
+
+    def __neg__(self):
+        return _vector(-self.x, -self.y)
+
+    def __pos__(self):
+        return _vector(self.x, self.y)
+
+    def __add__(self, other):
+        return _vector(self.x + other[0], self.y + other[1])
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return _vector(self.x - other[0], self.y - other[1])
+
+    def __rsub__(self, other):
+        return _vector(other[0] - self.x, other[1] - self.y)
+
+    def __mul__(self, other):
+        if isinstance(other, Real):
+            return _vector(self.x * other, self.y * other)
+        try:
+            return self.x * other[0] + self.y * other[1]  # The dot product, as in pygame
+        except TypeError:
+            return NotImplemented
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        return _vector(self.x / other, self.y / other)
+
+    def dot(self, other):
+        return self.x * other[0] + self.y * other[1]
+
+    def length(self):
+        return hypot(self.x, self.y)
+
+    def length_squared(self):
+        return self.x * self.x + self.y * self.y
+
+    def distance_to(self, other):
+        return hypot(self.x - other[0], self.y - other[1])
+
+    def normalize(self):
+        length = self.length()
+        if not length:
+            raise ValueError("Can't normalize Vector of length Zero")
+        return _vector(self.x / length, self.y / length)
+
+
+def _vector(x, y):
+    """A vector of two floats, without the checks of `Vector2()`, for the results of arithmetic on vectors."""
+    vector = object.__new__(Vector2)
+    vector.x, vector.y = x, y
+    return vector
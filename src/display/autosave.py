@@ -0,0 +1,107 @@
+"""Saving in the background, and periodic checkpoints of long runs to resume from after a crash.
+
+Saving copies the columns of the bodies, which is all the caller waits for, and leaves writing the snapshot to a
+thread of its own; `snapshot.write_snapshot` renames each finished file into place, so a crash mid-write leaves the
+previous file intact.  Checkpoints are snapshots named `checkpoint_<step>.sim` in one directory, of which only the
+newest few are kept.  Their settings also hold the step they were taken at and the state of the simulation's random
+generator, so that a resumed run carries on exactly where the checkpoint left off.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import glob, os, re
+
+from .snapshot import copy_bodies, write_snapshot
+
+prefix, pattern = "checkpoint_", re.compile(r"checkpoint_(\d+)\.sim$")
+
+
+class Writer:
+    """Writes snapshots one at a time, in the order they were asked for, on a thread of its own."""
+    def __init__(self):
+        self.executor, self.pending = ThreadPoolExecutor(1, thread_name_prefix="snapshot writer"), None
+
+    def busy(self):
+        return self.pending is not None and not self.pending.done()
+
+    def failed(self):
+        """The error of the last write, once, if it failed."""
+        if self.pending is None or not self.pending.done():
+            return None
+        error, self.pending = self.pending.exception(), None
+        return error
+
+    def write(self, filename, settings, bodies, then=None):
+        """Copy the bodies now, and write them to `filename` in the background, calling `then()` afterwards.
+        Returns the future of the write, whose result raises anything that went wrong."""
+        bodies = copy_bodies(bodies)
+        self.pending = self.executor.submit(self._write, filename, settings, bodies, then)
+        return self.pending
+
+    @staticmethod
+    def _write(filename, settings, bodies, then):
+        write_snapshot(filename, settings, bodies)
+        if then:
+            then()
+
+    def close(self):
+        """Wait for every write to finish."""
+        self.executor.shutdown(wait=True)
+        if self.pending is not None:
+            self.pending.result()
+
+
+def checkpoints(directory):
+    """The checkpoints in a directory, as (step, filename) pairs from oldest to newest."""
+    found = ((pattern.search(filename), filename) for filename in glob.glob(os.path.join(directory, prefix + "*.sim")))
+    return sorted((int(match.group(1)), filename) for match, filename in found if match)
+
+
+def latest(directory):
+    """The newest checkpoint in a directory, or None."""
+    found = checkpoints(directory) if os.path.isdir(directory) else []
+    return found[-1][1] if found else None
+
+
+class Autosave:
+    """Checkpoints a simulation into `directory` every `every` steps, keeping the newest `keep`.
+
+    `step` is called after steps (not necessarily every one), and checkpoints once a multiple of `every` has been
+    passed since the last checkpoint, or since the first call.  While the last checkpoint is still being written the
+    next waits, rather than queueing, so a slow disk never holds up the simulation or lets copies pile up in memory.
+    """
+    def __init__(self, directory, every=1000, keep=3, writer=None):
+        os.makedirs(directory, exist_ok=True)
+        self.directory, self.every, self.keep = directory, every, keep
+        self.writer, self.passed = writer or Writer(), None
+
+    def due(self, simulation):
+        passed = simulation.steps // self.every if self.every else 0
+        if self.passed is None:
+            self.passed = passed
+        return passed > self.passed and not self.writer.busy()
+
+    def step(self, simulation, settings):
+        """Checkpoint the simulation if one is due; `settings` are those of the saved file, or a function that
+        returns them.  Returns whether a checkpoint was taken."""
+        if not self.due(simulation):
+            return False
+        settings = settings() if callable(settings) else settings
+        settings = dict(settings, steps=simulation.steps, random=simulation.random.getstate())
+        filename = os.path.join(self.directory, "{}{:09d}.sim".format(prefix, simulation.steps))
+        self.writer.write(filename, settings, simulation.bodies, self.rotate)
+        self.passed = simulation.steps // self.every
+        return True
+
+    def rotate(self):
+        for _, filename in checkpoints(self.directory)[:-self.keep or None]:
+            os.remove(filename)
+
+    def close(self):
+        self.writer.close()
+
+
+def resume(simulation, settings):
+    """Restore the step count and random generator of a simulation loaded from a checkpoint's `settings`."""
+    simulation.steps = settings.get("steps", 0)
+    if "random" in settings:  # JSON turned the tuples of the state into lists
+        version, state, gauss = settings["random"]
+        simulation.random.setstate((version, tuple(state), gauss))
@@ -1,12 +1,26 @@
+from ..core.Body import generate_bodies
+from ..core.body_store import BodyStore
+from .snapshot import write_snapshot, read_snapshot, is_snapshot
 import json
 
 
+def simulation_data(settings, bodies):
+    return {"settings": settings, "bodies": [{
+        "mass": b.mass,
+        "radius": b.radius,
+        "position": list(b.position),
+        "velocity": list(b.velocity),
+        "density": b.density,
+        "color": b.color,
+        "name": b.name
+    } for b in bodies]}
+
+
 class Save:
     def __init__(self, settings_window):
         cam = settings_window.camera
 
-        self.data = {}
-        self.data["settings"] = {
+        self.bodies, self.settings = settings_window.bodies, {
             "G": settings_window.gravity_slider.get(),
             "time factor": settings_window.time_slider.get(),
             "coefficient of restitution": settings_window.COR_slider.get(),
@@ -15,32 +29,38 @@ class Save:
             "walls": settings_window.walls.get(),
             "gravity": settings_window.gravity_on.get(),
             "gravitational field": settings_window.g_field.get(),
+            "force solver": settings_window.solver.get(),
+            "opening angle": settings_window.theta_slider.get(),
+            "integrator": settings_window.integrator.get(),
+            "substeps": settings_window.substeps_slider.get(),
             "camera": {
                 "position": list(cam.position),
                 "scale": cam.scale
             }
         }
 
-        self.data["bodies"] = []
-        for b in settings_window.bodies:
-            self.data["bodies"].append({
-                "mass": b.mass,
-                "radius": b.radius,
-                "position": list(b.position),
-                "velocity": list(b.velocity),
-                "density": b.density,
-                "color": b.color,
-                "name": b.name
-            })
-
     def save_as(self, filename):
-        with open(filename, "w") as outfile:
-            json.dump(self.data, outfile)
+        write_snapshot(filename, self.settings, self.bodies)
 
 
-def load_save(window, file):
+def read_save(file):
+    """Return the settings stored in a simulation file, and the arguments of `generate_bodies` for its bodies."""
     data = json.load(file)
-    s = data["settings"]
+    return data["settings"], ((b[prop] for prop in ["mass", "position", "velocity", "density", "color", "name"]) for b in data["bodies"])
+
+
+def read_simulation(filename):
+    """Return the settings stored in a simulation file and a `BodyStore` of its bodies.  Binary snapshots are
+    memory-mapped; JSON files from older versions are parsed."""
+    if is_snapshot(filename):
+        return read_snapshot(filename)
+    with open(filename) as file:
+        settings, bodies = read_save(file)
+        return settings, BodyStore(generate_bodies(bodies))
+
+
+def load_save(window, filename):
+    s, bodies = read_simulation(filename)
     window.gravity_slider.set(s["G"])
     window.time_slider.set(s["time factor"])
     window.COR_slider.set(s["coefficient of restitution"])
@@ -50,4 +70,8 @@ def load_save(window, file):
     window.walls.set(s["walls"])
     window.gravity_on.set(s["gravity"])
     window.g_field.set(s["gravitational field"])
-    return ((b[prop] for prop in ["mass", "position", "velocity", "density", "color", "name"]) for b in data["bodies"])
+    window.solver.set(s.get("force solver", "Direct"))
+    window.theta_slider.set(s.get("opening angle", .5))
+    window.integrator.set(s.get("integrator", "Euler"))
+    window.substeps_slider.set(s.get("substeps", 1))
+    return bodies
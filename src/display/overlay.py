@@ -0,0 +1,46 @@
+import pygame as pg
+
+_fonts = {}
+
+
+def font(size=18):
+    if size not in _fonts:
+        _fonts[size] = pg.font.Font(None, size)  # The default font, which needs no search of the system's fonts
+    return _fonts[size]
+
+
+def profile_lines(profiler):
+    """Text of the profiler overlay: frame and step rates, body count and how many bodies took the Newtonian and
+    relativistic paths, the conservation diagnostics, and the mean time of every phase."""
+    averages, fps = profiler.averages()
+    frames = profiler.recent()
+    if not frames:
+        return ["Profiling..."]
+    last, elapsed = frames[-1], sum(f["frame"] for f in frames[1:])
+    steps = (last.get("steps", 0) - frames[0].get("steps", 0)) / elapsed if elapsed else 0
+    lines = ["{:.1f} frames/s   {:.1f} steps/s   {} bodies".format(fps, steps, last.get("bodies", 0))]
+    if "newtonian" in last:
+        lines.append("{} Newtonian   {} relativistic".format(last["newtonian"], last["relativistic"]))
+    if "kinetic_energy" in last:
+        lines.append(conservation_line(last))
+    for path in profiler.phases:
+        depth, name = path.count("/"), path.rsplit("/", 1)[-1]
+        lines.append("{}{:<{}} {:7.2f} ms".format("  " * depth, name, 24 - 2 * depth, averages[path] * 1000))
+    return lines
+
+
+def conservation_line(values):
+    return "E {:.5g} (kinetic {:.5g})   p ({:.4g}, {:.4g})   L {:.5g}".format(
+        values["energy"], values["kinetic_energy"], values["momentum_x"], values["momentum_y"], values["angular_momentum"])
+
+
+def draw_profile(screen, profiler):
+    lines = [font().render(line, True, (255, 255, 255)) for line in profile_lines(profiler)]
+    width, height = max(line.get_width() for line in lines) + 12, sum(line.get_height() for line in lines) + 12
+    panel = pg.Surface((width, height), pg.SRCALPHA)
+    panel.fill((0, 0, 0, 170))
+    y = 6
+    for line in lines:
+        panel.blit(line, (6, y))
+        y += line.get_height()
+    screen.blit(panel, (8, 8))
@@ -0,0 +1,131 @@
+"""Recordings of whole runs: the state of every body after each step, and what happened to individual bodies.
+
+A recording is a directory of flat binary files, each a memory-mapped array that grows in chunks as steps are
+appended: one row per body per step in `bodies.dat`, one row per step in `frames.dat` locating that step's bodies and
+events, one row per merge, split or escape in `events.dat`, and one row per step of the simulation's conservation
+diagnostics in `diagnostics.dat`.  `recording.json` holds the lengths and row layouts.
+Any step can be read back in constant time, without re-running the physics.
+"""
+import json, os
+import numpy as np
+
+from ..core.body_store import BodyStore
+from ..core.diagnostics import Diagnostics
+
+body_dtype = np.dtype([("id", "<i8"), ("position", "<f8", 2), ("velocity", "<f8", 2), ("mass", "<f8"),
+                       ("charge", "<f8"), ("radius", "<f8"), ("color", "u1", 3)])
+frame_dtype = np.dtype([("step", "<i8"), ("first_body", "<i8"), ("bodies", "<i8"), ("first_event", "<i8"),
+                        ("events", "<i8")])
+# `body` is the survivor, parent or escaped body and `other` the absorbed body or fragment, as indices into the
+# bodies of the same step, or -1 for bodies no longer in the simulation; `position` and `mass` are those of the
+# absorbed body, the fragment or the escaped body.
+event_dtype = np.dtype([("kind", "u1"), ("body", "<i8"), ("other", "<i8"), ("position", "<f8", 2), ("mass", "<f8")])
+event_kinds = ("merge", "split", "escape")
+# NaN where the simulation's diagnostics were disabled, or before the potential energy was first taken
+diagnostics_dtype = np.dtype([(name, "<f8") for name in Diagnostics.quantities])
+files = {"bodies": body_dtype, "frames": frame_dtype, "events": event_dtype, "diagnostics": diagnostics_dtype}
+
+
+class _Array:
+    """A memory-mapped array that is appended to, growing its file `chunk` rows at a time."""
+    def __init__(self, filename, dtype, chunk):
+        self.filename, self.dtype, self.chunk, self.n, self.rows = filename, dtype, chunk, 0, None
+        open(filename, "wb").close()
+        self._grow(chunk)
+
+    def _grow(self, capacity):
+        self.rows = None  # Releases the old map before the file is resized
+        with open(self.filename, "r+b") as file:
+            file.truncate(capacity * self.dtype.itemsize)
+        self.rows = np.memmap(self.filename, self.dtype, "r+", shape=(capacity,))
+
+    def extend(self, rows):
+        if self.n + len(rows) > len(self.rows):
+            self._grow(-(-(self.n + len(rows)) // self.chunk) * self.chunk)
+        self.rows[self.n:self.n + len(rows)] = rows
+        self.n += len(rows)
+
+    def close(self):
+        self.rows.flush()
+        self.rows = None
+        with open(self.filename, "r+b") as file:
+            file.truncate(self.n * self.dtype.itemsize)
+
+
+class Recorder:
+    """Appends the state of a simulation to a new recording in `directory` each time `record` is called."""
+    def __init__(self, directory, chunk=2 ** 16):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.arrays = {name: _Array(os.path.join(directory, name + ".dat"), dtype, chunk) for name, dtype in files.items()}
+        self.save_index()
+
+    def record(self, simulation):
+        """Append the bodies of `simulation` as they are now, and the events of its last step."""
+        store, bodies, events = simulation.bodies, self.arrays["bodies"], self.arrays["events"]
+        rows = np.zeros(len(store), body_dtype)
+        for name in body_dtype.names:
+            rows[name] = store.live(name)
+        frame = np.array([(simulation.steps, bodies.n, len(store), events.n, len(simulation.events))], frame_dtype)
+        bodies.extend(rows)
+        events.extend(np.array([self.event(store, event) for event in simulation.events], event_dtype))
+        latest = simulation.diagnostics.latest
+        self.arrays["diagnostics"].extend(np.array([tuple(latest.get(name, np.nan) for name in Diagnostics.quantities)],
+                                                   diagnostics_dtype))
+        self.arrays["frames"].extend(frame)
+        if not self.arrays["frames"].n % 100:  # Keeps the recording readable up to here if it is never closed
+            self.save_index()
+
+    @staticmethod
+    def event(store, event):
+        kind, body, other = event[0], event[1], event[-1]
+        index = lambda b: store.index(b) if b in store else -1
+        return event_kinds.index(kind), index(body), index(other) if len(event) > 2 else -1, tuple(other.position), other.mass
+
+    def save_index(self):
+        with open(os.path.join(self.directory, "recording.json"), "w") as outfile:
+            json.dump({name: {"rows": array.n, "dtype": array.dtype.descr} for name, array in self.arrays.items()}, outfile)
+
+    def close(self):
+        for array in self.arrays.values():
+            array.close()
+        self.save_index()
+
+
+class Recording:
+    """A finished recording, read from `directory`.  Indexing it gives the bodies of a step."""
+    def __init__(self, directory):
+        with open(os.path.join(directory, "recording.json")) as file:
+            index = json.load(file)
+        self.arrays = {}
+        for name, dtype in files.items():
+            rows = index.get(name, {"rows": 0})["rows"]  # Files cannot be mapped empty, and old recordings lack some
+            path = os.path.join(directory, name + ".dat")
+            self.arrays[name] = np.memmap(path, dtype, "r", shape=(rows,)) if rows else np.zeros(0, dtype)
+        self.frames = self.arrays["frames"]
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, k):
+        frame = self.frames[k]
+        return self.arrays["bodies"][frame["first_body"]:frame["first_body"] + frame["bodies"]]
+
+    def events(self, k):
+        """The events of step k, as (kind, body, other, position, mass) tuples."""
+        frame = self.frames[k]
+        return [(event_kinds[e["kind"]], int(e["body"]), int(e["other"]), tuple(e["position"].tolist()), float(e["mass"]))
+                for e in self.arrays["events"][frame["first_event"]:frame["first_event"] + frame["events"]]]
+
+    def diagnostics(self, k):
+        """The conservation diagnostics after step k, by name, or None if the recording has none."""
+        rows = self.arrays["diagnostics"]
+        return {name: float(rows[k][name]) for name in Diagnostics.quantities} if k < len(rows) else None
+
+    def store(self, k):
+        """The bodies of step k as a `BodyStore` (without `Body` views), which the render modes can draw."""
+        bodies = self[k]
+        columns = {name: np.array(bodies[name]) if name in body_dtype.names else np.zeros(BodyStore.shape(name, len(bodies)))
+                   for name in BodyStore.columns}
+        columns["mass0"] = columns["mass"]
+        return BodyStore.from_columns(columns, lambda store, i: None)
@@ -0,0 +1,115 @@
+import numpy as np
+import pygame as pg
+
+# Levels of detail, by radius on screen in pixels: bodies under `point_radius` are single pixels, bodies under
+# `stamp_radius` are small discs stamped into the pixel array in one operation per size, and only the rest are drawn
+# one at a time with `pg.draw.circle`.
+point_radius, stamp_radius = 1, 4
+max_coordinate = 2 ** 30  # Beyond what `pg.draw` accepts; only reached by enormous bodies, zoomed far in
+
+
+def screen_coordinates(store, cam):
+    """Screen position and radius of every body, as seen through the camera."""
+    position, dims = np.asarray(cam.position), np.asarray(cam.dims)
+    return (store.live("position") - position - dims / 2) * cam.scale + dims / 2, store.live("radius") * cam.scale
+
+
+def visible(xy, radius, size):
+    """Whether each body overlaps a screen of `size` pixels (which also rules out infinite and NaN coordinates)."""
+    return ((xy + radius[:, None] >= 0) & (xy - radius[:, None] < size)).all(axis=1)
+
+
+def disc(r):
+    """Pixel offsets covered by a disc of integer radius r."""
+    dx, dy = np.mgrid[-r:r + 1, -r:r + 1]
+    inside = dx ** 2 + dy ** 2 <= r * r
+    return dx[inside], dy[inside]
+
+
+def stamp(pixels, xy, color, r):
+    dx, dy = disc(r)
+    x, y = (xy[:, 0, None] + dx).ravel(), (xy[:, 1, None] + dy).ravel()
+    on_screen = (x >= 0) & (x < pixels.shape[0]) & (y >= 0) & (y < pixels.shape[1])
+    pixels[x[on_screen], y[on_screen]] = np.repeat(color, len(dx), axis=0)[on_screen]
+
+
+def draw_bodies(screen, store, cam):
+    """Draw every body that is on screen, at the level of detail its size calls for.  Returns how many bodies were
+    drawn as points or stamps, and as circles."""
+    xy, radius = screen_coordinates(store, cam)
+    shown = np.flatnonzero(visible(xy, radius, screen.get_size()) & (np.abs(xy).max(axis=1) + radius < max_coordinate))
+    small, large = shown[radius[shown] < stamp_radius], shown[radius[shown] >= stamp_radius]
+    color = store.live("color")
+    if len(small):
+        pixels, sizes = pg.surfarray.pixels3d(screen), np.where(radius[small] < point_radius, 0, radius[small] + .5).astype(int)
+        centres = np.floor(xy[small]).astype(int)
+        for r in np.unique(sizes):
+            stamp(pixels, centres[sizes == r], color[small[sizes == r]], r)
+        del pixels  # Unlocks the surface
+    for c, centre, r in zip(color[large].tolist(), xy[large].tolist(), radius[large].tolist()):
+        pg.draw.circle(screen, c, centre, r)
+    return len(small), len(large)
+
+
+def draw_outlines(screen, store, cam, indices, color):
+    """Circle the bodies at `indices` that are on screen, at least a few pixels out so that points stand out too."""
+    xy, radius = screen_coordinates(store, cam)
+    xy, radius = xy[indices], radius[indices] + 2
+    shown = visible(xy, radius, screen.get_size()) & (np.abs(xy).max(axis=1) + radius < max_coordinate)
+    for centre, r in zip(xy[shown].tolist(), radius[shown].tolist()):
+        pg.draw.circle(screen, color, centre, max(r, stamp_radius), 1)
+
+
+def colormap(*colors, n=256):
+    """Lookup table of n colors, evenly interpolated through the given ones."""
+    stops = np.linspace(0, 1, len(colors))
+    return np.stack([np.interp(np.linspace(0, 1, n), stops, channel) for channel in np.array(colors).T], axis=1)
+
+
+heat = colormap((60, 0, 90), (200, 20, 40), (255, 140, 0), (255, 240, 160))  # For mass, from sparse to dense
+positive, negative = colormap((255, 170, 170), (140, 0, 0)), colormap((170, 190, 255), (0, 0, 140))  # For charge
+
+
+def density_map(store, cam, size, weights):
+    """Sum of `weights` over the bodies whose centre falls in each pixel of a screen of `size` pixels."""
+    w, h = size
+    xy, _ = screen_coordinates(store, cam)
+    inside = np.flatnonzero((xy >= 0).all(axis=1) & (xy[:, 0] < w) & (xy[:, 1] < h))
+    x, y = xy[inside].astype(int).T
+    return np.bincount(x * h + y, weights[inside], minlength=w * h).reshape(w, h)
+
+
+def levels(values, n=256):
+    """Index into a colormap of n colors for each of some positive values, on a logarithmic scale."""
+    low, high = values.min(), values.max()
+    if high <= low:
+        return np.full(len(values), n - 1)
+    return (np.log(values / low) / np.log(high / low) * (n - 1)).astype(int)
+
+
+def draw_mass_density(screen, store, cam):
+    """Color each pixel by the total mass of the bodies in it, whatever their number or size."""
+    grid = density_map(store, cam, screen.get_size(), store.live("mass"))
+    filled = grid > 0
+    if filled.any():
+        pixels = pg.surfarray.pixels3d(screen)
+        pixels[filled] = heat[levels(grid[filled])]
+        del pixels
+
+
+def draw_charge_density(screen, store, cam):
+    """Color each pixel by the net charge of the bodies in it: red for positive, blue for negative, and green (the
+    color of neutral bodies) where it cancels out."""
+    size = screen.get_size()
+    grid, occupied = density_map(store, cam, size, store.live("charge")), density_map(store, cam, size, np.ones(len(store)))
+    if occupied.any():
+        pixels, magnitude = pg.surfarray.pixels3d(screen), np.abs(grid[grid != 0])
+        shade = np.zeros(grid.shape, dtype=int)
+        shade[grid != 0] = levels(magnitude)
+        pixels[occupied > 0] = (0, 255, 0)
+        pixels[grid > 0], pixels[grid < 0] = positive[shade[grid > 0]], negative[shade[grid < 0]]
+        del pixels
+
+
+# Ways of drawing the bodies onto the screen, each taking the screen, the store of bodies and the camera
+render_modes = {"Bodies": draw_bodies, "Mass Density": draw_mass_density, "Charge Density": draw_charge_density}
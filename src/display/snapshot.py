@@ -0,0 +1,71 @@
+"""Binary snapshots of a simulation: its settings and the full state of every body, one column at a time.
+
+A snapshot is a small JSON header followed by the raw columns of a `BodyStore`, each aligned so that it can be
+memory-mapped.  Loading one maps the file copy-on-write and hands the columns to a new store as they are, so no body
+data is parsed or copied until the simulation changes it.  Snapshots use the same `.sim` extension as the JSON files
+they replace; `json_saving.read_simulation` reads either.  They are written to a temporary file that is then renamed
+over the old one, so a crash while saving never leaves a half-written snapshot behind.
+"""
+import json, os
+import numpy as np
+
+from ..core.Body import Body
+from ..core.body_store import BodyStore
+
+magic = b"PHYSSIM\x01"
+alignment = 64
+
+
+def _aligned(offset):
+    return -(-offset // alignment) * alignment
+
+
+def copy_bodies(store):
+    """A store of copies of the columns and names of `store`, for writing out while the simulation moves on."""
+    names = {i: body.name for i, body in enumerate(store) if body.name is not None}
+    columns = {name: store.live(name).copy() for name in store.columns}
+    return BodyStore.from_columns(columns, lambda copy, i: Body.view(copy, i, names.get(i)))
+
+
+def write_snapshot(filename, settings, bodies):
+    store = bodies if isinstance(bodies, BodyStore) else BodyStore(bodies)
+    n, columns, offset = len(store), {}, 0
+    for name in store.columns:
+        column = store.live(name)
+        columns[name] = {"offset": offset, "shape": column.shape, "dtype": column.dtype.str}
+        offset = _aligned(offset + column.nbytes)
+    names = {i: body.name for i, body in enumerate(store) if body.name is not None}
+    header = json.dumps({"settings": settings, "n": n, "columns": columns, "names": names}).encode()
+    start = _aligned(len(magic) + 8 + len(header))
+    temporary = filename + ".tmp"
+    with open(temporary, "wb") as outfile:
+        outfile.write(magic + len(header).to_bytes(8, "little") + header)
+        for name in store.columns:
+            outfile.seek(start + columns[name]["offset"])
+            outfile.write(np.ascontiguousarray(store.live(name)).tobytes())
+        outfile.truncate(start + offset)
+        outfile.flush()
+        os.fsync(outfile.fileno())
+    os.replace(temporary, filename)
+
+
+def is_snapshot(filename):
+    with open(filename, "rb") as file:
+        return file.read(len(magic)) == magic
+
+
+def read_snapshot(filename):
+    """Return the settings stored in a snapshot and a `BodyStore` of its bodies, memory-mapped from the file."""
+    with open(filename, "rb") as file:
+        file.seek(len(magic))
+        length = int.from_bytes(file.read(8), "little")
+        header = json.loads(file.read(length))
+    start, names = _aligned(len(magic) + 8 + length), header["names"]
+    columns = {}
+    for name, c in header["columns"].items():
+        if c["shape"][0]:
+            mapped = np.memmap(filename, c["dtype"], "c", start + c["offset"], tuple(c["shape"]))
+            columns[name] = mapped.view(np.ndarray)
+        else:
+            columns[name] = np.zeros(c["shape"], c["dtype"])
+    return header["settings"], BodyStore.from_columns(columns, lambda store, i: Body.view(store, i, names.get(str(i))))
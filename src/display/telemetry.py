@@ -0,0 +1,248 @@
+"""Streaming a running simulation to dashboards and analysis scripts over a local socket.
+
+`TelemetryServer` runs an asyncio server on a thread of its own, on localhost or a Unix socket.  On connecting, a
+client is sent one line of JSON describing the frames; from then on it is sent one binary frame per step: a header
+(`header`: magic, step, number of bodies, number of events, number of events lost) followed by that many rows of
+`body_dtype` and of `event_dtype`.  Events are those since the client's last frame, kept for it for up to `backlog`
+steps; a client that goes longer between frames loses the oldest, and the next header counts them.
+
+A client asks for less by sending lines of JSON at any time: {"every": N} for every Nth step only, and
+{"region": [left, top, right, bottom]} (or null) for only the bodies, and events, inside a box.  A client that falls
+behind is sent the newest step when it catches up, and the steps in between are dropped rather than queued, so a
+slow client never holds up the simulation or the other clients.  `publish`, called after each step by whatever steps
+the simulation, only copies the columns when a client is due a frame, and hands them over without waiting.
+"""
+from collections import deque
+import asyncio, json, os, socket, threading, time
+import numpy as np
+
+from .recording import event_kinds
+
+magic = b"PHYSTEL\x01"
+# `lost` counts the events since the last frame that were dropped from the client's backlog, and so are not in this one
+header = np.dtype([("magic", "S8"), ("step", "<i8"), ("bodies", "<i8"), ("events", "<i8"), ("lost", "<i8")])
+body_dtype = np.dtype([("id", "<i8"), ("position", "<f8", 2), ("velocity", "<f8", 2), ("mass", "<f8"),
+                       ("charge", "<f8")])
+# `body` is the survivor, parent or escaped body and `other` the absorbed body or fragment (the escaped body again for
+# escapes), by id; `position` and `mass` are those of the absorbed body, the fragment or the escaped body.
+event_dtype = np.dtype([("step", "<i8"), ("kind", "u1"), ("body", "<i8"), ("other", "<i8"), ("position", "<f8", 2),
+                        ("mass", "<f8")])
+
+
+def parse_address(address):
+    """("unix", path) for "unix:PATH", or (host, port) for "HOST:PORT" or a port alone, which listens on localhost."""
+    if address.startswith("unix:"):
+        return "unix", address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def step_events(simulation):
+    """The events of the simulation's last step, as rows of `event_dtype`."""
+    return np.array([(simulation.steps, event_kinds.index(event[0]), event[1].id, event[-1].id,
+                      tuple(event[-1].position), event[-1].mass) for event in simulation.events], event_dtype)
+
+
+def encode(step, bodies, events, lost=0):
+    return (np.array([(magic, step, len(bodies), len(events), lost)], header).tobytes() + bodies.tobytes() +
+            events.tobytes())
+
+
+def decode(data):
+    """The step, bodies and events of a frame; `data` holds the frame and nothing after it."""
+    top = np.frombuffer(data, header, 1)[0]
+    if top["magic"] != magic:
+        raise ValueError("not a telemetry frame")
+    start = header.itemsize + top["bodies"] * body_dtype.itemsize
+    return (int(top["step"]), np.frombuffer(data, body_dtype, top["bodies"], header.itemsize),
+            np.frombuffer(data, event_dtype, top["events"], start))
+
+
+class _Client:
+    def __init__(self, writer, backlog):
+        self.writer, self.every, self.region = writer, 1, None
+        self.frame, self.ready, self.dropped, self.lost = None, asyncio.Event(), 0, 0
+        self.events = deque(maxlen=backlog)  # Arrays of the events of one step each, until they are sent
+
+    def subscribe(self, request):
+        if "every" in request:
+            self.every = max(int(request["every"]), 1)
+        if "region" in request:
+            self.region = None if request["region"] is None else np.array(request["region"], float).reshape(2, 2)
+
+    def inside(self, position):
+        if self.region is None:
+            return np.ones(len(position), bool)
+        return np.all((position >= self.region[0]) & (position <= self.region[1]), axis=1)
+
+    def take(self):
+        """The frame to send now, with the events up to its step."""
+        (step, bodies), self.frame = self.frame, None
+        self.ready.clear()
+        events = []
+        while self.events and self.events[0]["step"][0] <= step:
+            events.append(self.events.popleft())
+        events = np.concatenate(events) if events else np.zeros(0, event_dtype)
+        lost, self.lost = self.lost, 0
+        return encode(step, bodies[self.inside(bodies["position"])], events[self.inside(events["position"])], lost)
+
+
+class TelemetryServer:
+    """Serves frames of a simulation at `address` (see `parse_address`) to any number of clients, from `start` until
+    `close`.  Port 0 picks a free port; `address` then holds the one picked.  Each client keeps the events of at most
+    `backlog` steps that have not been sent to it yet, and is told how many older ones it lost."""
+    def __init__(self, address="127.0.0.1:0", backlog=10000):
+        self.address, self.backlog, self.clients = parse_address(address), backlog, ()
+        self.loop, self.server, self.thread, self.error = None, None, None, None
+
+    def __str__(self):
+        return "{}:{}".format(*self.address)
+
+    def start(self):
+        started = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(started,), name="telemetry", daemon=True)
+        self.thread.start()
+        started.wait()
+        if self.server is None:
+            raise self.error
+        return self
+
+    def _run(self, started):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)  # The thread's own, for `gather` when no tasks are left at shutdown
+        try:
+            if self.address[0] == "unix":
+                if os.path.exists(self.address[1]):  # Left behind by a server that did not close
+                    os.remove(self.address[1])
+                self.server = self.loop.run_until_complete(asyncio.start_unix_server(self._serve, self.address[1]))
+            else:
+                self.server = self.loop.run_until_complete(asyncio.start_server(self._serve, *self.address))
+                self.address = self.server.sockets[0].getsockname()[:2]
+        except OSError as error:
+            self.error = error
+            return started.set()
+        started.set()
+        self.loop.run_forever()
+        self.server.close()
+        for client in self.clients:  # Their connections end, and with them the rest of the tasks
+            if client.writer.transport.get_write_buffer_size():  # Still behind after `close` waited for them
+                client.writer.transport.abort()
+            else:
+                client.writer.close()
+        tasks = asyncio.all_tasks(self.loop)
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.close()
+
+    async def _serve(self, reader, writer):
+        client = _Client(writer, self.backlog)
+        self.clients += (client,)
+        sender = asyncio.ensure_future(self._send(client))
+        try:
+            description = {"header": header.descr, "bodies": body_dtype.descr, "events": event_dtype.descr,
+                           "event kinds": event_kinds}
+            writer.write(json.dumps(description).encode() + b"\n")
+            async for line in reader:  # Ends when the client disconnects
+                client.subscribe(json.loads(line))
+        except (ConnectionError, ValueError, TypeError):  # A malformed request closes the connection
+            pass
+        finally:
+            self.clients = tuple(c for c in self.clients if c is not client)
+            sender.cancel()
+            writer.close()
+
+    @staticmethod
+    async def _send(client):
+        try:
+            while True:
+                await client.ready.wait()
+                client.writer.write(client.take())
+                await client.writer.drain()  # Waits while the client is behind; newer frames replace the waiting one
+        except ConnectionError:
+            pass
+
+    def wait_for(self, clients):
+        """Wait until at least `clients` clients are connected."""
+        while len(self.clients) < clients:
+            time.sleep(.01)
+
+    def publish(self, simulation):
+        """Pass on the step the simulation has just taken to the clients that are due it.  Called on the thread that
+        steps the simulation, with the simulation not changing underneath it."""
+        clients, step = self.clients, simulation.steps
+        if not clients:
+            return
+        due, bodies = any(not step % client.every for client in clients), None
+        if due:
+            store = simulation.bodies
+            bodies = np.zeros(len(store), body_dtype)
+            for name in body_dtype.names:
+                bodies[name] = store.live(name)
+        events = step_events(simulation) if simulation.events else None
+        if due or events is not None:
+            self.loop.call_soon_threadsafe(self._deliver, step, bodies, events)
+
+    def _deliver(self, step, bodies, events):
+        for client in self.clients:
+            if events is not None:
+                if len(client.events) == client.events.maxlen:  # The oldest step of events makes room
+                    client.lost += len(client.events[0])
+                client.events.append(events)
+            if bodies is not None and not step % client.every:
+                client.dropped += client.frame is not None
+                client.frame = step, bodies
+                client.ready.set()
+
+    async def _finish(self, timeout):
+        async def sent(client):
+            while client.frame is not None:
+                await asyncio.sleep(.01)
+            await client.writer.drain()
+        if self.clients:
+            _, pending = await asyncio.wait([asyncio.ensure_future(sent(c)) for c in self.clients], timeout=timeout)
+            for task in pending:
+                task.cancel()
+
+    def close(self, timeout=5):
+        """Stop serving, once the clients have been sent the frames they are due, or after `timeout` seconds."""
+        if self.loop is not None and self.thread.is_alive():
+            asyncio.run_coroutine_threadsafe(self._finish(timeout), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+        if self.address[0] == "unix" and os.path.exists(self.address[1]):
+            os.remove(self.address[1])
+
+
+class TelemetryClient:
+    """A blocking client, for scripts: connects to `address`, asks for every `every`th step within `region`, and
+    gives the step, bodies and events of each frame when iterated over.  `lost` counts the events the server could not
+    keep for it."""
+    def __init__(self, address, every=1, region=None):
+        host, port = parse_address(address) if isinstance(address, str) else address
+        if host == "unix":
+            self.socket = socket.socket(socket.AF_UNIX)
+            self.socket.connect(port)
+        else:
+            self.socket = socket.create_connection((host, port))
+        self.file = self.socket.makefile("rb")
+        self.description, self.lost = json.loads(self.file.readline()), 0
+        self.subscribe(every=every, region=region)
+
+    def subscribe(self, **request):
+        self.socket.sendall(json.dumps(request).encode() + b"\n")
+
+    def read(self):
+        """The next frame, or None once the server has closed."""
+        top = self.file.read(header.itemsize)
+        if len(top) < header.itemsize:
+            return None
+        frame = np.frombuffer(top, header)[0]
+        self.lost += int(frame["lost"])
+        rest = self.file.read(frame["bodies"] * body_dtype.itemsize + frame["events"] * event_dtype.itemsize)
+        return decode(top + rest)
+
+    def __iter__(self):
+        return iter(self.read, None)
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
@@ -1,15 +1,20 @@
-import os, tkinter as tk
+import math, os, time, tkinter as tk
 from tkinter import filedialog, messagebox, colorchooser
 
 from .json_saving import Save, load_save
-from ..core.Body import generate_bodies
-from ..core.presets import Gradient, System
+from ..core.presets import Galaxy, Gradient, System
+from ..core.solvers import force_solvers
+from ..core.integrators import integrators
+from ..core.backends import backends
+from .render import render_modes
+from .recording import Recorder, Recording
+from .autosave import Autosave, Writer
 from ..core.constants import *
 
 
 class Menu:
     def __init__(self, bodies, camera, dims, *args):
-        self.bodies, self.camera, self.dims, self.alive = bodies, camera, dims, True
+        self.bodies, self.camera, self.dims, self.alive, self.last_refresh = bodies, camera, dims, True, 0
         self.create_root()
         self.root.protocol("WM_DELETE_WINDOW", self.destroy)
         self.configure(*args)
@@ -35,6 +40,18 @@ class Menu:
         self.__dict__[AttrName].set(Val)
         self.__dict__[AttrName].grid(row=Row, column=1)
 
+    def createLogSlider(self, *sliderDetails):  # A slider over powers of ten, for values spanning several of them
+        name, AttrName, Root, Row, From, To, Length, Val = sliderDetails
+        tk.Label(Root, text=name).grid(row=Row)
+        frame, value = tk.Frame(Root), tk.IntVar(value=Val)
+        scale = tk.Scale(frame, from_=math.log10(From), to=math.log10(To), orient=tk.HORIZONTAL, length=Length - 60,
+                         resolution=.01, showvalue=0, command=lambda x: value.set(int(round(10 ** float(x)))))
+        scale.set(math.log10(Val))
+        scale.grid(row=0, column=0)
+        tk.Label(frame, textvariable=value, width=8).grid(row=0, column=1)
+        frame.grid(row=Row, column=1)
+        self.__dict__[AttrName] = value
+
     def createBoolean(self, *Details):
         name, AttrName, Root, Row, Column, PadY, Grid, Val = Details
         self.__dict__[AttrName] = tk.BooleanVar(value=Val)
@@ -44,6 +61,14 @@ class Menu:
         else:
             Root.add_checkbutton(label=name, variable=self.__dict__[AttrName])
 
+    def createChoice(self, *Details):
+        name, AttrName, Root, Options, Val = Details
+        self.__dict__[AttrName] = tk.StringVar(value=Val)
+        submenu = tk.Menu(Root, tearoff=0)
+        Root.add_cascade(label=name, menu=submenu)
+        for option in Options:
+            submenu.add_radiobutton(label=option, variable=self.__dict__[AttrName], value=option)
+
     def createColor(self, *Details):
         name, AttrName, Root, Row = Details
         frame = tk.Frame(Root)
@@ -54,6 +79,14 @@ class Menu:
         tk.Label(frame, textvariable=self.__dict__[AttrName + "Val"]).grid(row=0, column=2)
         frame.grid(row=Row, columnspan=2)
 
+    def due(self):
+        """Whether the window should refresh now; windows refresh at most `window_refresh_rate` times a second."""
+        now = time.perf_counter()
+        if now - self.last_refresh < 1 / window_refresh_rate:
+            return False
+        self.last_refresh = now
+        return True
+
     def destroy(self):
         self.root.destroy()
         self.alive = False
@@ -62,7 +95,8 @@ class Menu:
 class CreateSystem(Menu):
     def create_root(self):
         self.root = tk.Toplevel()
-        self.choices = {"System": ("Unary", "Binary", "Cluster"), "Gradient": ("Density", "Diffusion"), "Dots": ("Radius", "Mass", "Number of Dots", "Density")}
+        self.choices = {"System": ("Unary", "Binary", "Cluster"), "Gradient": ("Density", "Diffusion"),
+                        "Galaxy": ("Disk", "Plummer"), "Dots": ("Radius", "Mass", "Number of Dots", "Density")}
 
     def configure(self, parent):
         self.parent, d = parent, list(self.choices.keys())[0]
@@ -95,7 +129,7 @@ class CreateSystem(Menu):
                 x.grid_forget()
                 x.destroy()
         root = tk.LabelFrame(self.root)
-        self.createLabelSlider("Body Count: ", 'num', root, 2, 0, 200, 200, 100, 1)
+        self.createLogSlider("Body Count: ", 'num', root, 2, 1, 10 ** 6, 200, 100)
         self.createEntryRange("Mass Range: ", 'mass_r', root, 3, 10, 15)
         row = 4  # Use this to track the number of rows used in the window
         if chosen == "Gradient":
@@ -108,6 +142,14 @@ class CreateSystem(Menu):
             if chosen2 == "Density":
                 self.createEntryRange("Densities: ", 'densities', root, row, 0.1, 0.15)
                 row += 1
+        elif chosen == "Galaxy":
+            self.createLabelSlider("Scale Radius: ", 'scale', root, row, 10, 1000, 200, 100, 10)
+            self.createLabelSlider("Density: ", 'density', root, row + 1, .01, 1, 200, .1, .01)
+            row += 2
+            if chosen2 == "Disk":
+                self.createLabelSlider("Core Density: ", 'star_density', root, row, .01, 1, 200, .4, .01)
+                self.createLabelSlider("Core Mass: ", 'star_mass', root, row + 1, 0, 100000, 200, 5000, 500)
+                row += 2
         else:
             self.createEntryRange("Distance: ", 'dist_r', root, row, 100, 300)
             self.createLabelSlider("Density: ", 'density', root, row + 1, .01, 1, 200, .1, .01)
@@ -134,6 +176,12 @@ class CreateSystem(Menu):
                 new_bodies = Gradient(dims, num, mass_r, colors).preset('Density', densities)
             else:
                 new_bodies = Gradient(dims, num, mass_r, colors).preset('Diffusion')
+        elif chosen == "Galaxy":
+            galaxy = Galaxy(dims, num, mass_r, self.scale.get(), self.density.get())
+            if chosen2 == "Disk":
+                new_bodies = galaxy.preset('Disk', self.star_mass.get(), self.star_density.get())
+            else:
+                new_bodies = galaxy.preset('Plummer')
         else:
             dist_r, density = self.findEntries('dist_r'), self.density.get()
             if chosen2 == "Cluster":
@@ -150,9 +198,9 @@ class CreateSystem(Menu):
                                                                                    circular)
         if not self.bodies or messagebox.askokcancel("Discard Changes", "Are you sure you want to discard changes?"):
             self.bodies[:] = new_bodies
-            for window in self.parent.properties_windows:
+            for window in self.parent.properties_windows.values():
                 window.destroy()
-            self.parent.properties_windows = []
+            self.parent.properties_windows = {}
             self.parent.name.set("Unnamed Simulation")
             self.parent.filename = ''
 
@@ -163,7 +211,8 @@ class Settings(Menu):
 
     def configure(self, constants):
         self.root.title("Simulation Settings")
-        self.properties_windows, self.physics_frame, G, COR, self.bg_color = [], tk.LabelFrame(self.root), *constants, (
+        # Open properties windows, by the id of their body
+        self.properties_windows, self.physics_frame, G, COR, self.bg_color = {}, tk.LabelFrame(self.root), *constants, (
             255, 255, 255)
 
         # Top Bar Menu
@@ -174,12 +223,26 @@ class Settings(Menu):
         self.menu.add_command(label="Save", command=self.save)
         self.menu.add_command(label="Save As", command=self.save_as)
 
+        self.recording_menu, self.recorder, self.replay = tk.Menu(self.menu, tearoff=0), None, None
+        self.menu.add_cascade(label="Recording", menu=self.recording_menu)
+        self.recording_menu.add_command(label="Start Recording", command=self.start_recording)
+        self.recording_menu.add_command(label="Stop Recording", command=self.stop_recording)
+        self.recording_menu.add_command(label="Open Recording", command=self.open_recording)
+        self.recording_menu.add_command(label="Close Recording", command=self.close_recording)
+
         self.submenu = tk.Menu(self.menu, tearoff=0)
         self.menu.add_cascade(label="Options", menu=self.submenu)
         self.submenu.add_command(label="Set Background Color", command=self.set_bg_color)
         self.createBoolean('Walls', 'walls', self.submenu, 0, 0, 0, 0, 0)
         self.createBoolean('Mutual Gravitation', 'gravity_on', self.submenu, 0, 0, 0, 0, 1)
         self.createBoolean('Gravitational Field', 'g_field', self.submenu, 0, 0, 0, 0, 0)
+        self.createChoice('Force Solver', 'solver', self.submenu, force_solvers, "Direct")
+        self.createChoice('Integrator', 'integrator', self.submenu, integrators, "Euler")
+        self.createChoice('Backend', 'backend', self.submenu, backends, "NumPy")
+        self.createChoice('Render Mode', 'render_mode', self.submenu, render_modes, "Bodies")
+        self.createBoolean('Threaded Physics', 'threaded', self.submenu, 0, 0, 0, 0, 0)  # Stepped apart from drawing
+        self.createBoolean('Autosave', 'autosave_on', self.submenu, 0, 0, 0, 0, 0)
+        self.writer, self.autosave = Writer(), None  # Files are written in the background
 
         # File Frame Content
         self.filename = ""
@@ -190,11 +253,19 @@ class Settings(Menu):
         self.createLabelSlider('Gravity: ', 'gravity_slider', self.physics_frame, 0, -1000, 1000, 200, G * 100, 1)
         self.createLabelSlider('Time Factor (%): ', 'time_slider', self.physics_frame, 1, 0, 500, 200, 0, 1)
         self.createLabelSlider('Elasticity (CoR): ', 'COR_slider', self.physics_frame, 2, 0, 2, 200, COR, .01)
-        self.createBoolean('Collisions', 'collision', self.physics_frame, 3, 1, 5, 1, 1)
+        self.createLabelSlider('Opening Angle: ', 'theta_slider', self.physics_frame, 3, 0, 1, 200, .5, .05)
+        self.createLabelSlider('Substeps: ', 'substeps_slider', self.physics_frame, 4, 1, 20, 200, 1, 1)
+        self.createBoolean('Collisions', 'collision', self.physics_frame, 5, 1, 5, 1, 1)
 
         self.bodies_label_text = tk.StringVar()
         self.bodies_label = tk.Label(self.physics_frame, textvariable=self.bodies_label_text)
-        self.bodies_label.grid(row=3, column=0, pady=5)
+        self.bodies_label.grid(row=5, column=0, pady=5)
+
+        # Conservation diagnostics of the simulation; the potential energy is only taken every so many steps
+        self.createLabelSlider('Potential Every: ', 'potential_slider', self.physics_frame, 6, 0, 100, 200, 0, 1)
+        self.diagnostics_text = tk.StringVar()
+        tk.Label(self.physics_frame, textvariable=self.diagnostics_text, justify=tk.LEFT).grid(row=7, columnspan=2,
+                                                                                              sticky=tk.W)
 
         # Grid Frames
         self.physics_frame.grid(row=1, sticky=tk.W)
@@ -205,10 +276,31 @@ class Settings(Menu):
 
         # Set window size and screen position
         self.root.geometry(
-            '%dx%d+%d+%d' % (305, 260, self.dims[0] / 3 - 315, self.dims[1] / 6 - 20))
+            '%dx%d+%d+%d' % (305, 440, self.dims[0] / 3 - 315, self.dims[1] / 6 - 20))
+        self.values = self.read_values()
+
+    def read_values(self):
+        """The physics settings, in the order `handle_bodies` takes them: G, COR, then the rest as a list."""
+        return [self.gravity_slider.get() / 100, self.COR_slider.get(),
+                [self.time_slider.get() / 100, self.collision.get(), self.walls.get(), self.g_field.get(),
+                 self.gravity_on.get(), self.solver.get(), self.theta_slider.get(), self.integrator.get(),
+                 self.substeps_slider.get(), self.backend.get()]]
 
     def set_body_count(self):
-        self.bodies_label_text.set("Bodies: " + str(len(self.bodies)))
+        text = "Bodies: " + str(len(self.bodies))
+        if text != self.bodies_label_text.get():
+            self.bodies_label_text.set(text)
+
+    def show_diagnostics(self, diagnostics):
+        diagnostics.potential_every = self.potential_slider.get()
+        values = diagnostics.latest
+        if not values:
+            return
+        energy = "{:.6g}".format(values["energy"]) if values["energy"] == values["energy"] else "(potential not taken)"
+        text = "Kinetic energy: {:.6g}\nTotal energy: {}\nMomentum: ({:.4g}, {:.4g})\nAngular momentum: {:.6g}".format(
+            values["kinetic_energy"], energy, values["momentum_x"], values["momentum_y"], values["angular_momentum"])
+        if text != self.diagnostics_text.get():
+            self.diagnostics_text.set(text)
 
     def center_cam(self):
         self.camera.move_to_com(self.bodies)
@@ -217,17 +309,28 @@ class Settings(Menu):
         if self.filename == "":
             self.save_as()
         else:
-            save_object = Save(self)
-            save_object.save_as(self.filename)
+            self.write(self.filename)
 
     def save_as(self):
-        save_object = Save(self)
         filename = filedialog.asksaveasfilename(defaultextension=".sim",
                                                 filetypes=(("Simulation file", "*.sim"), ("All files", "*.*")))
         if filename:
             self.filename = filename
             self.name.set(os.path.split(filename)[-1])
-            save_object.save_as(filename)
+            self.write(filename)
+
+    def write(self, filename):  # Only copying the bodies holds up the frame
+        save_object = Save(self)
+        self.writer.write(filename, save_object.settings, save_object.bodies)
+
+    def checkpoint(self, simulation):
+        """Checkpoint the simulation in the background while Autosave is on, every `autosave_every` steps."""
+        if not self.autosave_on.get():
+            self.autosave = None
+            return
+        if self.autosave is None:
+            self.autosave = Autosave(autosave_directory, autosave_every, autosave_keep, self.writer)
+        self.autosave.step(simulation, lambda: Save(self).settings)
 
     def new_file(self):
         x = create_menu("CreateSystem", self.bodies, self.camera, self.dims, self)
@@ -239,11 +342,31 @@ class Settings(Menu):
                                                           "Are you sure you want to discard changes?")):
             self.filename = filename
             self.name.set(os.path.split(filename)[-1])
-            for window in self.properties_windows:
+            for window in self.properties_windows.values():
                 window.destroy()
-            self.properties_windows = []
-            with open(filename) as file:
-                self.bodies[:] = generate_bodies(load_save(self, file))
+            self.properties_windows = {}
+            self.bodies[:] = load_save(self, filename)
+
+    def start_recording(self):
+        directory = filedialog.asksaveasfilename(defaultextension=".rec",
+                                                 filetypes=(("Recording", "*.rec"), ("All files", "*.*")))
+        if directory:
+            self.stop_recording()
+            self.recorder = Recorder(directory)
+
+    def stop_recording(self):
+        if self.recorder:
+            self.recorder.close()
+            self.recorder = None
+
+    def open_recording(self):
+        directory = filedialog.askdirectory(mustexist=True)
+        if directory:
+            self.stop_recording()
+            self.replay = Recording(directory)
+
+    def close_recording(self):
+        self.replay = None
 
     def set_bg_color(self):
         new = colorchooser.askcolor()[0]
@@ -253,9 +376,18 @@ class Settings(Menu):
     def quit(self):
         self.destroy()
 
-    def update(self):
+    def update(self, diagnostics=None):
+        if not self.due():
+            return
+        error = self.writer.failed()
+        if error:
+            messagebox.showerror("Save Failed", str(error))
         self.set_body_count()
+        if diagnostics is not None:
+            self.show_diagnostics(diagnostics)
         self.root.update()
+        if self.alive:  # The window may have been closed during `root.update`
+            self.values = self.read_values()
 
 
 class BodyProperties(Menu):
@@ -272,8 +404,9 @@ class BodyProperties(Menu):
         self.createBoolean('Velocity', 'velocity', self.root, 4, 0, 0, 1, 1)
         self.createBoolean('Acceleration', 'acceleration', self.root, 5, 0, 0, 1, 1)
 
-        self.canvas = tk.Canvas(self.root, width=104, height=134)
-        self.update_canvas()
+        self.canvas, self.arrows = tk.Canvas(self.root, width=104, height=134), None
+        self.draw_canvas()
+        self.pushed = self.slider_values()  # What the body was last given, so that only changes are pushed
 
         tk.Button(self.root, text="Focus", command=self.focus).grid(row=5, columnspan=4)
         tk.Button(self.root, text="Delete", command=self.delete_body).grid(row=6, columnspan=4)
@@ -292,30 +425,43 @@ class BodyProperties(Menu):
             self.bodies.remove(self.body)
             self.destroy()
 
-    def update_canvas(self):
-        self.canvas.delete("all")
-        ovaldims = [[3,10], 
-                    [103,113]]
-        od2 = [[ovaldims[0][0]/2, ovaldims[0][1]/2],
-               [ovaldims[1][0]/2,ovaldims[1][1]/2]]
+    ovaldims = [[3,10],
+                [103,113]]
+    od2 = [[ovaldims[0][0]/2, ovaldims[0][1]/2],
+           [ovaldims[1][0]/2,ovaldims[1][1]/2]]
+
+    def draw_canvas(self):  # The parts of the vector plot that never change
+        ovaldims = self.ovaldims
         self.canvas.create_oval((ovaldims[0][0], ovaldims[0][1], ovaldims[1][0], ovaldims[1][0]))
         for c in ((ovaldims[1][0]/2, ovaldims[0][1], ovaldims[1][0]/2, ovaldims[1][1]), (ovaldims[0][0], ovaldims[1][1]/2, ovaldims[1][0], ovaldims[1][1]/2)):
             self.canvas.create_line(c, fill="Dark Gray", dash=(2, 2))
-        for attr, color in ['velocity', 'blue'], ['acceleration', 'red']:
+        self.canvas.grid(row=3, column=1, rowspan=2, columnspan=4)
+        self.update_canvas()
+
+    def arrow_ends(self):
+        ends = []
+        for attr in 'velocity', 'acceleration':
             a = getattr(self.body, attr)
             if getattr(self, attr).get() and a != (0,0):  # If arrow is enabled and vector is not of length zero, draw the arrow using a logistic formula
-                self.canvas.create_line(
-                    ( (*od2[1]) , *((od2[1]) + 50 * (a.length()/C * C**(attr[0] != 'v')) * a.normalize())),
-                    fill=color, arrow="last")
-                
-                
-                '''
-                self.canvas.create_line(
-                    (52, 52, *((52, 52) + 40 * (1 - 2 ** -(a.length() * 1000000 ** (attr[0] != 'v'))) * a.normalize())),
-                    fill=color, arrow="last")
-                '''
-                
-        self.canvas.grid(row=3, column=1, rowspan=2, columnspan=4)
+                ends.append(tuple((self.od2[1]) + 50 * (a.length()/C * C**(attr[0] != 'v')) * a.normalize()))
+                # Was: (52, 52) + 40 * (1 - 2 ** -(a.length() * 1000000 ** (attr[0] != 'v'))) * a.normalize()
+            else:
+                ends.append(None)
+        return ends
+
+    def update_canvas(self):
+        """Redraw the velocity and acceleration arrows, if either has moved by more than `arrow_tolerance` pixels
+        (or been switched on or off) since they were last drawn."""
+        ends = self.arrow_ends()
+        if self.arrows is not None and all(
+                (new is None) == (old is None) and (new is None or max(abs(n - o) for n, o in zip(new, old)) <= arrow_tolerance)
+                for new, old in zip(ends, self.arrows)):
+            return
+        self.arrows = ends
+        self.canvas.delete("arrow")
+        for end, color in zip(ends, ('blue', 'red')):
+            if end is not None:
+                self.canvas.create_line((*self.od2[1], *end), fill=color, arrow="last", tags="arrow")
 
     def merge(self):
         self.mass_slider.set(self.body.mass0)
@@ -325,15 +471,22 @@ class BodyProperties(Menu):
         
         self.charge_slider.config(from_ = -abs(2*self.body.charge), to= abs(2*self.body.charge))
         self.charge_slider.set(self.body.charge)
+        self.pushed = self.slider_values()
         
 
+    def slider_values(self):
+        return self.mass_slider.get(), self.density_slider.get(), self.charge_slider.get()
+
     def update(self):
+        if not self.due():
+            return
         self.root.update()
-        try:
-            self.body.mass, self.body.density, self.body.charge = self.mass_slider.get(), self.density_slider.get(), self.charge_slider.get() 
-        except:
-            pass
-        self.body.update_radius()
+        if not self.alive:  # Closed during `root.update`
+            return
+        values = self.slider_values()
+        if values != self.pushed:  # Only write back into the body when a slider has moved
+            self.body.mass, self.body.density, self.body.charge = self.pushed = values
+            self.body.update_radius()
         self.update_canvas()
 
 
@@ -0,0 +1,145 @@
+"""Run one scene many times over a grid of parameters, on a pool of processes.
+
+    python -m src.ensemble --grid "star_mass=[500,500],[500,1000]" G=0.001,0.002 --repeats 4 --results binary.csv \
+        -- --preset Binary --num 100 --steps 2000
+    python -m src.ensemble --grid COR=0,0.5,1 mergePercent=0.5,0.9 --results merges.json \
+        -- --load cluster.sim --steps 1000
+
+Everything after `--` is the run as `src.headless` would take it.  Each grid parameter is either one of its options,
+named as in `--help` with dashes as underscores, or a value in `core.constants` such as mergePercent or
+decayConstant.  Every point of the grid is run `--repeats` times, each run with a seed of its own; runs are reported
+as they finish, and all of them are written in order to the results file (CSV, or JSON for a .json file).
+"""
+import argparse, ast, csv, itertools, json, os, sys, time
+from multiprocessing import get_context
+
+from . import headless
+from .core import constants, diagnostics
+
+event_counts = {"merge": "merges", "split": "splits", "escape": "escapes"}
+
+
+def parse_grid(specs):
+    """Every combination of the values in a list of "NAME=VALUE,VALUE,..." strings, as {name: value} dicts.  Values
+    are Python literals, or plain strings if they are not all literals."""
+    names, options = [], []
+    for spec in specs:
+        name, _, text = spec.partition("=")
+        if not name or not text:
+            raise ValueError("grid parameters look like NAME=VALUE,VALUE,...: {!r}".format(spec))
+        try:
+            values = ast.literal_eval("[" + text + "]")
+        except (ValueError, SyntaxError):
+            values = text.split(",")
+        names.append(name)
+        options.append(values)
+    return [dict(zip(names, values)) for values in itertools.product(*options)]
+
+
+def make_jobs(base, grid, repeats, seed):
+    """(run number, grid point, headless options, constants to set) for each run, with seeds counting up from `seed`."""
+    jobs = []
+    for point in grid:
+        for _ in range(repeats):
+            args, overrides = headless.parse_args(base), {}
+            for name, value in point.items():
+                if hasattr(args, name):
+                    current = getattr(args, name)  # Options taking several values can be given just one
+                    setattr(args, name, [value] if isinstance(current, list) and not isinstance(value, list) else value)
+                elif hasattr(constants, name):
+                    overrides[name] = value
+                else:
+                    raise ValueError("{!r} is neither a headless option nor a constant".format(name))
+            args.seed = seed + len(jobs)
+            jobs.append((len(jobs), point, args, overrides))
+    return jobs
+
+
+def run(job):
+    """Run one job to the end, and return its grid point and seed with the summary of the result."""
+    number, point, args, overrides = job
+    saved = {name: getattr(constants, name) for name in overrides}  # Workers go on to run other jobs
+    try:
+        for name, value in overrides.items():
+            setattr(constants, name, value)
+        headless.configure(args)
+        simulation, _ = headless.load_simulation(args)
+        initial, counts = diagnostics.summary(simulation), dict.fromkeys(event_counts.values(), 0)
+        start = time.perf_counter()
+        for _ in range(args.steps):
+            simulation.step()
+            for event in simulation.events:
+                counts[event_counts[event[0]]] += 1
+        result = dict(run=number, seed=args.seed, **point, **diagnostics.summary(simulation), **counts)
+        result.update(initial_energy=initial["energy"], initial_momentum=initial["momentum"],
+                      seconds=time.perf_counter() - start)
+        return result
+    finally:
+        for name, value in saved.items():
+            setattr(constants, name, value)
+
+
+def describe(result, point, total):
+    settings = ", ".join("{}={}".format(name, result[name]) for name in point)
+    return ("run {}/{} ({}, seed {}): {} bodies, {} merges, energy {:.6g} -> {:.6g}, momentum {:.6g} -> {:.6g}, "
+            "{:.1f} s").format(result["run"] + 1, total, settings, result["seed"], result["bodies"], result["merges"],
+                               result["initial_energy"], result["energy"], result["initial_momentum"],
+                               result["momentum"], result["seconds"])
+
+
+def write_results(filename, results):
+    if filename.endswith(".json"):
+        with open(filename, "w") as outfile:
+            json.dump({"runs": results}, outfile, indent=1)
+        return
+    with open(filename, "w", newline="") as outfile:
+        writer = csv.DictWriter(outfile, list(results[0]) if results else ["run"])
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def parse_args(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    split = argv.index("--") if "--" in argv else len(argv)
+    parser = argparse.ArgumentParser(prog="python -m src.ensemble", description=__doc__.split("\n")[0],
+                                     usage="%(prog)s --grid NAME=VALUES ... --results FILE [options] -- RUN")
+    parser.add_argument("--grid", nargs="+", required=True, metavar="NAME=VALUES",
+                        help="values to try for a headless option or constant, comma-separated")
+    parser.add_argument("--repeats", type=int, default=1, help="runs of each point of the grid, with different seeds")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first run; each run adds one")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="runs at once (default: all cores)")
+    parser.add_argument("--results", required=True, metavar="FILE",
+                        help="write a summary of every run to this .csv or .json file")
+    args = parser.parse_args(argv[:split])
+    args.base = argv[split + 1:]
+    if args.repeats < 1 or args.processes < 1:
+        parser.error("--repeats and --processes must be at least 1")
+    try:
+        args.grid = parse_grid(args.grid)
+        args.jobs = make_jobs(args.base, args.grid, args.repeats, args.seed)
+    except ValueError as error:
+        parser.error(str(error))
+    if not args.jobs:
+        parser.error("the grid has no points to run")
+    for _, _, job, _ in args.jobs:
+        if job.solver == "Parallel":  # Pool workers cannot start pools of their own
+            parser.error("the Parallel solver cannot run in an ensemble, whose runs are already spread over processes")
+        if job.output or job.record or job.profile or job.checkpoint or job.serve:
+            parser.error("runs in an ensemble write no files and serve no clients of their own; use --results")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results, total = [], len(args.jobs)
+    with get_context("spawn").Pool(min(args.processes, total)) as pool:
+        for result in pool.imap_unordered(run, args.jobs):
+            results.append(result)
+            print(describe(result, args.grid[0], total), flush=True)
+    results.sort(key=lambda result: result["run"])
+    write_results(args.results, results)
+    print("{} runs written to {}".format(total, args.results))
+
+
+if __name__ == "__main__":
+    main()
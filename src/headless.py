@@ -0,0 +1,232 @@
+"""Run a simulation without a display, as fast as the CPU allows.
+
+    python -m src.headless --preset Cluster --num 500 --steps 10000 --output cluster.sim
+    python -m src.headless --load cluster.sim --steps 5000 --every 1000 --output cluster_more.sim
+    python -m src.headless --preset Disk --num 50000 --steps 1000000 --checkpoint disk_run --resume
+    python -m src.headless --preset Cluster --num 2000 --steps 100000 --serve 8765 --serve-clients 1
+"""
+import argparse, os, random, time
+import numpy as np
+
+from .core.engine import Simulation
+from .core.integrators import integrators
+from .core.backends import backends
+from .core import constants, parallel
+from .core.presets import Galaxy, Gradient, System
+from .core.solvers import force_solvers
+from .display.json_saving import read_simulation
+from .display.snapshot import write_snapshot
+from .display.recording import Recorder
+from .display.autosave import Autosave, latest, resume
+from .display.telemetry import TelemetryServer
+
+presets = ("Unary", "Binary", "Cluster", "Density", "Diffusion", "Disk", "Plummer")
+
+
+def preset_bodies(args):
+    dims, num, mass_r, seed = args.size, args.num, args.mass, args.seed
+    if args.preset in ("Disk", "Plummer"):
+        galaxy = Galaxy(dims, num, mass_r, args.scale, args.density, seed=seed)
+        if args.preset == "Disk":
+            return galaxy.preset("Disk", args.star_mass[0], args.star_density)
+        return galaxy.preset("Plummer")
+    if args.preset in ("Density", "Diffusion"):
+        gradient = Gradient(dims, num, mass_r, ((255, 0, 0), (0, 0, 255)), seed=seed)
+        return gradient.preset("Density", args.densities) if args.preset == "Density" else gradient.preset("Diffusion")
+    system = System(dims, num, mass_r, args.distance, args.density, seed=seed)
+    if args.preset == "Binary":
+        return system.preset("Binary", (args.star_mass * 2)[:2], args.star_density)
+    if args.preset == "Unary":
+        return system.preset("Unary", args.star_mass[0], args.star_density, args.circular)
+    return system.preset("Cluster")
+
+
+def load_simulation(args):
+    """Build the simulation from a file or preset, with any settings given on the command line taking precedence."""
+    settings, camera = {}, {"position": [0, 0], "scale": 1}
+    if args.load:
+        s, bodies = read_simulation(args.load)
+        camera = s["camera"]
+        settings = {"G": s["G"] / 100, "time_factor": s["time factor"] / 100, "COR": s["coefficient of restitution"],
+                    "collision": s["collision"], "g_field": s["gravitational field"], "gravity": s["gravity"],
+                    "solver": s.get("force solver", "Direct"), "theta": s.get("opening angle", .5),
+                    "integrator": s.get("integrator", "Euler"), "substeps": s.get("substeps", 1)}
+        if s["walls"]:  # Saved walls are the edges of the screen the file was saved from
+            dims, position, scale = np.array(args.size), np.array(camera["position"]), camera["scale"]
+            settings["walls"] = (position + dims / 2 - dims / (2 * scale), position + dims / 2 + dims / (2 * scale))
+    else:
+        bodies = preset_bodies(args)
+    for name in Simulation.settings:
+        if getattr(args, name) is not None:
+            settings[name] = getattr(args, name)
+    if args.walls is not None:
+        settings["walls"] = (tuple(args.walls[:2]), tuple(args.walls[2:])) if args.walls else None
+    return Simulation(bodies, seed=args.seed, **settings), camera
+
+
+def saved_settings(simulation, camera):
+    """The settings of a simulation as saved files store them."""
+    walls = simulation.walls is not None
+    return {
+        "G": simulation.G * 100,
+        "time factor": simulation.time_factor * 100,
+        "coefficient of restitution": simulation.COR,
+        "collision": simulation.collision,
+        "background color": (255, 255, 255),
+        "walls": walls,
+        "gravity": simulation.gravity,
+        "gravitational field": simulation.g_field,
+        "force solver": simulation.solver,
+        "opening angle": simulation.theta,
+        "integrator": simulation.integrator,
+        "substeps": simulation.substeps,
+        "camera": camera
+    }
+
+
+def save_simulation(simulation, camera, filename):
+    write_snapshot(filename, saved_settings(simulation, camera), simulation.bodies)
+
+
+def numbered(filename, step):
+    root, extension = os.path.splitext(filename)
+    return "{}_{:06d}{}".format(root, step, extension or ".sim")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.headless", description=__doc__.split("\n")[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--load", metavar="FILE", help="start from a saved .sim file")
+    source.add_argument("--preset", choices=presets, help="start from a generated system")
+    parser.add_argument("--steps", type=int, required=True, help="number of steps to run")
+    parser.add_argument("--output", metavar="FILE", help="write the final state to this .sim file")
+    parser.add_argument("--every", type=int, metavar="K", help="also write the state every K steps, numbered")
+    parser.add_argument("--seed", type=int, help="seed for presets, charges and decay")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="write the time spent in each phase of every step to a .csv or .json file")
+    parser.add_argument("--diagnostics", metavar="FILE",
+                        help="write the energy, momentum and angular momentum after every step to a .csv or .json file")
+    parser.add_argument("--potential-every", dest="potential_every", type=int, default=0, metavar="K",
+                        help="also take the potential energy every K steps (default: never)")
+    parser.add_argument("--record", metavar="DIR", help="record every step to this recording, for replay in the viewer")
+    parser.add_argument("--checkpoint", metavar="DIR",
+                        help="write checkpoints to this directory in the background, without pausing the run")
+    parser.add_argument("--checkpoint-every", dest="checkpoint_every", type=int, default=1000, metavar="K",
+                        help="steps between checkpoints (default: %(default)s)")
+    parser.add_argument("--keep", type=int, default=3, help="checkpoints kept, newest first (default: %(default)s)")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue from the newest checkpoint in the --checkpoint directory, if there is one, "
+                             "running only the steps left of --steps")
+    parser.add_argument("--serve", metavar="ADDRESS",
+                        help="stream every step to clients connecting to this port, HOST:PORT or unix:PATH")
+    parser.add_argument("--serve-clients", dest="serve_clients", type=int, default=0, metavar="N",
+                        help="wait for N clients to connect before starting (default: %(default)s)")
+
+    physics = parser.add_argument_group("physics settings (default: from the file, or the Settings window defaults)")
+    physics.add_argument("--G", type=float)
+    physics.add_argument("--COR", type=float, help="coefficient of restitution; 0 merges colliding bodies")
+    physics.add_argument("--time-factor", dest="time_factor", type=float)
+    physics.add_argument("--collision", action=argparse.BooleanOptionalAction)
+    physics.add_argument("--gravity", action=argparse.BooleanOptionalAction, help="mutual gravitation")
+    physics.add_argument("--g-field", dest="g_field", action=argparse.BooleanOptionalAction,
+                         help="uniform gravitational field")
+    physics.add_argument("--walls", type=float, nargs="*", metavar="X",
+                         help="bounce bodies inside the box LEFT TOP RIGHT BOTTOM; no values removes the walls")
+    physics.add_argument("--solver", choices=force_solvers)
+    physics.add_argument("--theta", type=float, help="opening angle of tree solvers")
+    physics.add_argument("--integrator", choices=integrators)
+    physics.add_argument("--substeps", type=int, help="physics steps per step, each advancing time-factor / substeps")
+    physics.add_argument("--backend", choices=backends, help="implementation of the Direct solver and the integrators")
+    physics.add_argument("--newtonian-beta", dest="newtonian_beta", type=float, metavar="BETA",
+                         help="bodies slower than this fraction of c skip the relativistic terms (default: %(default)s)",
+                         default=constants.newtonian_beta)
+    physics.add_argument("--workers", type=int, help="processes used by the Parallel solver (default: all cores)")
+
+    preset = parser.add_argument_group("preset options")
+    preset.add_argument("--size", type=float, nargs=2, default=(800, 600), metavar=("WIDTH", "HEIGHT"))
+    preset.add_argument("--num", type=int, default=100)
+    preset.add_argument("--mass", type=float, nargs=2, default=(10, 15), metavar=("MIN", "MAX"))
+    preset.add_argument("--distance", type=float, nargs=2, default=(100, 300), metavar=("MIN", "MAX"))
+    preset.add_argument("--density", type=float, default=.1)
+    preset.add_argument("--scale", type=float, default=100, help="scale radius of the Disk and Plummer presets")
+    preset.add_argument("--densities", type=float, nargs=2, default=(.1, .15))
+    preset.add_argument("--star-mass", dest="star_mass", type=float, nargs="+", default=[500],
+                        help="mass of the star(s), or of the core of the Disk preset")
+    preset.add_argument("--star-density", dest="star_density", type=float, default=.4)
+    preset.add_argument("--circular", action=argparse.BooleanOptionalAction, default=True)
+    args = parser.parse_args(argv)
+    if args.walls and len(args.walls) != 4:
+        parser.error("--walls takes exactly four values")
+    if args.resume and not args.checkpoint:
+        parser.error("--resume needs --checkpoint")
+    if args.keep < 1:
+        parser.error("--keep must be at least 1")
+    if args.serve_clients and not args.serve:
+        parser.error("--serve-clients needs --serve")
+    checkpoint = latest(args.checkpoint) if args.resume else None
+    if checkpoint:
+        args.load, args.preset = checkpoint, None
+    return args
+
+
+def configure(args):
+    """Apply the options that are global to the process rather than settings of the simulation."""
+    if args.seed is not None:  # Presets and `Body` draw from the global generators
+        random.seed(args.seed)
+        np.random.seed(args.seed)
+    if args.workers:
+        parallel.workers = args.workers
+    constants.newtonian_beta = args.newtonian_beta
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure(args)
+    simulation, camera = load_simulation(args)
+    if args.resume and args.load:
+        resume(simulation, read_simulation(args.load)[0])
+        print("Resuming from {} at step {}".format(args.load, simulation.steps))
+
+    recorder = Recorder(args.record) if args.record else None
+    autosave = Autosave(args.checkpoint, args.checkpoint_every, args.keep) if args.checkpoint else None
+    server = TelemetryServer(args.serve).start() if args.serve else None
+    if server:
+        print("Streaming telemetry on {}".format(server), flush=True)
+        server.wait_for(args.serve_clients)
+    simulation.profiler.enabled = bool(args.profile)
+    simulation.diagnostics.potential_every = args.potential_every
+    start, newtonian, relativistic, first = time.perf_counter(), 0, 0, simulation.steps + 1
+    for step in range(first, args.steps + 1):
+        simulation.step()
+        newtonian, relativistic = newtonian + simulation.paths["newtonian"], relativistic + simulation.paths["relativistic"]
+        if recorder:
+            recorder.record(simulation)
+        if server:
+            server.publish(simulation)
+        simulation.profiler.end_frame(bodies=len(simulation.bodies), steps=simulation.steps, **simulation.paths,
+                                      **simulation.diagnostics.latest)
+        if args.every and args.output and not step % args.every:
+            save_simulation(simulation, camera, numbered(args.output, step))
+        if autosave:
+            autosave.step(simulation, lambda: saved_settings(simulation, camera))
+    elapsed = time.perf_counter() - start
+    if recorder:
+        recorder.close()
+    if autosave:
+        autosave.close()
+    if server:
+        server.close()
+    if args.profile:
+        simulation.profiler.export(args.profile)
+    if args.diagnostics:
+        simulation.diagnostics.export(args.diagnostics)
+    steps = max(args.steps + 1 - first, 0)
+    print("{} steps in {:.2f} s ({:.1f} steps/s), {} bodies".format(
+        steps, elapsed, steps / elapsed if elapsed else float("inf"), len(simulation.bodies)))
+    print("{:.1f} Newtonian and {:.1f} relativistic bodies per step".format(newtonian / max(steps, 1), relativistic / max(steps, 1)))
+    if args.output:
+        save_simulation(simulation, camera, args.output)
+
+
+if __name__ == "__main__":
+    main()
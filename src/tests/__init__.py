@@ -1,5 +1,31 @@
-from tests import *
+from . import tests as t
 
 
 def run_all_tests():
     t.test_body_movement()
+    t.test_body_store()
+    t.test_deferred_removal()
+    t.test_vectorized_forces()
+    t.test_momentum_conservation()
+    t.test_newtonian_threshold()
+    t.test_presets()
+    t.test_backends()
+    t.test_barnes_hut()
+    t.test_spatial_hash()
+    t.test_picking()
+    t.test_headless_engine()
+    t.test_parallel_solver()
+    t.test_integrators()
+    t.test_block_timesteps()
+    t.test_render_culling()
+    t.test_density_render()
+    t.test_snapshots()
+    t.test_recording()
+    t.test_diagnostics()
+    t.test_profiler()
+    t.test_stepper()
+    t.test_window_throttle()
+    t.test_ensemble()
+    t.test_autosave()
+    t.test_telemetry()
+    t.test_core_imports()
@@ -0,0 +1,202 @@
+"""Reproducible timings of the hot paths, written to a JSON file so that runs from different commits can be compared.
+
+    python -m src.tests.benchmarks --output before.json
+    python -m src.tests.benchmarks --output after.json --compare before.json
+"""
+import argparse, importlib.util, io, json, os, platform, random, statistics, subprocess, sys, tempfile, time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")  # Render to an offscreen surface
+import numpy as np
+import pygame as pg
+
+from ..core.Body import generate_bodies
+from ..core.body_store import BodyStore
+from ..core.engine import Simulation
+from ..core.presets import Galaxy, Gradient, System
+from ..display.json_saving import simulation_data, read_save, read_simulation
+from ..display.snapshot import write_snapshot
+
+root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+dims = (800, 600)
+seed = 2017
+
+
+def load_viewer():
+    """Import the viewer script, whose file name is not a valid module name."""
+    if "physics_viewer" not in sys.modules:
+        spec = importlib.util.spec_from_file_location("physics_viewer", os.path.join(root, "Physics 2.0.py"))
+        sys.modules["physics_viewer"] = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(sys.modules["physics_viewer"])
+    return sys.modules["physics_viewer"]
+
+
+def seeded(function):
+    def wrapper(*args):
+        random.seed(seed)
+        np.random.seed(seed)
+        return function(*args)
+    return wrapper
+
+
+@seeded
+def cluster(n):
+    return System(dims, n, (10, 15), (100, 300), .1, seed=seed).preset("Cluster")
+
+
+@seeded
+def gas(n):  # Spread out so that the density of the gas does not grow with n
+    side = (n / 100) ** .5
+    gradient = Gradient((dims[0] * side, dims[1] * side), n, (10, 15), ((255, 0, 0), (0, 0, 255)), seed=seed)
+    return gradient.preset("Diffusion")
+
+
+def preset(n, kind="Cluster"):  # Times building a scene of n bodies
+    galaxy = kind in ("Disk", "Plummer")
+    system = Galaxy(dims, n, (10, 15), 100, seed=seed) if galaxy else System(dims, n, (10, 15), (100, 300), .1, seed=seed)
+    return lambda: system.preset(kind, *((5000, .4) if kind == "Disk" else ()))
+
+
+def step(bodies, **settings):
+    simulation = Simulation(bodies, seed=seed, **settings)
+    return simulation.step
+
+
+def force_of(bodies):
+    body = bodies[0]
+    return lambda: [body.force_of(other, .001) for other in bodies[1:]]
+
+
+def apply_motion(bodies):
+    return lambda: [b.apply_motion(1) for b in bodies]
+
+
+class Setting:  # Stands in for a Tk variable of the Settings window
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+class ViewerSettings:  # The attributes of the Settings window that `refresh_display` reads
+    bg_color, walls, render_mode = (255, 255, 255), Setting(True), Setting("Bodies")
+
+
+def refresh_display(bodies, render_mode="Bodies"):
+    viewer, screen = load_viewer(), pg.display.set_mode(dims)  # With the dummy video driver this is offscreen
+    camera = viewer.Camera(pg.math.Vector2(dims))
+    simulation, settings = Simulation(bodies), ViewerSettings()
+    settings.render_mode = Setting(render_mode)
+    return lambda: viewer.refresh_display(settings, screen, simulation.bodies, camera)
+
+
+snapshot_file = os.path.join(tempfile.gettempdir(), "benchmark_snapshot.sim")
+
+
+def save(bodies):
+    simulation = Simulation(bodies)
+    return lambda: write_snapshot(snapshot_file, {}, simulation.bodies)
+
+
+def load(bodies):
+    write_snapshot(snapshot_file, {}, BodyStore(bodies))
+    return lambda: read_simulation(snapshot_file)
+
+
+def save_json(bodies):
+    simulation = Simulation(bodies)
+    return lambda: json.dump(simulation_data({}, simulation.bodies), io.StringIO())
+
+
+def load_json(bodies):
+    text = json.dumps(simulation_data({}, bodies))
+    return lambda: generate_bodies(read_save(io.StringIO(text))[1])
+
+
+def startup(module):  # Times a fresh interpreter importing `module`, as each worker process of a pool does
+    command = [sys.executable, "-c", "import " + module]
+    return lambda: subprocess.run(command, cwd=root, check=True)
+
+
+# Name, scene, benchmark factory, largest body count worth timing (the O(N^2) paths get slow)
+benchmarks = [
+    ("step: gravity only", cluster, lambda b: step(b, G=.001, collision=False), 10 ** 4),
+    ("step: gravity only, Barnes-Hut", cluster, lambda b: step(b, G=.001, collision=False, solver="Barnes-Hut"), None),
+    ("step: gravity only, parallel", cluster, lambda b: step(b, G=.001, collision=False, solver="Parallel"), 10 ** 4),
+    ("step: gravity only, Python backend", cluster, lambda b: step(b, G=.001, collision=False, backend="Python"), 10 ** 3),
+    ("step: gravity only, Numba backend", cluster, lambda b: step(b, G=.001, collision=False, backend="Numba"), 10 ** 4),
+    ("step: collisions only", gas, lambda b: step(b, gravity=False), None),
+    ("step: merge and split", cluster, lambda b: step(b, G=.001, COR=0), 10 ** 4),
+    ("Body.force_of", cluster, force_of, None),
+    ("Body.apply_motion", cluster, apply_motion, None),
+    ("refresh_display", cluster, refresh_display, None),
+    ("refresh_display: mass density", gas, lambda b: refresh_display(b, "Mass Density"), None),
+    ("preset: Cluster", int, preset, None),
+    ("preset: Disk", int, lambda n: preset(n, "Disk"), None),
+    ("startup: headless", int, lambda n: startup("src.headless"), 10),
+    ("startup: ensemble", int, lambda n: startup("src.ensemble"), 10),
+    ("save", cluster, save, None),
+    ("load", cluster, load, None),
+    ("save: JSON", cluster, save_json, None),
+    ("load: JSON", cluster, load_json, None),
+]
+
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=root, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def run(sizes, repeats, only=None):
+    results = []
+    for name, scene, factory, limit in benchmarks:
+        if only and not any(o.lower() in name.lower() for o in only):
+            continue
+        for n in sizes:
+            if limit and n > limit:
+                continue
+            # Each repeat times a fresh copy of the scene, so that merges and splits do not change what is measured
+            setups = [factory(scene(n)) for _ in range(repeats)]
+            times = [timed(f) for f in setups]
+            results.append({"name": name, "n": n, "median": statistics.median(times), "min": min(times),
+                            "repeats": repeats})
+            print("{:<36} N={:<8} {:>10.4f} s".format(name, n, results[-1]["median"]))
+    return results
+
+
+def compare(results, baseline):
+    old = {(r["name"], r["n"]): r["median"] for r in baseline["results"]}
+    for r in results:
+        if (r["name"], r["n"]) in old:
+            print("{:<36} N={:<8} {:>7.2f}x".format(r["name"], r["n"], old[r["name"], r["n"]] / r["median"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.tests.benchmarks", description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000], metavar="N")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--only", nargs="+", metavar="NAME", help="only run benchmarks whose name contains NAME")
+    parser.add_argument("--output", default="benchmark_results.json", metavar="FILE")
+    parser.add_argument("--compare", metavar="FILE", help="print speedups relative to an earlier results file")
+    args = parser.parse_args(argv)
+
+    pg.init()
+    results = run(args.sizes, args.repeats, args.only)
+    with open(args.output, "w") as outfile:
+        json.dump({"commit": commit(), "python": sys.version.split()[0], "numpy": np.__version__,
+                   "platform": platform.platform(), "seed": seed, "results": results}, outfile, indent=1)
+    if args.compare:
+        with open(args.compare) as file:
+            compare(results, json.load(file))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,24 @@
-from ..core.bodies import *
+from ..core.Body import *
+from ..core.body_store import BodyStore
+from ..core import constants, kernels, barnes_hut, parallel, reference, jit
+from ..core.backends import backends
+from ..core.spatial_hash import Grid, SpatialHash, nearest_distances
+from ..core.engine import Simulation
+from ..core.profiler import Profiler
+from ..core import profiler as profiler_module
+from ..core.stepper import Stepper, interpolate
+from ..core.presets import Galaxy, Gradient, System
+from ..core import diagnostics
+from ..display import render, tkinter_windows
+from ..display.json_saving import simulation_data, read_simulation
+from ..display.snapshot import write_snapshot
+from ..display.recording import Recorder, Recording
+from ..display.autosave import Autosave, Writer, checkpoints
+from ..display.telemetry import TelemetryServer, TelemetryClient
+from .. import ensemble, headless
+import numpy as np
+import pygame as pg
+import csv, json, os, shutil, subprocess, sys, tempfile, threading, time
 
 def test_body_movement(): # Testing body movement behavior
     print("Testing body movement...")
@@ -12,3 +32,634 @@ def test_body_movement(): # Testing body movement behavior
     test_body.apply_motion(6)
     assert test_body.position == (25, 4)
     print("Body movement - SUCCESS")
+
+
+def test_body_store(): # Testing that bodies stay consistent views onto the array store
+    print("Testing body store...")
+    bodies = BodyStore(Body(m, (m, 0), (0, m), charge=1) for m in (1, 2, 3))
+    middle = bodies.pop(1)
+    assert len(bodies) == 2 and middle not in bodies and middle.mass0 == 2
+    bodies[1].position += V2(1, 1)
+    assert bodies.live("position")[1].tolist() == [4, 1]
+    bodies.append(middle)
+    assert bodies.index(middle) == 2 and middle.velocity == (0, 2)
+    cleared = list(bodies)
+    bodies.clear()  # The bodies keep their values apart from the store, and each can join another on its own
+    assert len(bodies) == 0 and [b.mass0 for b in cleared] == [1, 3, 2] and cleared[1].position == (4, 1)
+    other = BodyStore([cleared[2]])
+    cleared[0].velocity = V2(5, 5)
+    assert other.live("velocity").tolist() == [[0, 2]] and cleared[2].mass0 == 2
+    bodies[:] = cleared
+    assert list(bodies) == cleared and cleared[2] not in other and bodies.live("velocity")[0].tolist() == [5, 5]
+    print("Body store - SUCCESS")
+
+
+def test_deferred_removal(): # Testing that queued removals match one-by-one removal, and that ids and windows follow
+    print("Testing deferred removal...")
+    bodies = BodyStore(Body(m, (m, 0), (0, m), charge=0) for m in range(1, 11))
+    expected = [b for b in bodies if b.mass0 % 3]
+    for b in bodies:
+        if not b.mass0 % 3:
+            bodies.discard(b)
+    assert len(bodies) == 10  # Nothing moves until the queue is applied
+    removed = bodies.compact()
+    assert [b.mass0 for b in removed] == [3, 6, 9] and all(b not in bodies for b in removed)
+    assert list(bodies) == expected and [bodies.index(b) for b in expected] == list(range(7))
+    assert [b.id for b in bodies] == [0, 1, 3, 4, 6, 7, 9] and removed[1].id == 5
+    assert bodies.live("position")[:, 0].tolist() == [b.mass0 for b in expected]
+    bodies.append(Body(1, (0, 0), (0, 0)))
+    assert bodies[-1].id == 10
+
+    class Window:  # Stands in for a properties window
+        def __init__(self, body):
+            self.body, self.merges, self.alive = body, 0, True
+
+        def merge(self):
+            self.merges += 1
+
+        def destroy(self):
+            self.alive = False
+    star, planet = Body(100, (0, 0), (0, 0), charge=0), Body(1, (1, 0), (0, 0), charge=0)
+    simulation = Simulation([star, planet], COR=0, G=0)
+    windows = {star.id: Window(star)}
+    simulation.step(windows=windows)  # The later body in the pair survives, taking over the window of the other
+    assert len(simulation.bodies) == 1 and list(windows) == [planet.id] and windows[planet.id].body is planet
+    assert simulation.events[0][1:] == (planet, star) and windows[planet.id].merges == 1
+    print("Deferred removal - SUCCESS")
+
+
+def test_vectorized_forces(): # Testing the vectorized kernel against `Body.force_of`
+    print("Testing vectorized forces...")
+    bodies = BodyStore(Body(m, (m * 7 % 11, m * 3 % 5), (m, -m), charge=(-1) ** m * m) for m in range(1, 6))
+    expected = [sum((b.force_of(o, G) for o in bodies if o is not b), V2(0, 0)) for b in bodies]
+    for a, e in zip(kernels.accelerations(bodies, G), expected):
+        assert V2(*a).distance_to(e) < 1e-9 * max(1, e.length())
+    print("Vectorized forces - SUCCESS")
+
+
+def test_momentum_conservation(): # Testing that unequal bodies pull on each other equally, so momentum is conserved
+    print("Testing momentum conservation...")
+    bodies = BodyStore(Body(m, (x, y), (0, 0), charge=q) for m, x, y, q in ((1, 0, 0, 3), (100, 100, 0, -5), (7, 30, 60, 2)))
+    forces = bodies.live("mass0")[:, None] * kernels.accelerations(bodies, .5)
+    assert np.abs(forces.sum(axis=0)).max() < 1e-12 * np.abs(forces).max()
+    print("Momentum conservation - SUCCESS")
+
+
+def test_newtonian_threshold(): # Testing that slow bodies skip the relativistic terms, at a cost below beta ** 2
+    print("Testing Newtonian threshold...")
+    speeds = (.5, 2, 4, 6, 100)  # Below and above the threshold of .01 C = 5
+    make = lambda: BodyStore(Body(10, (i * 7 % 11, i * 3 % 5), (s, 0), charge=i - 2) for i, s in enumerate(speeds))
+    bodies, beta = make(), constants.newtonian_beta
+    adaptive = kernels.accelerations(bodies, G)
+    constants.newtonian_beta = 0
+    try:
+        exact, scalar = kernels.accelerations(bodies, G), make()
+        for b in scalar:
+            b.acceleration = V2(0, 1)
+            b.apply_motion(1)
+        exact_positions = [tuple(b.position) for b in scalar]
+    finally:
+        constants.newtonian_beta = beta
+    fast = kernels.newtonian(bodies.live("velocity")) == False
+    assert fast.tolist() == [False, False, False, True, True]
+    assert np.array_equal(adaptive[fast], exact[fast])
+    assert (abs(adaptive - exact).max(axis=1) <= beta ** 2 * abs(exact).max(axis=1)).all()
+    vectorized, scalar = make(), make()
+    vectorized.live("acceleration")[:] = 0, 1
+    kernels.apply_motion(vectorized, 1)
+    for b, e in zip(scalar, exact_positions):
+        b.acceleration = V2(0, 1)
+        b.apply_motion(1)
+        assert b.position.distance_to(e) < beta ** 2 * 100
+    assert np.allclose(vectorized.live("position"), [tuple(b.position) for b in scalar], rtol=0, atol=1e-12)
+    assert scalar[0].mass == scalar[0].mass0 and scalar[-1].mass > scalar[-1].mass0
+    simulation = Simulation(make(), collision=False)
+    simulation.step()
+    assert simulation.paths == {"newtonian": 3, "relativistic": 2}
+    print("Newtonian threshold - SUCCESS")
+
+
+def test_presets(): # Testing that the array-built presets are seeded and follow the conventions of `Body`
+    print("Testing presets...")
+    unary = lambda seed: System((800, 600), 500, (10, 15), (100, 300), .1, seed=seed).preset("Unary", 500, .4)
+    bodies = unary(1)
+    assert np.array_equal(bodies.live("position"), unary(1).live("position"))
+    assert not np.array_equal(bodies.live("position"), unary(2).live("position"))
+    star, mass, charge = bodies[0], bodies.live("mass0")[1:], bodies.live("charge")[1:]
+    assert str(star) == "Star" and star.charge == -500 and str(bodies[1]) == "Planet 0" and bodies.live("id")[-1] == 500
+    assert ((mass >= 10) & (mass <= 15)).all() and (abs(charge) <= mass).all() and (charge == np.round(charge)).all()
+    for b in list(bodies)[:20] + [Body(12, (0, 0), (0, 0))]:  # Colored by charge, like any other body
+        assert b.color == ((0, 0, 255) if b.charge < 0 else (0, 255, 0) if b.charge == 0 else (255, 0, 0))
+    distance = np.hypot(*(bodies.live("position")[1:] - (400, 300)).T)
+    assert ((distance >= 100) & (distance <= 300)).all()
+    gas = Gradient((800, 600), 1000, (10, 15), ((255, 0, 0), (0, 0, 255)), seed=0).preset("Density", (.1, .15))
+    assert len(gas) == 1000 and gas.live("density")[:2].tolist() == [.1, .15]
+    disk = Galaxy((800, 600), 2000, (10, 15), 100, seed=0).preset("Disk", 5000, .4)
+    offset, velocity = disk.live("position")[1:] - (400, 300), disk.live("velocity")[1:]
+    assert abs((offset * velocity).sum(axis=1)).max() < 1e-9  # Circular orbits
+    assert 150 < np.median(np.hypot(*offset.T)) < 190  # Median radius of an exponential disk, 1.68 scale radii
+    plummer = Galaxy((800, 600), 2000, (10, 15), 100, seed=0).preset("Plummer")
+    assert 50 < np.median(np.hypot(*(plummer.live("position") - (400, 300)).T)) < 110
+    for galaxy in disk, plummer:  # Virialised: twice the kinetic energy balances the potential energy
+        position, mass = galaxy.live("position"), galaxy.live("mass")
+        r = np.sqrt(((position[:, None] - position[None]) ** 2).sum(axis=2))
+        pairs = np.triu(r > 0, 1)
+        potential = -constants.G * (np.outer(mass, mass)[pairs] / r[pairs]).sum()
+        virial = (mass * (galaxy.live("velocity") ** 2).sum(axis=1)).sum() / -potential
+        assert .9 < virial < 1.1 and not galaxy.live("charge").any()
+    print("Presets - SUCCESS")
+
+
+def test_backends(): # Testing that every backend computes the same forces, motion and collisions
+    print("Testing backends...")
+    rng = np.random.default_rng(3)
+    speeds = np.concatenate([rng.uniform(0, 3, 20), rng.uniform(10, 400, 10)])  # Both sides of the Newtonian threshold
+    make = lambda: BodyStore(Body(m, tuple(rng.uniform(0, 60, 2)), (s, 0), charge=c) for m, s, c in
+                             zip(rng.uniform(5, 15, 30), speeds, rng.integers(-5, 6, 30)))
+    state, results = make(), []
+    for backend in reference, kernels, jit:  # The loops of `jit` run uncompiled when numba is missing
+        bodies = BodyStore()
+        bodies[:] = [Body(b.mass0, tuple(b.position), tuple(b.velocity), charge=b.charge) for b in state]
+        targets = np.array([1, 4, 25])
+        partial = backend.accelerations(bodies, .01, targets)
+        bodies.live("acceleration")[:] = backend.accelerations(bodies, .01)
+        backend.kick(bodies, np.linspace(.5, 2, 3), targets)
+        backend.apply_motion(bodies, 1.5)
+        pairs = backend.BroadPhase().pairs(bodies.live("position"), bodies.live("radius"))
+        results.append((partial, bodies.live("position").copy(), bodies.live("velocity").copy(),
+                        bodies.live("mass").copy(), bodies.live("radius").copy(), pairs))
+    for result in results[1:]:
+        for expected, value in zip(results[0], result):
+            assert value.shape == expected.shape and np.allclose(value, expected, rtol=1e-9, atol=1e-12)
+    assert len(results[0][-1]) and set(backends) == {"Python", "NumPy", "Numba"}
+    for name in backends:  # And each runs a whole simulation, collisions included
+        simulation = Simulation(make(), seed=0, G=.01, backend=name, integrator="Block")
+        simulation.run(2)
+        assert isinstance(simulation.broad_phase, backends[name].BroadPhase)
+    print("Backends - SUCCESS")
+
+
+def test_barnes_hut(): # Testing the tree solver against the exact sum
+    print("Testing Barnes-Hut solver...")
+    # A neutral cluster with its positive and negative charges on opposite sides, seen from far away
+    cluster = [Body(1, (i % 4, i // 4 + (10 if i % 2 else 0)), (0, 0), charge=(-1) ** i * 5) for i in range(40)]
+    bodies = BodyStore(cluster + [Body(1, (1000, 500), (0, 0), charge=1)])
+    exact = kernels.accelerations(bodies, 0)
+    assert abs(barnes_hut.accelerations(bodies, 0, 0) - exact).max() < 1e-12
+    approximate = barnes_hut.accelerations(bodies, 0, .5)
+    assert V2(*approximate[-1]).distance_to(V2(*exact[-1])) < .01 * V2(*exact[-1]).length()
+    # Mixed charges: errors are small next to the typical acceleration, though not next to pulls that nearly cancel
+    rng = np.random.default_rng(1)
+    bodies = BodyStore(Body(m, tuple(p), (0, 0), charge=q) for p, m, q in
+                       zip(rng.random((3000, 2)) * 1000, rng.uniform(5, 15, 3000), rng.integers(-10, 11, 3000)))
+    exact = kernels.accelerations(bodies, .01)
+    error = np.sqrt(((barnes_hut.accelerations(bodies, .01, .5) - exact) ** 2).sum(axis=1))
+    size = np.sqrt((exact ** 2).sum(axis=1))
+    assert error.max() < .01 * size.mean() and np.median(error / size) < .01
+    print("Barnes-Hut solver - SUCCESS")
+
+
+def test_spatial_hash(): # Testing the broad phase against the all-pairs collision test
+    print("Testing spatial hash...")
+    rng, grid = np.random.default_rng(0), SpatialHash()
+    bodies = BodyStore(Body(m, tuple(rng.uniform(0, 300, 2)), (0, 0), charge=0) for m in rng.uniform(10, 15, 400))
+    bodies.append(Body(5000, (150, 150), (0, 0), charge=0))  # One much larger body
+    for _ in range(2):  # The second pass starts from the order left by the first
+        expected = kernels.colliding_pairs(bodies)
+        assert np.array_equal(grid.pairs(bodies.live("position"), bodies.live("radius")), expected)
+        bodies.live("position")[:] += rng.uniform(-3, 3, (len(bodies), 2))
+    print("Spatial hash - SUCCESS")
+
+
+def test_picking(): # Testing that lookups by point and by box find what `Body.click_collision` and a scan find
+    print("Testing picking...")
+    rng = np.random.default_rng(0)
+    bodies = BodyStore(Body(m, tuple(rng.uniform(0, 300, 2)), (0, 0), charge=0) for m in rng.uniform(10, 15, 400))
+    bodies.append(Body(5000, (150, 150), (0, 0), charge=0))  # Much larger than the cells of the grid
+    simulation = Simulation(bodies)
+    grid, position = simulation.grid(), bodies.live("position")
+    for point in rng.uniform(-20, 320, (200, 2)):
+        hits = [b for b in bodies if b.click_collision(V2(*point))]
+        nearest = min(hits, key=lambda b: b.position.distance_to(V2(*point)), default=None)
+        assert grid.at(point) == (bodies.index(nearest) if nearest else None)
+    corners = rng.uniform(-20, 320, (2, 2))
+    inside = ((position >= corners.min(axis=0)) & (position <= corners.max(axis=0))).all(axis=1)
+    assert np.array_equal(grid.within(*corners), np.flatnonzero(inside)) and inside.any()
+    assert simulation.grid() is grid
+    bodies.pop()
+    assert simulation.grid() is not grid and len(simulation.grid()) == len(bodies)  # Rebuilt once bodies change
+    print("Picking - SUCCESS")
+
+
+def test_headless_engine(): # Testing that the engine steps reproducibly without a display
+    print("Testing headless engine...")
+    runs = []
+    for _ in range(2):
+        bodies = [Body(10 + i, (40 * i % 300, 70 * i % 200), (i % 3 - 1, 1), charge=(-1) ** i * 5) for i in range(30)]
+        simulation = Simulation(bodies, seed=1, G=.001, COR=.5, walls=((0, 0), (300, 200)))
+        simulation.run(50)
+        runs.append(simulation.bodies.live("position").copy())
+    assert np.array_equal(*runs)
+    radius = simulation.bodies.live("radius")[:, None]
+    assert (runs[0] >= -radius).all() and (runs[0] <= (300, 200) + radius).all()
+    print("Headless engine - SUCCESS")
+
+
+def test_parallel_solver(): # Testing that the process pool gives the same result for any number of workers
+    print("Testing parallel solver...")
+    bodies = BodyStore(Body(m, (m * 37 % 101, m * 53 % 97), (1, -m % 3), charge=(-1) ** m * m) for m in range(1, 600))
+    results = []
+    for workers in 1, 2:
+        solver = parallel.ParallelSolver(workers)
+        results.append(solver.accelerations(bodies, G))
+        solver.close()
+    assert np.array_equal(*results)
+    assert np.allclose(results[0], kernels.accelerations(bodies, G), rtol=1e-12, atol=0)
+    print("Parallel solver - SUCCESS")
+
+
+def test_integrators(): # Testing that the higher-order integrators keep an orbit closer to circular
+    print("Testing integrators...")
+    errors = []
+    for integrator in "Euler", "Leapfrog", "Yoshida":
+        star, planet = Body(1000, (0, 0), (0, 0), charge=0), Body(1, (100, 0), (0, 1.0005), charge=0)  # Circular
+        simulation = Simulation([star, planet], G=.1, collision=False, integrator=integrator, substeps=2,
+                                time_factor=2)
+        radii = []
+        for _ in range(300):
+            simulation.step()
+            radii.append(planet.position.distance_to(star.position))
+        errors.append(max(abs(r - 100) for r in radii))
+    assert errors[0] > 10 * errors[1] and errors[1] > errors[2]
+    print("Integrators - SUCCESS")
+
+
+def test_block_timesteps(): # Testing that only the close orbiter takes small steps, at the accuracy of small steps
+    print("Testing block time steps...")
+    points = np.random.default_rng(8).random((500, 2)) * 1000
+    d2 = ((points[:, None] - points[None]) ** 2).sum(axis=2)
+    np.fill_diagonal(d2, np.inf)
+    assert np.allclose(nearest_distances(points), np.sqrt(d2.min(axis=1)))
+
+    results = []
+    for integrator, substeps in ("Block", 1), ("Leapfrog", 1), ("Leapfrog", 16):
+        bodies = [Body(1000, (0, 0), (0, 0), charge=0), Body(1, (20, 0), (0, 5 ** .5), charge=0)]
+        for k in range(30):  # A ring of distant bodies that do not need small steps
+            angle, r = 2 * np.pi * k / 30, 400 + 5 * k
+            v = (100 / r) ** .5
+            bodies.append(Body(.01, (r * np.cos(angle), r * np.sin(angle)), (-v * np.sin(angle), v * np.cos(angle)), charge=0))
+        simulation = Simulation(bodies, G=.1, collision=False, integrator=integrator, substeps=substeps, time_factor=2)
+        rows, compute_forces = [0], simulation.compute_forces
+        def counted(targets=None):
+            rows[0] += len(bodies) if targets is None else len(targets)
+            compute_forces(targets)
+        simulation.compute_forces = counted
+        simulation.run(300)
+        results.append((abs(bodies[1].position.distance_to(bodies[0].position) - 20), rows[0]))
+    (block_error, block_rows), (coarse_error, _), (_, fine_rows) = results
+    assert block_error < coarse_error / 10 and block_rows < fine_rows / 5
+    print("Block time steps - SUCCESS")
+
+
+def test_render_culling(): # Testing that off-screen bodies are culled and tiny ones still drawn
+    print("Testing render culling...")
+    class Camera:
+        position, dims, scale = V2(0, 0), V2(100, 100), 1
+    screen = pg.Surface((100, 100))
+    bodies = BodyStore([Body(.001, (10, 20), (0, 0), charge=0),  # Sub-pixel, green for no charge
+                        Body(5000, (60, 60), (0, 0), charge=-1),  # Drawn as a circle, blue for negative charge
+                        Body(5000, (500, 500), (0, 0), charge=0)])  # Off-screen
+    assert render.draw_bodies(screen, bodies, Camera) == (1, 1)
+    assert screen.get_at((10, 20))[:3] == (0, 255, 0) and screen.get_at((60, 60))[:3] == (0, 0, 255)
+    print("Render culling - SUCCESS")
+
+
+def test_density_render(): # Testing that the heatmaps bin bodies by pixel without drawing them one by one
+    print("Testing density render...")
+    class Camera:
+        position, dims, scale = V2(0, 0), V2(50, 40), 1
+    bodies = BodyStore([Body(10, (5.5, 5.5), (0, 0), charge=3), Body(20, (5.2, 5.9), (0, 0), charge=-1),
+                        Body(5, (30, 20), (0, 0), charge=-2), Body(5, (100, 20), (0, 0), charge=0)])
+    grid = render.density_map(bodies, Camera, (50, 40), bodies.live("mass"))
+    assert grid.shape == (50, 40) and grid[5, 5] == 30 and grid[30, 20] == 5 and grid.sum() == 35
+    screen = pg.Surface((50, 40))
+    screen.fill((255, 255, 255))
+    render.draw_charge_density(screen, bodies, Camera)
+    red, _, blue = screen.get_at((5, 5))[:3]
+    assert red > blue and screen.get_at((30, 20))[2] > screen.get_at((30, 20))[0]
+    assert screen.get_at((0, 0))[:3] == (255, 255, 255)
+    print("Density render - SUCCESS")
+
+
+def test_snapshots(): # Testing that binary snapshots keep all body state, and that JSON files still load
+    print("Testing snapshots...")
+    directory = tempfile.mkdtemp()
+    bodies = BodyStore(Body(10 + i, (i, 2 * i), (1, -i), charge=i - 2, name="Star" if i == 3 else None) for i in range(5))
+    bodies.live("mass")[:] *= 1.5  # Relativistic mass, which the JSON format does not keep
+    filename = os.path.join(directory, "snapshot.sim")
+    write_snapshot(filename, {"G": 2}, bodies)
+    settings, loaded = read_simulation(filename)
+    assert settings == {"G": 2} and [b.name for b in loaded] == [b.name for b in bodies]
+    for name in BodyStore.columns:
+        assert np.array_equal(loaded.live(name), bodies.live(name))
+    loaded[0].position = (100, 100)  # Loaded columns are copy-on-write maps of the file
+    loaded.append(Body(1, (0, 0), (0, 0)))
+    assert read_simulation(filename)[1][0].position == (0, 0) and len(loaded) == 6
+
+    filename = os.path.join(directory, "old.sim")
+    with open(filename, "w") as file:
+        json.dump(simulation_data({"G": 3}, bodies), file)
+    settings, loaded = read_simulation(filename)
+    assert settings == {"G": 3} and np.allclose(loaded.live("position"), bodies.live("position"))
+    shutil.rmtree(directory)
+    print("Snapshots - SUCCESS")
+
+
+def test_recording(): # Testing that a recording can be read back at any step, with its events
+    print("Testing recording...")
+    directory = tempfile.mkdtemp()
+    bodies = [Body(10, (0, 0), (1, 0), charge=0), Body(1, (1, 0), (-1, 0), charge=0), Body(1, (100, 0), (0, 0), charge=0)]
+    simulation, recorder, states = Simulation(bodies, COR=0, G=0), Recorder(directory, chunk=2), []
+    for _ in range(5):  # The first step merges the first two bodies; the small chunk makes the files grow
+        simulation.step()
+        recorder.record(simulation)
+        states.append(simulation.bodies.live("position").copy())
+    recorder.close()
+    recording = Recording(directory)
+    assert len(recording) == 5 and [len(recording[k]) for k in range(5)] == [2, 2, 2, 2, 2]
+    for k in 4, 0, 2:  # Seeking in any order
+        assert np.array_equal(recording[k]["position"], states[k])
+    assert recording.events(0)[0][:3] == ("merge", 0, -1) and recording.events(1) == []
+    assert np.array_equal(recording.store(3).live("position"), states[3])
+    assert recording.diagnostics(4)["kinetic_energy"] == simulation.diagnostics.latest["kinetic_energy"]
+    del recording
+    shutil.rmtree(directory)
+    print("Recording - SUCCESS")
+
+
+def test_diagnostics(): # Testing that conserved quantities are tracked every step, and the potential on a cadence
+    print("Testing diagnostics...")
+    # Equal, neutral masses pull on each other equally, so momentum and angular momentum are conserved
+    bodies = [Body(10, (400 + 100 * cos(a), 300 + 100 * sin(a)), (-sin(a), cos(a)), charge=0) for a in (0, 2, 4)]
+    simulation = Simulation(bodies, G=.5, collision=False, integrator="Leapfrog")
+    simulation.diagnostics.potential_every = 5
+    simulation.run(20)
+    frames = list(simulation.diagnostics.frames)
+    assert [f["step"] for f in frames] == list(range(1, 21)) and np.isnan(frames[3]["potential_energy"])
+    assert not np.isnan(frames[4]["potential_energy"]) and frames[5]["potential_energy"] == frames[4]["potential_energy"]
+    velocity, mass = simulation.bodies.live("velocity"), simulation.bodies.live("mass")
+    assert frames[-1]["kinetic_energy"] == .5 * (mass * (velocity ** 2).sum(axis=1)).sum()
+    for name in "momentum_x", "momentum_y", "angular_momentum":
+        assert max(abs(f[name] - frames[0][name]) for f in frames) < 1e-9 * max(1, abs(frames[0][name]))
+    assert frames[0]["angular_momentum"] < 0  # Clockwise on screen, where y points down
+    energies = [f["energy"] for f in frames[4::5]]
+    assert max(energies) - min(energies) < .01 * abs(energies[0])
+    # Unequal, charged masses pull on each other equally too, and energy only drifts with the integrator
+    bodies = [Body(m, (400 + 100 * cos(a), 300 + 100 * sin(a)), (-sin(a), cos(a)), charge=q)
+              for m, a, q in ((1, 0, 3), (30, 2, -4), (7, 4, 1))]
+    unequal = Simulation(bodies, G=.5, collision=False, integrator="Leapfrog")
+    unequal.diagnostics.potential_every = 1
+    unequal.run(200)
+    steps = list(unequal.diagnostics.frames)
+    for name in "momentum_x", "momentum_y", "angular_momentum":
+        assert max(abs(f[name] - steps[0][name]) for f in steps) < 1e-9 * max(1, abs(steps[0][name]))
+    energies = [f["energy"] for f in steps]
+    assert max(energies) - min(energies) < .001 * abs(energies[0])
+    pair = BodyStore([Body(2, (0, 0), (0, 0), charge=3), Body(50, (0, 4), (0, 0), charge=-1)])
+    assert diagnostics.potential_energy(pair, .5) == (-.5 * 2 * 50 - 3) / 4
+    cluster = BodyStore(Body(m, (m * 37 % 101, m * 61 % 97), (0, 0)) for m in range(1, 300))
+    exact = diagnostics.potential_energy(cluster, .01)
+    assert abs(diagnostics.potential_energy(cluster, .01, .3) - exact) < .01 * abs(exact)
+    filename = os.path.join(tempfile.mkdtemp(), "diagnostics.csv")
+    simulation.diagnostics.export(filename)
+    with open(filename) as file:
+        rows = list(csv.DictReader(file))
+    assert len(rows) == 20 and float(rows[-1]["angular_momentum"]) == frames[-1]["angular_momentum"]
+    shutil.rmtree(os.path.dirname(filename))
+    print("Diagnostics - SUCCESS")
+
+
+def test_profiler(): # Testing that phases nest, average over frames and export
+    print("Testing profiler...")
+    profiler = Profiler()
+    with profiler.phase("ignored"):  # Disabled profilers record nothing
+        pass
+    profiler.end_frame()
+    assert not profiler.frames and not profiler.phases
+    profiler.enabled = True
+    simulation = Simulation([Body(10, (i * 50, 0), (0, 0), charge=0) for i in range(10)])
+    simulation.profiler = profiler
+    for _ in range(3):
+        with profiler.phase("handle_bodies"):
+            simulation.step()
+        profiler.end_frame(bodies=len(simulation.bodies))
+    assert profiler.phases[:3] == ["handle_bodies", "handle_bodies/collisions", "handle_bodies/integration"]
+    averages, fps = profiler.averages()
+    assert "handle_bodies/integration/forces" in averages and fps > 0
+    assert averages["handle_bodies"] >= averages["handle_bodies/integration"] >= averages["handle_bodies/integration/forces"]
+    directory = tempfile.mkdtemp()
+    profiler.export(os.path.join(directory, "profile.csv"))
+    profiler.export(os.path.join(directory, "profile.json"))
+    with open(os.path.join(directory, "profile.csv")) as file:
+        rows = list(csv.DictReader(file))
+    with open(os.path.join(directory, "profile.json")) as file:
+        assert len(json.load(file)["frames"]) == len(rows) == 3 and rows[0]["bodies"] == "10"
+    shutil.rmtree(directory)
+
+    class Clock:  # Each thread's clock advances by one on every reading, so every phase takes exactly 1
+        def __init__(self):
+            self.threads = threading.local()
+
+        def perf_counter(self):
+            self.threads.now = getattr(self.threads, "now", 0) + 1
+            return self.threads.now
+    clock, profiler = Clock(), Profiler(enabled=True)
+    def work():
+        for _ in range(20000):
+            with profiler.phase("physics"):
+                pass
+    real, profiler_module.time = profiler_module.time, clock
+    try:
+        workers = [threading.Thread(target=work) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        while any(worker.is_alive() for worker in workers):
+            profiler.end_frame()  # Drawing closes frames while the physics threads add to them
+        profiler.end_frame()
+    finally:
+        profiler_module.time = real
+    assert sum(frame.get("physics", 0) for frame in profiler.frames) == 80000
+    print("Profiler - SUCCESS")
+
+
+def test_stepper(): # Testing that a physics thread steps on its own, yields between steps and interpolates
+    print("Testing stepper...")
+    simulation = Simulation([Body(10, (i * 50, 0), (1, 0), charge=0) for i in range(10)], collision=False)
+    simulation.profiler.enabled = True
+    stepper = Stepper(simulation, 1000)
+    stepper.start()
+    try:
+        while simulation.steps < 5:
+            time.sleep(.001)
+        while not stepper.acquire():
+            time.sleep(.001)
+        steps = simulation.steps
+        time.sleep(.02)
+        assert simulation.steps == steps  # Not stepping while the lock is held
+        with simulation.profiler.phase("drawing"):  # Phases on the main thread do not nest into those of the thread
+            stepper.lock.release()
+            while simulation.steps < steps + 5:
+                time.sleep(.001)
+    finally:
+        stepper.stop()
+    assert "drawing/integration" not in simulation.profiler.phases and "integration" in simulation.profiler.phases
+    previous, latest = stepper.snapshots
+    assert previous.steps == latest.steps - 1 and len(latest) == 10 and latest.steps <= simulation.steps
+    middle = stepper.frame(latest.time + .5 / stepper.rate).live("position")
+    assert np.allclose(middle, (previous.live("position") + latest.live("position")) / 2)
+    assert stepper.frame(latest.time + 1).live("position") is latest.live("position")
+    latest.columns["id"] = latest.live("id")[1:]  # Once bodies are added or removed, there is nothing to match
+    assert interpolate(previous, latest, .5) is latest
+    print("Stepper - SUCCESS")
+
+
+def test_window_throttle(): # Testing that Tk windows refresh at most `window_refresh_rate` times a second
+    print("Testing window throttle...")
+    window = tkinter_windows.Menu.__new__(tkinter_windows.Menu)  # `due` needs no Tk root
+    window.last_refresh = 0
+    assert window.due() and not window.due()
+    window.last_refresh -= 1 / tkinter_windows.window_refresh_rate
+    assert window.due()
+    print("Window throttle - SUCCESS")
+
+
+def test_ensemble(): # Testing that a parameter sweep runs every combination with its own seed, in worker processes
+    print("Testing ensemble...")
+    grid = ensemble.parse_grid(["G=0.001,0.01", "mergePercent=0.5", "star_mass=[500,800],600"])
+    assert grid[1] == {"G": .001, "mergePercent": .5, "star_mass": 600} and len(grid) == 4
+    base = ["--preset", "Binary", "--num", "20", "--steps", "5", "--COR", "0"]
+    jobs = ensemble.make_jobs(base, grid, 2, 10)
+    assert [job[2].seed for job in jobs] == list(range(10, 18))
+    assert jobs[2][2].star_mass == [600] and jobs[0][2].G == .001 and jobs[0][3] == {"mergePercent": .5}
+    for empty in ["--repeats", "0"], ["--processes", "0"]:  # Nothing to run is an error, not an empty pool
+        try:
+            ensemble.parse_args(["--grid", "G=0.001", "--results", "sweep.csv", *empty, "--", *base])
+            assert False, empty
+        except SystemExit as error:
+            assert error.code == 2
+    merge_percent = constants.mergePercent
+    first = ensemble.run(jobs[0])
+    assert first == dict(ensemble.run(jobs[0]), seconds=first["seconds"]) and constants.mergePercent == merge_percent
+    assert first["bodies"] == 22 - first["merges"] + first["splits"] - first["escapes"]
+    results = os.path.join(tempfile.mkdtemp(), "sweep.json")
+    try:
+        ensemble.main(["--grid", "G=0.001", "mergePercent=0.5,0.9", "star_mass=[500,800]", "--seed", "10",
+                       "--processes", "2", "--results", results, "--", *base])
+        with open(results) as file:
+            runs = json.load(file)["runs"]
+        assert [r["run"] for r in runs] == [0, 1] and [r["mergePercent"] for r in runs] == [.5, .9]
+        assert runs[0]["bodies"] == first["bodies"] and runs[0]["energy"] == first["energy"]  # The same seed
+    finally:
+        shutil.rmtree(os.path.dirname(results))
+    print("Ensemble - SUCCESS")
+
+
+def test_autosave(): # Testing that background saves are isolated copies, and that checkpoints rotate and resume exactly
+    print("Testing autosave...")
+    directory = tempfile.mkdtemp()
+    try:
+        writer, bodies = Writer(), BodyStore(Body(10 + i, (i, i), (0, 1)) for i in range(3))
+        filename = os.path.join(directory, "saved.sim")
+        pending = writer.write(filename, {"G": 1}, bodies)
+        bodies[0].position = (50, 50)  # After the copy, so not in the file
+        pending.result()
+        assert read_simulation(filename)[1][0].position == (0, 0) and os.listdir(directory) == ["saved.sim"]
+        writer.close()
+
+        simulation = Simulation(BodyStore(Body(10, (i, 0), (0, 0)) for i in range(4)), gravity=False)
+        autosave = Autosave(os.path.join(directory, "checkpoints"), every=2, keep=2)
+        taken = []
+        for _ in range(9):
+            simulation.step()
+            taken.append(autosave.step(simulation, {}))
+            autosave.writer.executor.submit(int).result()  # Let each write finish, so that none is deferred
+        autosave.close()
+        assert taken == [False, True, False, True, False, True, False, True, False]
+        assert [step for step, _ in checkpoints(autosave.directory)] == [6, 8]
+
+        run = ["--preset", "Binary", "--num", "20", "--COR", "0", "--seed", "3", "--checkpoint-every", "10"]
+        whole, part = os.path.join(directory, "whole.sim"), os.path.join(directory, "part")
+        headless.main(run + ["--steps", "30", "--output", whole])
+        headless.main(run + ["--steps", "20", "--checkpoint", part])
+        headless.main(run + ["--steps", "30", "--checkpoint", part, "--resume", "--output", part + ".sim"])
+        (_, expected), (_, resumed) = read_simulation(whole), read_simulation(part + ".sim")
+        for name in BodyStore.columns:
+            assert np.array_equal(resumed.live(name), expected.live(name))
+    finally:
+        shutil.rmtree(directory)
+    print("Autosave - SUCCESS")
+
+
+def test_telemetry(): # Testing that clients get the steps and regions they ask for, and a stalled one holds nothing up
+    print("Testing telemetry...")
+    simulation = Simulation(System((300, 300), 60, (10, 15), (30, 150), .1, seed=2).preset("Cluster"), seed=2, COR=0)
+    server = TelemetryServer().start()
+    every, region = TelemetryClient(server.address, every=3), TelemetryClient(str(server), every=4, region=[0, 0, 150, 300])
+    while sorted(client.every for client in server.clients) != [3, 4]:
+        time.sleep(.01)
+    events = 0
+    for _ in range(12):
+        simulation.step()
+        server.publish(simulation)
+        events += len(simulation.events)
+        if not simulation.steps % 3:
+            step, bodies, sent = every.read()
+            assert step == simulation.steps and np.array_equal(bodies["id"], simulation.bodies.live("id"))
+            assert np.array_equal(bodies["velocity"], simulation.bodies.live("velocity")) and len(sent) == events
+            events = 0
+        if not simulation.steps % 4:
+            step, bodies, _ = region.read()
+            inside = np.all((simulation.bodies.live("position") >= 0) & (simulation.bodies.live("position") <= (150, 300)), 1)
+            assert step == simulation.steps and np.array_equal(bodies["id"], simulation.bodies.live("id")[inside])
+    every.close(), region.close()
+
+    small = TelemetryServer(backlog=3).start()  # Keeps the events of three steps for a client between its frames
+    behind = TelemetryClient(small.address, every=5)
+    while [client.every for client in small.clients] != [5]:
+        time.sleep(.01)
+    simulation.steps = 0
+    for _ in range(5):
+        simulation.step()
+        simulation.events = [("escape", simulation.bodies[0])] * 2  # Two events every step
+        small.publish(simulation)
+    step, _, sent = behind.read()
+    assert len(sent) == 6 and set(sent["step"]) == {step - 2, step - 1, step} and behind.lost == 4
+    behind.close(), small.close()
+
+    simulation = Simulation([Body(1, (i, i), (1, 0)) for i in range(20000)], gravity=False, collision=False)
+    stalled = TelemetryClient(server.address)  # Never reads, so the frames back up
+    while len(server.clients) != 1:
+        time.sleep(.01)
+    start = time.perf_counter()
+    for _ in range(30):
+        simulation.step()
+        server.publish(simulation)
+    assert time.perf_counter() - start < 10
+    time.sleep(.1)
+    assert server.clients[0].dropped > 0
+    server.close(timeout=0)
+    stalled.close()
+    print("Telemetry - SUCCESS")
+
+
+def test_core_imports(): # Testing that the core and headless runs load neither pygame, Tk nor Numba
+    print("Testing core imports...")
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    script = ("import sys, src.headless, src.ensemble, src.core.presets\n"
+              "print(' '.join(m for m in ('pygame', 'tkinter', 'numba', 'numpy.matlib') if m in sys.modules))")
+    loaded = subprocess.run([sys.executable, "-c", script], cwd=root, capture_output=True, text=True, check=True)
+    assert loaded.stdout.strip() == ""
+    velocity = Body(10, (0, 0), (3, 4)).velocity
+    assert not isinstance(velocity, pg.math.Vector2) and velocity.length() == 5 and velocity * (1, 1) == 7
+    assert pg.math.Vector2(1, 1) + velocity == (4, 5) and V2(2) == (2, 2) and (velocity / 5).normalize() == (.6, .8)
+    print("Core imports - SUCCESS")